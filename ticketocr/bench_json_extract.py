@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Banc d'essai de l'extraction du JSON des réponses LLM : ancienne recherche
+exhaustive de clean_json_response (toutes les paires '{' x '}') contre
+l'extracteur linéaire ocrapp/json_extract.py, sur le corpus
+bench_data/llm_outputs.jsonl (réponses réelles de Qwen/Ollama et cas
+synthétiques : guillemets simples, virgules finales, réponse enveloppée,
+raisonnement chargé d'accolades...).
+
+Usage : python bench_json_extract.py [--repeat N]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from ocrapp.json_extract import extract_ticket_json
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_data', 'llm_outputs.jsonl')
+
+
+def legacy_clean_json_response(text):
+    """
+    Ancienne implémentation de views.clean_json_response (avant json_extract), conservée pour comparaison
+    """
+    if not text or not isinstance(text, str):
+        return None
+
+    print(f"Texte original reçu: {text[:200]}...")
+
+    text = re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL)
+    text = re.sub(r'<.*?>', '', text)
+    text = re.sub(r'\n+', '\n', text)
+    text = re.sub(r'\s+', ' ', text)
+    text = text.strip()
+
+    main_keys = ['Magasin', 'Date', 'NumeroTicket', 'Articles', 'Total']
+    start_positions = [i for i, char in enumerate(text) if char == '{']
+    end_positions = [i for i, char in enumerate(text) if char == '}']
+
+    def parse(candidate):
+        cleaned_json = candidate.strip()
+        cleaned_json = re.sub(r"'([^']*)'", r'"\1"', cleaned_json)
+        cleaned_json = re.sub(r',(\s*[}\]])', r'\1', cleaned_json)
+        return json.loads(cleaned_json)
+
+    if start_positions and end_positions:
+        outer_start = start_positions[0]
+        outer_end = end_positions[-1]
+        if outer_end > outer_start:
+            try:
+                result = parse(text[outer_start:outer_end + 1])
+                if isinstance(result, dict) and sum(1 for k in main_keys if k in result) >= 2:
+                    print("JSON externe valide trouvé")
+                    return result
+            except Exception as e:
+                print(f"Erreur parsing JSON externe: {e}")
+
+    best_json = None
+    best_score = 0
+    for start in start_positions:
+        for end in end_positions:
+            if end > start:
+                try:
+                    result = parse(text[start:end + 1])
+                    if isinstance(result, dict):
+                        score = sum(1 for k in main_keys if k in result)
+                        if score >= 2 and score > best_score:
+                            best_json = result
+                            best_score = score
+                            print(f"JSON trouvé avec score {score}")
+                except Exception as e:
+                    print(f"Erreur parsing JSON candidat: {e}")
+                    continue
+    if best_json:
+        return best_json
+
+    json_pattern = r'\{(?:[^{}]|(?:\{[^{}]*\}))*\}'
+    for json_match in reversed(re.findall(json_pattern, text, re.DOTALL)):
+        try:
+            result = parse(json_match)
+            if isinstance(result, dict) and sum(1 for k in main_keys if k in result) >= 2:
+                print("JSON trouvé via regex (dernier)")
+                return result
+        except Exception as e:
+            print(f"Erreur parsing JSON regex: {e}")
+            continue
+
+    print("Aucun JSON valide trouvé")
+    return None
+
+
+def load_corpus():
+    with open(CORPUS, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def timed(function, text, repeat):
+    # Les print de l'ancienne version font partie de son coût : ils sont exécutés mais pas affichés
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            result = function(text)
+        elapsed = time.perf_counter() - start
+    return result, elapsed / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=20, help="Répétitions par cas (nouvel extracteur)")
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    print(f"{'cas':<26} {'taille':>7} {'{':>5} {'ancien ms':>10} {'nouveau ms':>11} {'ancien':>7} {'nouveau':>8}")
+    totals = {'legacy': 0.0, 'linear': 0.0, 'legacy_ok': 0, 'linear_ok': 0}
+    for case in corpus:
+        text, expected = case['text'], case['expected']
+        legacy, legacy_ms = timed(legacy_clean_json_response, text, 1)
+        linear, linear_ms = timed(extract_ticket_json, text, args.repeat)
+        legacy_ok, linear_ok = legacy == expected, linear == expected
+        totals['legacy'] += legacy_ms
+        totals['linear'] += linear_ms
+        totals['legacy_ok'] += legacy_ok
+        totals['linear_ok'] += linear_ok
+        print(f"{case['name']:<26} {len(text):>7} {text.count('{'):>5} {legacy_ms:>10.2f} {linear_ms:>11.3f} "
+              f"{'ok' if legacy_ok else 'ÉCHEC':>7} {'ok' if linear_ok else 'ÉCHEC':>8}")
+
+    print(f"\nTotal : ancien {totals['legacy']:.1f} ms ({totals['legacy_ok']}/{len(corpus)} corrects), "
+          f"nouveau {totals['linear']:.2f} ms ({totals['linear_ok']}/{len(corpus)} corrects), "
+          f"gain x{totals['legacy'] / max(totals['linear'], 1e-9):.0f}")
+
+    # Croissance avec la taille du raisonnement (accolades hors <think>)
+    print("\nCroissance avec le nombre d'accolades du raisonnement :")
+    answer = next(case['text'] for case in corpus if case['name'] == 'plain-json')
+    for lines in (10, 20, 40, 80):
+        reasoning = ''.join(f"Ligne {i}: l'ensemble {{A{i}, B{i}}} ; " for i in range(lines))
+        text = reasoning + '\n' + answer + '\n' + reasoning
+        _, legacy_ms = timed(legacy_clean_json_response, text, 1)
+        _, linear_ms = timed(extract_ticket_json, text, args.repeat)
+        print(f"  {text.count('{'):>4} accolades : ancien {legacy_ms:>9.1f} ms, nouveau {linear_ms:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
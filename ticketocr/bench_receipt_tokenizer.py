@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark de l'extraction regex des tickets : ancienne version de
+extraire_elements_avec_regex (quatre balayages du texte, motifs recompilés à
+chaque appel) contre le découpage en jetons en un seul passage
+(ocrapp/receipt_tokenizer.py), sur les textes OCR de bench_data/ocr_texts.jsonl
+concaténés comme dans analyze_three_texts_with_regex. Les deux résultats
+doivent être identiques ; --fuzz compare aussi les deux versions sur des textes
+aléatoires faits de fragments qui se chevauchent (dates, prix, Total...).
+
+Usage : python bench_receipt_tokenizer.py [--repeat N] [--fuzz N]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import re
+import sys
+import time
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from ocrapp.receipt_tokenizer import regex_elements
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_data', 'ocr_texts.jsonl')
+# Fragments des textes aléatoires : assemblés au hasard, ils produisent des dates, prix et totaux
+# collés à d'autres nombres ('1.12/05/2024', '1.2.500 DT', '12/05/2024.500 DT')
+FUZZ_FRAGMENTS = [
+    '1', '2', '0', '12', '.', '/', '-', ' ', '\n', 'DT', ' DT', 'Total', 'TOTAL', 'total', ':', 'PAIN ',
+    '0.100 DT', '12/05/2024', '3.500', '2024', 'a', 'TotaI', 'timbre ', 'x',
+]
+
+
+def legacy_extraire_elements_avec_regex(texte):
+    """
+    Ancienne implémentation de views.extraire_elements_avec_regex, conservée pour comparaison
+    """
+    if not texte or not isinstance(texte, str):
+        return {}
+
+    dates = re.findall(r'\b([0-3]?\d)[/-]([0-1]?\d)[/-](\d{4})\b', texte)
+    dates_valides = []
+    for d, m, y in dates:
+        try:
+            date_obj = datetime.strptime(f"{d}/{m}/{y}", "%d/%m/%Y")
+            dates_valides.append(date_obj.strftime("%d/%m/%Y"))
+        except:
+            pass
+
+    prix_pattern = r'\b\d+\.\d{2,3}\s?DT\b'
+    prix_trouves = re.findall(prix_pattern, texte)
+
+    def prix_to_float(p):
+        try:
+            return float(p.replace("DT", "").strip())
+        except Exception:
+            return 0.0
+
+    timbres = [p for p in prix_trouves if p in ["0.100 DT", "0.200 DT", "0.300 DT", "0.400 DT", "0.500 DT"]]
+
+    total_match = re.search(r'(Total|TOTAL|total)\s*[:\-]?\s*(\d+\.\d{2,3})\s?DT', texte)
+    total = None
+    if total_match:
+        try:
+            total = float(total_match.group(2))
+        except Exception:
+            total = None
+
+    mots_interdits = ['espece', 'rendu', 'recu', 'total', 'remise', 'timbre', 'fiscal', 'taxe', 'stamp', 'pece']
+    articles = []
+    for ligne in texte.split('\n'):
+        prix_match = re.search(prix_pattern, ligne)
+        if prix_match:
+            prix = prix_match.group()
+            nom = ligne[:prix_match.start()].strip().lower()
+            if any(mot in nom for mot in mots_interdits):
+                continue
+            articles.append({"nom": ligne[:prix_match.start()].strip(), "prix": prix})
+
+    somme_articles = sum([prix_to_float(a["prix"]) for a in articles])
+    total_correct = (total is not None and abs(somme_articles - total) < 0.01)
+
+    resultat = {
+        "dates_valides": dates_valides,
+        "timbres_fiscaux": timbres,
+        "total": f"{total:.3f} DT" if total is not None else "",
+        "articles": articles,
+        "somme_articles": f"{somme_articles:.3f} DT",
+        "total_coherent": total_correct
+    }
+    if not total_correct:
+        total_str = f"{total:.3f}" if total is not None else "0.000"
+        print(f"Validation mismatch: somme_articles={somme_articles:.3f} DT, total={total_str} DT")
+    return resultat
+
+
+def load_texts():
+    with open(CORPUS, encoding='utf-8') as f:
+        cases = [json.loads(line) for line in f if line.strip()]
+    return [
+        "\n".join(case['ocr_results'].get(engine, "") for engine in ("docling", "tesseract", "doctr"))
+        for case in cases
+    ]
+
+
+def timed(function, text, repeat):
+    # Le print de l'ancienne version fait partie de son coût : il est exécuté mais pas affiché
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            result = function(text)
+        elapsed = time.perf_counter() - start
+    return result, elapsed / repeat * 1e6
+
+
+def fuzz(count, seed=1):
+    """
+    Textes aléatoires sur lesquels les deux versions diffèrent (au plus 5 affichés)
+    """
+    rng = random.Random(seed)
+    differences = 0
+    for _ in range(count):
+        text = ''.join(rng.choice(FUZZ_FRAGMENTS) for _ in range(rng.randint(1, 30)))
+        with contextlib.redirect_stdout(io.StringIO()):
+            legacy = legacy_extraire_elements_avec_regex(text)
+        if legacy != regex_elements(text):
+            differences += 1
+            if differences <= 5:
+                print(f"  différence : {text!r}")
+    return differences
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=2000)
+    parser.add_argument('--fuzz', type=int, default=0, help="Nombre de textes aléatoires à comparer")
+    args = parser.parse_args()
+
+    with open(CORPUS, encoding='utf-8') as f:
+        names = [json.loads(line)['name'] for line in f if line.strip()]
+
+    # Le cache de motifs de re masque en partie la recompilation : il est vidé une fois au départ
+    re.purge()
+    print(f"{'ticket':<16} {'taille':>7} {'ancien µs':>10} {'nouveau µs':>11} {'gain':>6}  identique")
+    total_legacy = total_tokens = 0.0
+    for name, text in zip(names, load_texts()):
+        legacy, legacy_us = timed(legacy_extraire_elements_avec_regex, text, args.repeat)
+        tokens, tokens_us = timed(regex_elements, text, args.repeat)
+        total_legacy += legacy_us
+        total_tokens += tokens_us
+        print(f"{name:<16} {len(text):>7} {legacy_us:>10.1f} {tokens_us:>11.1f} {legacy_us / tokens_us:>5.1f}x  "
+              f"{'oui' if legacy == tokens else 'NON'}")
+    print(f"\nTotal : ancien {total_legacy:.1f} µs, nouveau {total_tokens:.1f} µs par passage du corpus "
+          f"(x{total_legacy / total_tokens:.1f})")
+    if args.fuzz:
+        print(f"\nFuzz : {fuzz(args.fuzz)} différence(s) sur {args.fuzz} textes aléatoires")
+
+
+if __name__ == "__main__":
+    main()
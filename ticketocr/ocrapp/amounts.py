@@ -0,0 +1,132 @@
+"""
+Lecture des montants en dinars tunisiens, en Decimal, pour toute la chaîne.
+
+Les montants arrivent sous des formes variées : réponses LLM ('12.500 DT'),
+lignes OCR ('13,990', '- 4,010'), saisies du formulaire ('1 234,500', '19 %'),
+nombres JSON (3.99) ou timbres écrits en millimes ('100 DT'). parse_amount()
+les ramène tous en Decimal sans passer par float ; l'analyse d'une chaîne est
+mise en cache (lru_cache) car les mêmes montants reviennent d'un ticket et
+d'une vue à l'autre. Règles de séparateurs : si le point et la virgule sont
+présents, le dernier est le séparateur décimal ; un séparateur répété sépare
+les milliers sauf sa dernière occurrence ; un séparateur unique est décimal
+(le dinar a trois décimales : '12,500' vaut 12.500 DT).
+"""
+import re
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+
+MILLIME = Decimal('0.001')
+# Écart toléré entre une somme d'articles et un total
+CENTIME = Decimal('0.01')
+ZERO = Decimal('0.000')
+# Montants usuels du timbre fiscal
+TIMBRES_FISCAUX = frozenset(Decimal(value) for value in ('0.100', '0.200', '0.300', '0.400', '0.500'))
+_TIMBRE_NAMES = ('timbre', 'fiscal', 'taxe', 'stamp')
+
+# Premier nombre du texte : signe, chiffres, groupes de milliers séparés par une espace ou une
+# apostrophe, puis groupes séparés par un point ou une virgule
+_NUMBER = re.compile(r"(?P<sign>-)?\s*(?P<number>\d+(?:['\s\u00a0\u202f]\d{3}(?!\d))*(?:[.,]\d+)*)")
+_GROUPING = re.compile(r"['\s\u00a0\u202f]")
+_SEPARATORS = re.compile(r'[.,]')
+
+
+@lru_cache(maxsize=4096)
+def _parse_text(text):
+    match = _NUMBER.search(text)
+    if not match:
+        return None
+    number = _GROUPING.sub('', match['number'])
+    if '.' in number and ',' in number:
+        decimal_sep = '.' if number.rfind('.') > number.rfind(',') else ','
+    elif number.count('.') + number.count(',') == 0:
+        decimal_sep = None
+    else:
+        decimal_sep = '.' if '.' in number else ','
+    if decimal_sep:
+        integer, _, fraction = number.rpartition(decimal_sep)
+        number = _SEPARATORS.sub('', integer) + '.' + fraction
+    try:
+        amount = Decimal(number)
+    except InvalidOperation:
+        return None
+    return -amount if match['sign'] else amount
+
+
+def parse_amount(value, default=None):
+    """
+    Montant en Decimal ('12,500', '12.500 DT', '1 234,500', 3.99, Decimal...) ; default si illisible
+    """
+    if value is None or isinstance(value, bool):
+        return default
+    if isinstance(value, Decimal):
+        return value
+    if isinstance(value, int):
+        return Decimal(value)
+    if isinstance(value, float):
+        # repr du float ('3.99') et non sa valeur binaire exacte
+        return Decimal(repr(value))
+    amount = _parse_text(str(value).strip())
+    return default if amount is None else amount
+
+
+def parse_timbre(value, default=None):
+    """
+    Montant d'un timbre fiscal ; un entier écrit en millimes ('100 DT') est converti (0.100)
+    """
+    amount = parse_amount(value)
+    if amount is None:
+        return default
+    if amount == amount.to_integral_value() and 100 <= amount <= 1000:
+        return (amount * MILLIME).quantize(MILLIME)
+    return amount
+
+
+def format_amount(amount):
+    """
+    Montant au format des analyses : '12.500 DT'
+    """
+    return f"{amount:.3f} DT"
+
+
+def is_timbre_article(article):
+    """
+    Article désignant le timbre fiscal (par son nom)
+    """
+    nom = str(article.get('nom', '')).lower() if isinstance(article, dict) else ''
+    return any(keyword in nom for keyword in _TIMBRE_NAMES)
+
+
+def article_amounts(articles, default=ZERO):
+    """
+    Prix des articles [{nom, prix}] en Decimal, dans l'ordre (default pour un prix illisible)
+    """
+    return [
+        parse_amount(article.get('prix'), default) if isinstance(article, dict) else default
+        for article in articles or []
+    ]
+
+
+def split_timbre(articles):
+    """
+    (prix des articles hors timbre, total des timbres fiscaux) ; les prix illisibles sont ignorés
+    """
+    amounts, timbre = [], ZERO
+    for article in articles or []:
+        if not isinstance(article, dict):
+            continue
+        if is_timbre_article(article):
+            amount = parse_timbre(article.get('prix'))
+            if amount is not None:
+                timbre += amount
+        else:
+            amount = parse_amount(article.get('prix'))
+            if amount is not None:
+                amounts.append(amount)
+    return amounts, timbre
+
+
+def sum_articles(articles):
+    """
+    Somme des prix des articles, timbre compris
+    """
+    return sum(article_amounts(articles), ZERO)
@@ -0,0 +1,175 @@
+"""
+Cache clé/valeur persistant sur SQLite (bibliothèque standard).
+
+Partagé par les processus web et les workers du pool OCR : chaque processus
+ouvre sa propre connexion sur le même fichier (mode WAL). Les entrées sont
+rangées par espace de noms ('ocr', 'llm', ...), limitées en nombre avec
+éviction LRU et éventuellement en âge (ttl), et les compteurs de hits/misses
+sont persistés pour être agrégés entre processus.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS cache_entries (
+        namespace TEXT NOT NULL,
+        key TEXT NOT NULL,
+        value TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        accessed_at REAL NOT NULL,
+        PRIMARY KEY (namespace, key)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS cache_entries_lru ON cache_entries (namespace, accessed_at)",
+    """
+    CREATE TABLE IF NOT EXISTS cache_stats (
+        namespace TEXT PRIMARY KEY,
+        hits INTEGER NOT NULL DEFAULT 0,
+        misses INTEGER NOT NULL DEFAULT 0,
+        evictions INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+)
+
+
+class SqliteCache:
+    """
+    Cache LRU persistant d'un espace de noms : get/set de chaînes, max_entries entrées au plus,
+    chacune valable ttl secondes (None = sans expiration)
+    """
+
+    def __init__(self, path, namespace, max_entries=5000, ttl=None):
+        self.path = str(path)
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+
+    def _connection(self):
+        # Une connexion par thread et par processus (les workers spawn/fork n'héritent pas de la connexion)
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        for statement in _SCHEMA:
+            conn.execute(statement)
+        conn.execute('INSERT OR IGNORE INTO cache_stats (namespace) VALUES (?)', (self.namespace,))
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        """
+        Retourne la valeur en cache (ou None) et met à jour les compteurs
+        """
+        try:
+            conn = self._connection()
+            row = conn.execute(
+                'SELECT value, created_at FROM cache_entries WHERE namespace = ? AND key = ?',
+                (self.namespace, key),
+            ).fetchone()
+            now = time.time()
+            if row is not None and self.ttl and now - row[1] > self.ttl:
+                # Entrée expirée : supprimée et comptée comme un miss
+                conn.execute('DELETE FROM cache_entries WHERE namespace = ? AND key = ?', (self.namespace, key))
+                conn.execute('UPDATE cache_stats SET evictions = evictions + 1 WHERE namespace = ?', (self.namespace,))
+                row = None
+            if row is None:
+                conn.execute('UPDATE cache_stats SET misses = misses + 1 WHERE namespace = ?', (self.namespace,))
+                return None
+            conn.execute(
+                'UPDATE cache_entries SET accessed_at = ? WHERE namespace = ? AND key = ?',
+                (now, self.namespace, key),
+            )
+            conn.execute('UPDATE cache_stats SET hits = hits + 1 WHERE namespace = ?', (self.namespace,))
+            return row[0]
+        except sqlite3.Error as e:
+            # Un cache indisponible ne doit jamais faire échouer le traitement
+            logger.warning("Cache %s indisponible (lecture): %s", self.namespace, e)
+            return None
+
+    def set(self, key, value):
+        """
+        Enregistre une valeur puis évince les entrées les moins récemment utilisées au-delà de max_entries
+        """
+        try:
+            conn = self._connection()
+            now = time.time()
+            conn.execute(
+                'INSERT OR REPLACE INTO cache_entries (namespace, key, value, created_at, accessed_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (self.namespace, key, value, now, now),
+            )
+            evicted = conn.execute(
+                'DELETE FROM cache_entries WHERE namespace = ? AND key IN ('
+                '  SELECT key FROM cache_entries WHERE namespace = ? '
+                '  ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)',
+                (self.namespace, self.namespace, self.max_entries),
+            ).rowcount
+            if evicted:
+                conn.execute(
+                    'UPDATE cache_stats SET evictions = evictions + ? WHERE namespace = ?',
+                    (evicted, self.namespace),
+                )
+        except sqlite3.Error as e:
+            logger.warning("Cache %s indisponible (écriture): %s", self.namespace, e)
+
+    def delete(self, key):
+        try:
+            self._connection().execute(
+                'DELETE FROM cache_entries WHERE namespace = ? AND key = ?', (self.namespace, key)
+            )
+        except sqlite3.Error as e:
+            logger.warning("Cache %s indisponible (suppression): %s", self.namespace, e)
+
+    def clear(self):
+        try:
+            conn = self._connection()
+            conn.execute('DELETE FROM cache_entries WHERE namespace = ?', (self.namespace,))
+            conn.execute(
+                'UPDATE cache_stats SET hits = 0, misses = 0, evictions = 0 WHERE namespace = ?', (self.namespace,)
+            )
+        except sqlite3.Error as e:
+            logger.warning("Cache %s indisponible (purge): %s", self.namespace, e)
+
+    def stats(self):
+        """
+        Retourne {'entries', 'max_entries', 'ttl', 'hits', 'misses', 'evictions', 'hit_rate'}
+        """
+        try:
+            conn = self._connection()
+            entries = conn.execute(
+                'SELECT COUNT(*) FROM cache_entries WHERE namespace = ?', (self.namespace,)
+            ).fetchone()[0]
+            hits, misses, evictions = conn.execute(
+                'SELECT hits, misses, evictions FROM cache_stats WHERE namespace = ?', (self.namespace,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("Cache %s indisponible (stats): %s", self.namespace, e)
+            return {
+                'entries': 0, 'max_entries': self.max_entries, 'ttl': self.ttl,
+                'hits': 0, 'misses': 0, 'evictions': 0, 'hit_rate': 0.0,
+            }
+
+        lookups = hits + misses
+        return {
+            'entries': entries,
+            'max_entries': self.max_entries,
+            'ttl': self.ttl,
+            'hits': hits,
+            'misses': misses,
+            'evictions': evictions,
+            'hit_rate': round(hits / lookups, 3) if lookups else 0.0,
+        }
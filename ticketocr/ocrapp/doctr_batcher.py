@@ -0,0 +1,186 @@
+"""
+Inférence Doctr par lots.
+
+Les pages de plusieurs tickets en attente (ou toutes les pages d'un long PDF)
+sont regroupées et passées au prédicteur en un seul appel, dans la limite de
+DOCTR_BATCH_MAX_SIZE pages et de DOCTR_BATCH_MAX_WAIT_MS d'attente, puis
+result.pages est redécoupé par ticket. Sur CPU, c'est le principal levier de
+débit pour les imports en masse.
+
+Le regroupement se fait au sein d'un processus : la commande bulk_ocr et les
+exécuteurs OCR_EXECUTOR 'thread' ou 'serial' en profitent. Avec l'exécuteur
+'process', chaque worker de la voie doctr traite un ticket à la fois et
+DOCTR_BATCHING_ENABLED ne regroupe plus les uploads entre eux.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from django.conf import settings
+
+from .ocr_models import get_doctr_predictor
+
+logger = logging.getLogger(__name__)
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+class _BatchItem:
+    def __init__(self, pages):
+        self.pages = pages
+        self.future = Future()
+
+
+class DoctrBatcher:
+    """
+    Regroupe les demandes d'OCR Doctr et les exécute par lots dans un thread dédié
+    """
+
+    def __init__(self, max_batch_size=8, max_wait=0.05):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._pending = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, pages):
+        """
+        Ajoute les pages (tableaux numpy RGB) d'un ticket au prochain lot ; retourne un Future du texte
+        """
+        item = _BatchItem(list(pages))
+        self._ensure_started()
+        self._queue.put(item)
+        return item.future
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='doctr-batcher', daemon=True)
+                self._thread.start()
+
+    def _next_batch(self):
+        """
+        Collecte les demandes jusqu'à max_batch_size pages ou max_wait secondes
+        """
+        first = self._pending or self._queue.get()
+        self._pending = None
+        batch = [first]
+        nb_pages = len(first.pages)
+        deadline = time.monotonic() + self.max_wait
+
+        while nb_pages < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if nb_pages + len(item.pages) > self.max_batch_size:
+                # Ce ticket ouvrira le lot suivant
+                self._pending = item
+                break
+            batch.append(item)
+            nb_pages += len(item.pages)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self._process(batch)
+            except Exception as e:
+                logger.error("Erreur lot Doctr: %s", e)
+                for item in batch:
+                    if not item.future.done():
+                        item.future.set_exception(e)
+
+    def _process(self, batch):
+        from doctr.io.elements import Document
+
+        all_pages = [page for item in batch for page in item.pages]
+        start = time.perf_counter()
+        result = get_doctr_predictor()(all_pages)
+        logger.info(
+            "Doctr: lot de %d pages (%d tickets) traité en %.2fs",
+            len(all_pages), len(batch), time.perf_counter() - start,
+        )
+
+        # Redécouper result.pages par ticket, dans l'ordre de soumission
+        offset = 0
+        for item in batch:
+            ticket_pages = result.pages[offset:offset + len(item.pages)]
+            offset += len(item.pages)
+            item.future.set_result(Document(pages=ticket_pages).render())
+
+
+def get_doctr_batcher():
+    """
+    Retourne le batcher Doctr du processus (configuré par DOCTR_BATCH_MAX_SIZE / DOCTR_BATCH_MAX_WAIT_MS)
+    """
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = DoctrBatcher(
+                    max_batch_size=getattr(settings, 'DOCTR_BATCH_MAX_SIZE', 8),
+                    max_wait=getattr(settings, 'DOCTR_BATCH_MAX_WAIT_MS', 50) / 1000.0,
+                )
+    return _batcher
+
+
+def extract_texts_doctr_batch(file_paths):
+    """
+    OCR Doctr d'un ensemble de fichiers par lots ; retourne {chemin: texte ou message d'erreur}
+    """
+    import numpy as np
+
+    from .ocr_cache import get_cached_text, store_text
+    from .page_source import PageSourceError, file_sha256, load_pages
+
+    batcher = get_doctr_batcher()
+    file_paths = list(file_paths)
+    results = {}
+
+    # Les tickets déjà passés par Doctr sont servis par le cache OCR
+    hashes = {}
+    for file_path in file_paths:
+        try:
+            hashes[file_path] = file_sha256(file_path)
+        except OSError:
+            continue
+        text = get_cached_text('doctr', hashes[file_path])
+        if text is not None:
+            results[file_path] = text
+    to_process = [file_path for file_path in file_paths if file_path not in results]
+
+    # Soumettre par fenêtres d'un lot pour borner la mémoire des pages décodées
+    window = max(1, batcher.max_batch_size)
+    for index in range(0, len(to_process), window):
+        futures = {}
+        for file_path in to_process[index:index + window]:
+            try:
+                pages = load_pages(file_path, content_hash=hashes.get(file_path))
+                try:
+                    futures[file_path] = batcher.submit([np.asarray(img) for img in pages.images()])
+                finally:
+                    pages.cleanup()
+            except PageSourceError as e:
+                results[file_path] = f"Erreur Doctr: {e}"
+            except Exception as e:
+                results[file_path] = f"Erreur Doctr: impossible d'ouvrir l'image: {e}"
+
+        for file_path, future in futures.items():
+            try:
+                results[file_path] = future.result()
+                store_text('doctr', hashes.get(file_path), results[file_path])
+            except Exception as e:
+                results[file_path] = f"Erreur Doctr inattendue: {e}"
+
+    return {file_path: results[file_path] for file_path in file_paths}
@@ -1,3 +1,5 @@
+import hashlib
+
 from django import forms
 from .models import ExtractionHistory
 
@@ -5,3 +7,33 @@ class TicketUploadForm(forms.ModelForm):
     class Meta:
         model = ExtractionHistory
         fields = ['image']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.is_duplicate = False
+
+    def _hash_upload(self, upload):
+        digest = hashlib.sha256()
+        for chunk in upload.chunks():
+            digest.update(chunk)
+        upload.seek(0)
+        return digest.hexdigest()
+
+    def save(self, commit=True):
+        """
+        Enregistre l'upload, ou réutilise l'entrée existante si le même fichier a déjà été téléversé
+        """
+        upload = self.cleaned_data.get('image')
+        if upload is None or not hasattr(upload, 'chunks'):
+            return super().save(commit)
+
+        content_hash = self._hash_upload(upload)
+        existing = ExtractionHistory.objects.filter(content_hash=content_hash).order_by('-uploaded_at').first()
+        if existing is not None and existing.image and existing.image.storage.exists(existing.image.name):
+            # Doublon exact : pas de nouvelle copie dans media/tickets/ ni de nouvelle ligne
+            self.is_duplicate = True
+            self.instance = existing
+            return existing
+
+        self.instance.content_hash = content_hash
+        return super().save(commit)
@@ -0,0 +1,286 @@
+"""
+Registre de santé des backends (LLM et moteurs OCR) avec disjoncteurs.
+
+Un thread d'arrière-plan sonde périodiquement chaque backend
+(HEALTH_CHECK_INTERVAL_S) et met le résultat en cache : les vues lisent ce
+statut au lieu de refaire les vérifications à chaque requête. Chaque backend
+a un disjoncteur (CircuitBreaker) alimenté par les sondes et par les appels
+réels (llm_clients, ocr_pipeline) : après HEALTH_BREAKER_THRESHOLD échecs
+consécutifs, ou une sonde en échec, le backend est ignoré pendant
+HEALTH_BREAKER_COOLDOWN_S secondes au lieu de faire attendre un délai
+d'expiration à chaque ticket ; un appel d'essai est ensuite autorisé.
+"""
+import importlib.util
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_breakers = {}
+_status = {}
+_monitor_thread = None
+
+
+class BackendUnavailable(Exception):
+    """
+    Appel refusé : le disjoncteur du backend est ouvert
+    """
+
+
+class CircuitBreaker:
+    """
+    Disjoncteur fermé -> ouvert (après threshold échecs consécutifs) -> semi-ouvert
+    (un appel d'essai après cooldown secondes) -> fermé au premier succès
+    """
+
+    def __init__(self, name, threshold=3, cooldown=60.0):
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = None
+        self.last_error = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            # Semi-ouvert : un seul appel d'essai par période de cooldown
+            self.state = 'half_open'
+            self.opened_at = time.monotonic()
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self.state != 'closed':
+                logger.info("Backend %s rétabli, disjoncteur refermé", self.name)
+            self.state = 'closed'
+            self.failures = 0
+            self.last_error = None
+
+    def record_failure(self, error=None):
+        with self._lock:
+            self.failures += 1
+            self.last_error = str(error) if error else self.last_error
+            if self.state == 'half_open' or self.failures >= self.threshold:
+                self._open()
+
+    def trip(self, error=None):
+        with self._lock:
+            self.last_error = str(error) if error else self.last_error
+            self._open()
+
+    def _open(self):
+        if self.state != 'open':
+            logger.warning("Backend %s indisponible, disjoncteur ouvert pour %.0fs (%s)",
+                           self.name, self.cooldown, self.last_error)
+        self.state = 'open'
+        self.opened_at = time.monotonic()
+
+    def snapshot(self):
+        with self._lock:
+            retry_in = None
+            if self.state != 'closed':
+                retry_in = max(0.0, round(self.cooldown - (time.monotonic() - self.opened_at), 1))
+            return {
+                'state': self.state,
+                'failures': self.failures,
+                'last_error': self.last_error,
+                'retry_in_s': retry_in,
+            }
+
+
+def get_breaker(name):
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _lock:
+            breaker = _breakers.get(name)
+            if breaker is None:
+                breaker = CircuitBreaker(
+                    name,
+                    threshold=getattr(settings, 'HEALTH_BREAKER_THRESHOLD', 3),
+                    cooldown=getattr(settings, 'HEALTH_BREAKER_COOLDOWN_S', 60.0),
+                )
+                _breakers[name] = breaker
+    return breaker
+
+
+def backend_available(name):
+    return get_breaker(name).allow()
+
+
+def ensure_available(name):
+    """
+    Lève BackendUnavailable si le disjoncteur du backend est ouvert
+    """
+    if not backend_available(name):
+        snapshot = get_breaker(name).snapshot()
+        raise BackendUnavailable(
+            f"{name} indisponible (nouvel essai dans {snapshot['retry_in_s']}s) : {snapshot['last_error']}"
+        )
+
+
+def record_success(name):
+    get_breaker(name).record_success()
+
+
+def record_failure(name, error=None):
+    get_breaker(name).record_failure(error)
+
+
+# --- Sondes -------------------------------------------------------------------
+
+def _installed(module):
+    try:
+        return importlib.util.find_spec(module) is not None
+    except ImportError:
+        # Paquet parent absent (ex. 'google' pour google.generativeai)
+        return False
+
+
+def _probe_ollama():
+    from .llm_clients import get_llm_timeout, get_ollama_session, ollama_url
+
+    response = get_ollama_session().get(ollama_url('/api/tags'), timeout=get_llm_timeout('ollama_tags'))
+    if response.status_code != 200:
+        return 'down', f"HTTP {response.status_code}"
+    models = [model.get('name') for model in response.json().get('models', [])]
+    return 'up', f"{len(models)} modèle(s) : {', '.join(models)}"
+
+
+def _probe_huggingface():
+    if not os.environ.get('HF_TOKEN'):
+        return 'unconfigured', "HF_TOKEN manquant"
+    if not _installed('openai'):
+        return 'unconfigured', "paquet openai non installé"
+    from .llm_clients import get_hf_client, get_llm_timeout
+
+    get_hf_client().with_options(timeout=get_llm_timeout('ollama_tags')).models.list()
+    return 'up', "routeur joignable"
+
+
+def _probe_gemini():
+    # Pas d'appel réseau : la sonde ne doit pas consommer de quota
+    if not _installed('google.generativeai'):
+        return 'unconfigured', "paquet google-generativeai non installé"
+    api_key = os.environ.get('GOOGLE_API_KEY') or getattr(settings, 'GOOGLE_API_KEY', '')
+    if not api_key or api_key == 'your_google_api_key_here':
+        return 'unconfigured', "GOOGLE_API_KEY manquante"
+    return 'up', "configuré"
+
+
+def _probe_tesseract():
+    from .ocr_models import get_tesseract_status
+
+    status = get_tesseract_status()
+    if not status['backend']:
+        return 'down', status['error'] or "Tesseract non disponible"
+    return 'up', f"{status['backend']} {status['version'] or ''}".strip()
+
+
+def _probe_module(module):
+    def probe():
+        if not _installed(module):
+            return 'down', f"paquet {module} non installé"
+        return 'up', "installé"
+    return probe
+
+
+PROBES = {
+    'ollama': _probe_ollama,
+    'huggingface': _probe_huggingface,
+    'gemini': _probe_gemini,
+    'tesseract': _probe_tesseract,
+    'doctr': _probe_module('doctr'),
+    'docling': _probe_module('docling'),
+}
+
+
+def check_backend(name):
+    start = time.perf_counter()
+    try:
+        status, detail = PROBES[name]()
+    except Exception as e:
+        status, detail = 'down', str(e)
+
+    breaker = get_breaker(name)
+    if status == 'up':
+        breaker.record_success()
+    else:
+        breaker.trip(detail)
+    _status[name] = {
+        'status': status,
+        'detail': detail,
+        'latency_ms': round((time.perf_counter() - start) * 1000, 1),
+        'checked_at': time.time(),
+    }
+    return _status[name]
+
+
+def check_backends():
+    for name in PROBES:
+        check_backend(name)
+
+
+def _monitor_loop(interval):
+    while True:
+        try:
+            check_backends()
+        except Exception as e:
+            logger.warning("Vérification de santé en échec: %s", e)
+        time.sleep(interval)
+
+
+def start_health_monitor():
+    """
+    Lance les sondes périodiques en arrière-plan (une fois par processus)
+    """
+    global _monitor_thread
+    interval = getattr(settings, 'HEALTH_CHECK_INTERVAL_S', 60)
+    if not interval:
+        return None
+    with _lock:
+        if _monitor_thread is None:
+            _monitor_thread = threading.Thread(target=_monitor_loop, args=(interval,), name='health-monitor', daemon=True)
+            _monitor_thread.start()
+    return _monitor_thread
+
+
+def health_status():
+    """
+    {backend: {'status', 'detail', 'latency_ms', 'checked_at', 'breaker'}} à partir du dernier passage des sondes
+    """
+    start_health_monitor()
+    return {
+        name: dict(_status.get(name, {'status': 'unknown'}), breaker=get_breaker(name).snapshot())
+        for name in PROBES
+    }
+
+
+def system_issues():
+    """
+    Problèmes connus, sans appel bloquant (remplace les vérifications faites à chaque requête)
+    """
+    issues = []
+    for name, state in health_status().items():
+        # Un backend non configuré (clé API absente) est ignoré sans être un problème
+        if state['status'] == 'unconfigured':
+            continue
+        if state['status'] == 'down' or state['breaker']['state'] == 'open':
+            issues.append(f"{name}: {state.get('detail') or state['breaker']['last_error']}")
+
+    media_root = getattr(settings, 'MEDIA_ROOT', None)
+    if not media_root:
+        issues.append("MEDIA_ROOT not configured in settings")
+    elif not os.path.exists(media_root):
+        issues.append(f"Media directory doesn't exist: {media_root}")
+    return issues
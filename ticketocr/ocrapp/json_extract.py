@@ -0,0 +1,168 @@
+"""
+Extraction en temps linéaire du JSON du ticket dans une réponse LLM désordonnée.
+
+Un seul passage sur le texte (iter_json_candidates) relève les objets
+équilibrés de premier niveau en tenant compte des chaînes JSON et en ignorant
+les segments de réflexion (<think>...</think>), comme JsonObjectScanner pour
+le streaming. Les candidats sont classés par le nombre de clés du ticket
+qu'ils contiennent ; json.loads n'est tenté que dans cet ordre, et les
+réparations (guillemets simples, virgules finales, littéraux Python, blancs)
+ne sont appliquées qu'au candidat en cours d'examen, jusqu'au premier succès.
+Les objets imbriqués ({"ticket": {...}}, [{...}]) ne sont examinés que si aucun
+objet de premier niveau ne convient. Une chaîne peut contenir un saut de ligne
+brut (Commentaire sur deux lignes) ; si ce premier passage ne donne rien, un
+second considère qu'un saut de ligne ferme la chaîne (guillemet oublié qui
+avalerait sinon les accolades des lignes suivantes).
+"""
+import ast
+import json
+import re
+
+from .json_stream import THINK_CLOSE, THINK_OPEN
+
+TICKET_KEYS = ('Magasin', 'Date', 'NumeroTicket', 'Articles', 'Total')
+# Nombre minimal de clés du ticket pour accepter un objet
+MIN_SCORE = 2
+
+_SINGLE_QUOTED = re.compile(r"'([^']*)'")
+_TRAILING_COMMA = re.compile(r',(\s*[}\]])')
+_WHITESPACE = re.compile(r'\s+')
+_KEY_PATTERN = re.compile('|'.join(TICKET_KEYS))
+
+
+def iter_json_candidates(text, multiline_strings=True):
+    """
+    Parcourt text une seule fois ; produit (début, fin, profondeur) pour chaque objet '{...}' équilibré,
+    la profondeur valant 0 pour les objets de premier niveau. Les accolades dans les chaînes JSON et
+    dans les blocs <think> sont ignorées. Avec multiline_strings=False, un saut de ligne brut ferme
+    la chaîne en cours.
+    """
+    length = len(text)
+    pos = 0
+    stack = []          # ouvrants en cours : position pour '{', None pour '['
+    in_string = False
+    escape = False
+
+    while pos < length:
+        if not stack:
+            # Hors objet : aller directement à la prochaine accolade ou réflexion
+            brace = text.find('{', pos)
+            think = text.find(THINK_OPEN, pos, brace if brace >= 0 else length)
+            if think >= 0:
+                close = text.find(THINK_CLOSE, think)
+                if close >= 0:
+                    pos = close + len(THINK_CLOSE)
+                    continue
+                # Réflexion jamais fermée : la réponse peut s'y trouver, seule la balise est ignorée
+                pos = think + len(THINK_OPEN)
+                continue
+            if brace < 0:
+                return
+            stack.append(brace)
+            pos = brace + 1
+            continue
+
+        char = text[pos]
+        if in_string:
+            if escape:
+                escape = False
+            elif char == '\\':
+                escape = True
+            elif char == '"':
+                in_string = False
+            elif char == '\n' and not multiline_strings:
+                # Guillemet supposé manquant : la chaîne ne doit pas avaler les accolades
+                # des lignes suivantes
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == '{':
+            stack.append(pos)
+        elif char == '[':
+            stack.append(None)
+        elif char in '}]':
+            start = stack.pop()
+            if char == '}' and start is not None:
+                yield start, pos + 1, len(stack)
+        pos += 1
+
+
+def ticket_key_score(data):
+    return sum(1 for key in TICKET_KEYS if key in data) if isinstance(data, dict) else 0
+
+
+def _repairs(candidate):
+    yield candidate
+    repaired = _TRAILING_COMMA.sub(r'\1', candidate)
+    yield repaired
+    # Comportement historique de clean_json_response : blancs compactés, guillemets simples
+    repaired = _WHITESPACE.sub(' ', repaired)
+    yield repaired
+    yield _SINGLE_QUOTED.sub(r'"\1"', repaired)
+
+
+def _parse(candidate):
+    for repaired in _repairs(candidate):
+        try:
+            return json.loads(repaired)
+        except ValueError:
+            continue
+    # Dict Python (None, True, guillemets simples imbriqués)
+    try:
+        data = ast.literal_eval(_WHITESPACE.sub(' ', candidate))
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _best_nested(data):
+    """
+    Sous-objet au meilleur score dans une structure déjà parsée (réponse enveloppée)
+    """
+    best, best_score = None, 0
+    pending = [data]
+    while pending:
+        value = pending.pop()
+        if isinstance(value, dict):
+            score = ticket_key_score(value)
+            if score > best_score:
+                best, best_score = value, score
+            pending.extend(value.values())
+        elif isinstance(value, list):
+            pending.extend(value)
+    return best, best_score
+
+
+def extract_ticket_json(text, min_score=MIN_SCORE):
+    """
+    Retourne l'objet JSON du ticket contenu dans text (dict), ou None.
+    À score égal, le candidat le plus tardif l'emporte (la réponse finale suit les exemples
+    et hésitations du raisonnement).
+    """
+    if not text or not isinstance(text, str):
+        return None
+    data = _extract(text, min_score, multiline_strings=True)
+    if data is None and '\n' in text:
+        data = _extract(text, min_score, multiline_strings=False)
+    return data
+
+
+def _extract(text, min_score, multiline_strings):
+    top_level, nested = [], []
+    for start, end, depth in iter_json_candidates(text, multiline_strings):
+        # Pré-score textuel : clés du ticket présentes dans le candidat
+        score = len(set(_KEY_PATTERN.findall(text, start, end)))
+        if score >= min_score:
+            (nested if depth else top_level).append((score, start, end))
+
+    for candidates in (top_level, nested):
+        for score, start, end in sorted(candidates, key=lambda c: (c[0], c[1]), reverse=True):
+            data = _parse(text[start:end])
+            if data is None:
+                continue
+            if ticket_key_score(data) >= min_score:
+                return data
+            inner, inner_score = _best_nested(data)
+            if inner_score >= min_score:
+                return inner
+    return None
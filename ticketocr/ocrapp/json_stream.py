@@ -0,0 +1,141 @@
+"""
+Analyse incrémentale d'une sortie LLM streamée.
+
+JsonObjectScanner reçoit les fragments de texte au fil de la génération,
+ignore les segments de réflexion (<think>...</think> de Qwen) et le texte
+avant le premier '{', suit la profondeur des accolades/crochets hors des
+chaînes JSON et signale la fermeture de l'objet de premier niveau : la
+génération peut alors être interrompue, les tokens suivants (commentaires,
+explications) ne sont jamais produits.
+
+Le délai d'une requête streamée ne borne que chaque lecture : consume_stream()
+accepte donc une échéance globale (deadline, en time.monotonic()) et lève
+StreamTimeout si la génération continue au-delà.
+"""
+import time
+
+THINK_OPEN = '<think>'
+THINK_CLOSE = '</think>'
+
+
+class StreamTimeout(TimeoutError):
+    """
+    Génération streamée toujours en cours à l'échéance globale
+    """
+
+
+class JsonObjectScanner:
+    """
+    feed(fragment) retourne True dès que l'objet JSON de premier niveau est complet ;
+    json_text contient alors l'objet (sans la réflexion ni le texte qui l'entoure)
+    """
+
+    def __init__(self):
+        self._text = ''
+        self._pos = 0
+        self._in_think = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self.start = None
+        self.end = None
+
+    @property
+    def complete(self):
+        return self.end is not None
+
+    @property
+    def text(self):
+        """
+        Texte brut reçu jusqu'ici (y compris la réflexion)
+        """
+        return self._text
+
+    @property
+    def json_text(self):
+        if self.start is None:
+            return None
+        return self._text[self.start:self.end]
+
+    def feed(self, fragment):
+        if self.complete:
+            return True
+        if fragment:
+            self._text += fragment
+        self._scan()
+        return self.complete
+
+    def _scan(self):
+        text = self._text
+        length = len(text)
+        pos = self._pos
+
+        while pos < length:
+            if self.start is None:
+                if self._in_think:
+                    idx = text.find(THINK_CLOSE, pos)
+                    if idx < 0:
+                        # La balise fermante peut être coupée entre deux fragments
+                        pos = max(pos, length - len(THINK_CLOSE) + 1)
+                        break
+                    pos = idx + len(THINK_CLOSE)
+                    self._in_think = False
+                    continue
+
+                brace = text.find('{', pos)
+                think = text.find(THINK_OPEN, pos)
+                if think >= 0 and (brace < 0 or think < brace):
+                    self._in_think = True
+                    pos = think + len(THINK_OPEN)
+                    continue
+                if brace < 0:
+                    # Garder de quoi reconnaître un '<think>' coupé en fin de fragment
+                    lt = text.rfind('<', max(pos, length - len(THINK_OPEN) + 1))
+                    pos = lt if lt >= 0 and THINK_OPEN.startswith(text[lt:]) else length
+                    break
+                self.start = brace
+                self._depth = 1
+                pos = brace + 1
+                continue
+
+            char = text[pos]
+            pos += 1
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    self.end = pos
+                    break
+
+        self._pos = pos
+
+
+def consume_stream(fragments, stop_at_json=True, deadline=None):
+    """
+    Concatène les fragments d'une génération streamée.
+    Avec stop_at_json, s'arrête dès que l'objet JSON de premier niveau est fermé et
+    retourne cet objet ; sinon (ou si l'objet n'est jamais fermé) retourne tout le texte.
+    Lève StreamTimeout si un fragment arrive après deadline (time.monotonic()).
+    Retourne (texte, arrêt_anticipé).
+    """
+    scanner = JsonObjectScanner() if stop_at_json else None
+    parts = []
+    for fragment in fragments:
+        if scanner is not None:
+            if scanner.feed(fragment):
+                return scanner.json_text, True
+        else:
+            parts.append(fragment)
+        if deadline is not None and time.monotonic() > deadline:
+            raise StreamTimeout("génération interrompue : délai global dépassé")
+    return (scanner.text if scanner is not None else ''.join(parts)), False
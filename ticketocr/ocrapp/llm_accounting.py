@@ -0,0 +1,132 @@
+"""
+Comptabilité des appels LLM : coût (tokens) et latence de chaque invocation.
+
+Les clients (llm_clients.py) enveloppent chaque appel dans track_llm_call(),
+qui mesure la durée et relève les tokens rapportés par le backend (ou les
+estime si la réponse a été interrompue avant le décompte final). Les appels
+d'une analyse sont collectés par collect_llm_calls(analyse) (ContextVar,
+propagée aux threads du mode couvert) puis enregistrés par save_llm_calls()
+en LLMCallRecord liés à l'ExtractionHistory ; la vue llm_usage_report les
+agrège par backend et par modèle.
+"""
+import contextlib
+import contextvars
+import logging
+import time
+
+from .ocr_consensus import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+_collector = contextvars.ContextVar('llm_call_collector', default=None)
+
+
+class _Collector:
+    def __init__(self, analysis):
+        self.analysis = analysis
+        self.calls = []
+        self.path = []
+
+
+@contextlib.contextmanager
+def collect_llm_calls(analysis):
+    """
+    Collecte les appels LLM du bloc ; la liste produite contient un dict par appel
+    """
+    collector = _Collector(analysis)
+    token = _collector.set(collector)
+    try:
+        yield collector.calls
+    finally:
+        _collector.reset(token)
+
+
+@contextlib.contextmanager
+def track_llm_call(backend, model, prompt=''):
+    """
+    Mesure un appel ; l'appelant complète le dict produit (prompt_tokens, completion_tokens, text, retries)
+    """
+    call = {'retries': 0}
+    start = time.perf_counter()
+    outcome, error = 'success', ''
+    try:
+        yield call
+    except Exception as e:
+        from .health import BackendUnavailable
+        from .llm_clients import LLMCancelled
+
+        if isinstance(e, LLMCancelled):
+            outcome = 'cancelled'
+        elif isinstance(e, BackendUnavailable):
+            outcome = 'unavailable'
+        else:
+            outcome = 'error'
+        error = str(e)
+        raise
+    finally:
+        prompt_tokens = call.get('prompt_tokens')
+        completion_tokens = call.get('completion_tokens')
+        record_llm_call(
+            backend=backend,
+            model=model,
+            prompt_tokens=prompt_tokens if prompt_tokens is not None else estimate_tokens(prompt),
+            completion_tokens=completion_tokens if completion_tokens is not None else estimate_tokens(call.get('text', '')),
+            tokens_estimated=prompt_tokens is None or completion_tokens is None,
+            duration_ms=round((time.perf_counter() - start) * 1000, 1),
+            retries=call['retries'],
+            outcome=outcome,
+            error=error[:500],
+        )
+
+
+def record_llm_call(**fields):
+    """
+    Ajoute un appel au collecteur courant (s'il y en a un) avec le chemin de repli suivi jusque-là
+    """
+    collector = _collector.get()
+    logger.info(
+        "Appel LLM %s/%s: %s en %sms (%s+%s tokens)",
+        fields.get('backend'), fields.get('model'), fields.get('outcome'),
+        fields.get('duration_ms'), fields.get('prompt_tokens'), fields.get('completion_tokens'),
+    )
+    if collector is None:
+        return
+    collector.path.append(fields.get('model') or fields.get('backend'))
+    fields.setdefault('analysis', collector.analysis)
+    fields['fallback_path'] = list(collector.path)
+    collector.calls.append(fields)
+
+
+def save_llm_calls(extraction, calls, result=None):
+    """
+    Enregistre les appels collectés pour une extraction ; result (l'analyse finale) indique le backend retenu
+    """
+    from .models import LLMCallRecord
+
+    if not calls:
+        return []
+    backend_used = result.get('backend_used', '') if isinstance(result, dict) else ''
+    records = [
+        LLMCallRecord(
+            extraction=extraction,
+            analysis=call.get('analysis', ''),
+            backend=call.get('backend', ''),
+            model=call.get('model', ''),
+            prompt_tokens=call.get('prompt_tokens') or 0,
+            completion_tokens=call.get('completion_tokens') or 0,
+            tokens_estimated=call.get('tokens_estimated', False),
+            duration_ms=call.get('duration_ms') or 0,
+            retries=call.get('retries', 0),
+            outcome=call.get('outcome', ''),
+            error=call.get('error', ''),
+            fallback_path=call.get('fallback_path', []),
+            backend_used=backend_used,
+        )
+        for call in calls
+    ]
+    try:
+        return LLMCallRecord.objects.bulk_create(records)
+    except Exception as e:
+        # La comptabilité ne doit jamais faire échouer une analyse
+        logger.warning("Enregistrement des appels LLM impossible: %s", e)
+        return []
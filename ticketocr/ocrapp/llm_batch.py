@@ -0,0 +1,226 @@
+"""
+Analyse LLM groupée de plusieurs tickets (imports en masse).
+
+Au lieu d'un aller-retour LLM par ticket, chacun répétant le même bloc
+d'instructions (timbre fiscal, format des montants...), les textes OCR de
+plusieurs tickets sont placés dans un seul prompt, délimités par
+=== TICKET Tn === / === FIN TICKET Tn ===, dans la limite d'un budget de
+tokens (LLM_BATCH_TOKEN_BUDGET) et de LLM_BATCH_MAX_TICKETS tickets. Le
+modèle renvoie {"tickets": [...]} ; chaque sous-résultat est validé contre le
+schéma du ticket et seuls les tickets invalides ou absents sont réanalysés
+individuellement (analyze_one). Avec Ollama, le contexte (num_ctx) est
+dimensionné pour chaque lot : le contexte par défaut (2048 à 4096 tokens)
+tronquerait le début du prompt, c'est-à-dire les instructions.
+"""
+import json
+import logging
+import math
+import time
+
+from django.conf import settings
+
+from .json_stream import JsonObjectScanner
+from .llm_cache import get_cached_completion, store_completion
+from .llm_clients import get_llm_timeout, hf_chat, ollama_generate
+from .ocr_consensus import build_consensus, estimate_tokens
+from .ticket_schema import (
+    BATCH_JSON_SCHEMA, TICKET_FIELDS, ollama_schema_options, openai_schema_options, validate_ticket,
+)
+
+logger = logging.getLogger(__name__)
+
+QWEN_MODEL = "Qwen/Qwen3-30B-A3B:novita"
+# estimate_tokens (≈ 4 caractères par token) sous-estime les textes OCR : marge sur le contexte Ollama
+CONTEXT_MARGIN = 1.5
+MIN_CONTEXT = 2048
+
+BATCH_INSTRUCTIONS = """Tu es un assistant expert en analyse de tickets de caisse.
+
+Voici {count} tickets de caisse DIFFÉRENTS. Chaque ticket est délimité par === TICKET <id> === et === FIN TICKET <id> ===.
+
+Pour CHAQUE ticket, extrais les éléments suivants et retourne UNIQUEMENT un objet JSON valide de la forme :
+
+{{"tickets": [
+  {{
+    "id": "<id du ticket>",
+    "Magasin": "Nom du magasin",
+    "NumeroTicket": "Numéro du ticket",
+    "Date": "JJ/MM/AAAA HH:MM",
+    "Articles": [
+      {{ "nom": "Nom article", "prix": "Prix en DT" }},
+      {{ "nom": "TIMBRE FISCAL", "prix": "0.100 DT" }}
+    ],
+    "Total": "Montant total en DT"
+  }}
+]}}
+
+RÈGLES IMPORTANTES :
+1. Le timbre fiscal (0.100 DT, 0.200 DT, etc.) doit être inclus dans Articles avec nom "TIMBRE FISCAL"
+2. Si tu vois "100 DT", convertis-le en "0.100 DT" pour les timbres fiscaux
+3. Un objet par ticket, dans l'ordre des tickets, avec son id ; ne mélange jamais les articles de deux tickets
+4. Retourne UNIQUEMENT le JSON, sans commentaires ni texte supplémentaire
+
+"""
+
+
+def _backend():
+    return getattr(settings, 'LLM_BATCH_BACKEND', 'mistral')
+
+
+def ticket_ocr_text(ocr_results):
+    """
+    Texte OCR d'un ticket dans le prompt groupé : le texte consolidé des moteurs (ocr_consensus.py)
+    """
+    text, _ = build_consensus(ocr_results)
+    return text
+
+
+def _ticket_block(label, ocr_results):
+    return f"=== TICKET {label} ===\n{ticket_ocr_text(ocr_results)}\n=== FIN TICKET {label} ===\n"
+
+
+def pack_batches(tickets, token_budget=None, max_tickets=None, output_tokens=None):
+    """
+    Répartit [(clé, ocr_results)] en lots dont l'estimation (instructions + textes + réponse attendue)
+    tient dans token_budget. Un ticket qui dépasse seul le budget forme son propre lot.
+    """
+    token_budget = token_budget or getattr(settings, 'LLM_BATCH_TOKEN_BUDGET', 6000)
+    max_tickets = max_tickets or getattr(settings, 'LLM_BATCH_MAX_TICKETS', 10)
+    output_tokens = output_tokens or getattr(settings, 'LLM_BATCH_OUTPUT_TOKENS', 250)
+    base = estimate_tokens(BATCH_INSTRUCTIONS)
+
+    batches = []
+    current, used = [], base
+    for key, ocr_results in tickets:
+        cost = estimate_tokens(_ticket_block(f"T{max_tickets}", ocr_results)) + output_tokens
+        if current and (used + cost > token_budget or len(current) >= max_tickets):
+            batches.append(current)
+            current, used = [], base
+        current.append((key, ocr_results))
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def build_batch_prompt(batch):
+    """
+    Retourne (prompt, {id du ticket dans le prompt: clé})
+    """
+    labels = {}
+    blocks = []
+    for index, (key, ocr_results) in enumerate(batch, start=1):
+        label = f"T{index}"
+        labels[label] = key
+        blocks.append(_ticket_block(label, ocr_results))
+    return BATCH_INSTRUCTIONS.format(count=len(batch)) + '\n'.join(blocks), labels
+
+
+def context_tokens(prompt, size, output_tokens=None):
+    """
+    Contexte Ollama (num_ctx) d'un lot : prompt et réponses attendues, avec marge, arrondi au millier
+    de tokens (1024) supérieur
+    """
+    output_tokens = output_tokens or getattr(settings, 'LLM_BATCH_OUTPUT_TOKENS', 250)
+    needed = (estimate_tokens(prompt) + output_tokens * size) * CONTEXT_MARGIN
+    return max(MIN_CONTEXT, math.ceil(needed / 1024) * 1024)
+
+
+def _generate(prompt, size):
+    backend = _backend()
+    timeout = get_llm_timeout(backend) * size
+    if backend == 'qwen':
+        return hf_chat(QWEN_MODEL, prompt, timeout=timeout, temperature=0,
+                       **openai_schema_options(BATCH_JSON_SCHEMA, name='tickets'))
+    return ollama_generate(backend, prompt, timeout=timeout, options={'num_ctx': context_tokens(prompt, size)},
+                           **ollama_schema_options(BATCH_JSON_SCHEMA))
+
+
+def parse_batch_response(text):
+    """
+    Retourne {id: sous-objet} à partir de la réponse ({"tickets": [...]}, éventuellement entourée de texte)
+    """
+    if not text:
+        return {}
+    try:
+        data = json.loads(text)
+    except ValueError:
+        scanner = JsonObjectScanner()
+        scanner.feed(text)
+        try:
+            data = json.loads(scanner.json_text) if scanner.complete else None
+        except ValueError:
+            data = None
+    if isinstance(data, list):
+        data = {'tickets': data}
+    if not isinstance(data, dict) or not isinstance(data.get('tickets'), list):
+        return {}
+    return {
+        str(item.get('id')): item
+        for item in data['tickets']
+        if isinstance(item, dict) and item.get('id') is not None
+    }
+
+
+def _cache_model_id():
+    return f"batch/{_backend()}"
+
+
+def _to_result(ticket, finalize, ocr_results):
+    result = {field: ticket.get(field, [] if field == 'Articles' else "") for field in TICKET_FIELDS}
+    result.update({
+        "Commentaire": f"Données extraites par analyse groupée ({_backend()})",
+        "texte_fusionne": json.dumps(ticket, ensure_ascii=False),
+        "backend_used": f"{_backend()}-batch",
+    })
+    return finalize(result, ocr_results) if finalize else result
+
+
+def analyze_tickets_batch(tickets, analyze_one, finalize=None, validate=None):
+    """
+    tickets : {clé: ocr_results}. Retourne {clé: résultat d'analyse}.
+    analyze_one(ocr_results) analyse un ticket seul (tickets absents ou invalides dans la réponse groupée) ;
+    finalize(résultat, ocr_results) applique le post-traitement habituel ; validate(résultat) filtre
+    les sous-résultats inexploitables avant finalize.
+    """
+    results = {}
+    pending = []
+    for key, ocr_results in tickets.items():
+        cached = get_cached_completion(_cache_model_id(), ocr_results)
+        if cached is not None:
+            results[key] = _to_result(json.loads(cached), finalize, ocr_results)
+        else:
+            pending.append((key, ocr_results))
+
+    retry = []
+    for batch in pack_batches(pending):
+        start = time.perf_counter()
+        prompt, labels = build_batch_prompt(batch)
+        try:
+            parsed = parse_batch_response(_generate(prompt, len(batch)))
+        except Exception as e:
+            logger.warning("Analyse groupée de %d ticket(s) en échec: %s", len(batch), e)
+            parsed = {}
+
+        ocr_by_key = dict(batch)
+        for label, key in labels.items():
+            ticket = parsed.get(label)
+            if ticket is not None:
+                ticket = {field: ticket[field] for field in TICKET_FIELDS if field in ticket}
+            if not validate_ticket(ticket) or (validate and not validate(ticket)):
+                retry.append(key)
+                continue
+            store_completion(_cache_model_id(), ocr_by_key[key], json.dumps(ticket, ensure_ascii=False))
+            results[key] = _to_result(ticket, finalize, ocr_by_key[key])
+
+        logger.info(
+            "Analyse groupée: %d/%d ticket(s) valides en %.1fs (~%d tokens de prompt)",
+            len(batch) - sum(1 for key in labels.values() if key in retry), len(batch),
+            time.perf_counter() - start, estimate_tokens(prompt),
+        )
+
+    # Réanalyse individuelle des seuls tickets manquants ou invalides
+    for key in retry:
+        results[key] = analyze_one(tickets[key])
+
+    return {key: results[key] for key in tickets}
@@ -0,0 +1,115 @@
+"""
+Cache persistant des complétions LLM.
+
+Clé = hash des textes OCR normalisés + identifiant du modèle + version du
+prompt (PROMPT_VERSION) + réglages qui modifient le prompt ou la requête
+(LLM_PROMPT_OCR_MODE, LLM_STRUCTURED_OUTPUT). Une nouvelle analyse du même ticket (re-soumission
+via les champs ocr_doctr/ocr_tesseract/ocr_docling, doublon d'upload...)
+réutilise la réponse brute du modèle ; le post-traitement (timbre fiscal,
+validation regex) est rejoué normalement.
+
+Le cache se désactive globalement (LLM_CACHE_ENABLED) ou pour une requête
+(bloc ``with llm_cache_bypass():``).
+"""
+import contextlib
+import contextvars
+import hashlib
+import json
+import logging
+import re
+import unicodedata
+
+from django.conf import settings
+
+from .cache_store import SqliteCache
+from .llm_accounting import record_llm_call
+from .ticket_schema import structured_output_enabled
+
+logger = logging.getLogger(__name__)
+
+# À incrémenter à chaque modification des prompts d'analyse (views.py) : invalide les réponses en cache
+PROMPT_VERSION = 2
+
+_cache = None
+_bypass = contextvars.ContextVar('llm_cache_bypass', default=False)
+
+
+def get_llm_cache():
+    """
+    Retourne le cache LLM du processus, ou None s'il est désactivé (LLM_CACHE_ENABLED)
+    """
+    global _cache
+    if not getattr(settings, 'LLM_CACHE_ENABLED', True):
+        return None
+    if _cache is None:
+        path = getattr(settings, 'LLM_CACHE_PATH', None) or settings.BASE_DIR / 'llm_cache.sqlite3'
+        _cache = SqliteCache(
+            path,
+            'llm',
+            max_entries=getattr(settings, 'LLM_CACHE_MAX_ENTRIES', 2000),
+            ttl=getattr(settings, 'LLM_CACHE_TTL', 7 * 24 * 3600),
+        )
+    return _cache
+
+
+@contextlib.contextmanager
+def llm_cache_bypass(enabled=True):
+    """
+    Ignore le cache (lecture et écriture) pour les appels LLM du bloc
+    """
+    token = _bypass.set(bool(enabled))
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+def normalize_ocr_text(text):
+    """
+    Normalise un texte OCR pour la clé : Unicode NFC, espaces regroupés, lignes vides supprimées
+    """
+    text = unicodedata.normalize('NFC', text or '')
+    lines = (re.sub(r'\s+', ' ', line).strip() for line in text.splitlines())
+    return '\n'.join(line for line in lines if line)
+
+
+def completion_key(model_id, ocr_results):
+    payload = {
+        'model': model_id,
+        'prompt_version': PROMPT_VERSION,
+        # Textes bruts ou texte consolidé dans le prompt, schéma de sortie imposé ou non
+        'ocr_mode': getattr(settings, 'LLM_PROMPT_OCR_MODE', 'raw'),
+        'structured_output': structured_output_enabled(),
+        'ocr': {engine: normalize_ocr_text(text) for engine, text in sorted((ocr_results or {}).items())},
+    }
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def get_cached_completion(model_id, ocr_results):
+    """
+    Réponse brute du modèle déjà obtenue pour ces textes OCR, ou None
+    """
+    cache = get_llm_cache()
+    if cache is None or _bypass.get():
+        return None
+    text = cache.get(completion_key(model_id, ocr_results))
+    if text is not None:
+        logger.info("LLM %s: réponse servie par le cache", model_id)
+        record_llm_call(backend='cache', model=model_id, prompt_tokens=0, completion_tokens=0,
+                        duration_ms=0, retries=0, outcome='cache', error='')
+    return text
+
+
+def store_completion(model_id, ocr_results, text):
+    """
+    Enregistre une réponse brute (à n'appeler que si elle a pu être exploitée)
+    """
+    cache = get_llm_cache()
+    if cache is None or _bypass.get() or not text:
+        return
+    cache.set(completion_key(model_id, ocr_results), text)
+
+
+def llm_cache_stats():
+    cache = get_llm_cache()
+    return cache.stats() if cache is not None else None
@@ -0,0 +1,435 @@
+"""
+Clients HTTP partagés des backends LLM (Ollama, routeur HuggingFace, Gemini).
+
+Un seul client par backend et par processus, avec pool de connexions
+keep-alive : les analyses successives réutilisent les connexions TCP/TLS au
+lieu d'en ouvrir une par requête. Les tailles de pool (LLM_POOL_CONNECTIONS,
+LLM_POOL_MAXSIZE) et les délais par backend (LLM_TIMEOUTS) sont réglables
+dans les settings ; llm_connection_stats() expose la réutilisation des
+connexions. Les générations sont streamées et arrêtées dès que l'objet JSON
+du ticket est complet (LLM_STREAM_JSON, voir json_stream.py) ; le délai du
+backend borne alors toute la génération, pas seulement chaque lecture.
+"""
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ReadTimeoutError
+from django.conf import settings
+
+from .health import ensure_available, record_failure, record_success
+from .json_stream import StreamTimeout, consume_stream
+from .llm_accounting import track_llm_call
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OLLAMA_URL = 'http://localhost:11434'
+DEFAULT_HF_BASE_URL = 'https://router.huggingface.co/v1'
+
+# Délais (secondes) par backend, surchargés par settings.LLM_TIMEOUTS
+DEFAULT_LLM_TIMEOUTS = {
+    'qwen': 30,
+    'mistral': 30,
+    'llama2': 15,
+    'gemini': 60,
+    'ollama_tags': 5,
+}
+
+_lock = threading.Lock()
+_ollama_session = None
+_hf_client = None
+_hf_stats = {'requests': 0, 'connections': 0}
+_gemini_configured = False
+_gemini_models = {}
+
+
+class LLMCancelled(Exception):
+    """
+    Appel LLM interrompu par son cancel_event (requête couverte perdante, voir llm_hedge.py)
+    """
+
+
+@contextlib.contextmanager
+def _circuit(backend):
+    """
+    Refuse l'appel si le disjoncteur du backend est ouvert (BackendUnavailable, voir health.py),
+    puis lui rapporte le résultat : les erreurs réseau, 429 et 5xx comptent comme des échecs
+    """
+    ensure_available(backend)
+    try:
+        yield
+    except LLMCancelled:
+        raise
+    except Exception as e:
+        status = getattr(e, 'status_code', None) or getattr(getattr(e, 'response', None), 'status_code', None)
+        if not isinstance(status, int):
+            status = getattr(e, 'code', None)
+        if not isinstance(status, int) or status >= 500 or status == 429:
+            record_failure(backend, e)
+        raise
+    else:
+        record_success(backend)
+
+
+def get_llm_timeout(backend):
+    timeouts = getattr(settings, 'LLM_TIMEOUTS', {}) or {}
+    return timeouts.get(backend, DEFAULT_LLM_TIMEOUTS.get(backend, 30))
+
+
+def _pool_sizes():
+    return (
+        getattr(settings, 'LLM_POOL_CONNECTIONS', 4),
+        getattr(settings, 'LLM_POOL_MAXSIZE', 10),
+    )
+
+
+# --- Ollama -----------------------------------------------------------------
+
+def get_ollama_session():
+    """
+    Session requests partagée vers Ollama (keep-alive, pool de connexions)
+    """
+    global _ollama_session
+    if _ollama_session is None:
+        with _lock:
+            if _ollama_session is None:
+                pool_connections, pool_maxsize = _pool_sizes()
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _ollama_session = session
+    return _ollama_session
+
+
+def ollama_url(path):
+    base = getattr(settings, 'OLLAMA_URL', DEFAULT_OLLAMA_URL).rstrip('/')
+    return f"{base}/{path.lstrip('/')}"
+
+
+def _stream_json_enabled(stop_at_json):
+    if stop_at_json is None:
+        return getattr(settings, 'LLM_STREAM_JSON', True)
+    return stop_at_json
+
+
+def _watch_cancel(fragments, cancel_event, label):
+    # Vérifie l'annulation entre deux fragments
+    for fragment in fragments:
+        if cancel_event is not None and cancel_event.is_set():
+            raise LLMCancelled(f"{label} annulé")
+        yield fragment
+
+
+def _ollama_usage(call, data):
+    # Décompte de tokens rapporté par Ollama (réponse complète ou dernier fragment streamé)
+    if 'prompt_eval_count' in data:
+        call['prompt_tokens'] = data['prompt_eval_count']
+    if 'eval_count' in data:
+        call['completion_tokens'] = data['eval_count']
+
+
+def _ollama_fragments(response, call):
+    for line in response.iter_lines():
+        if not line:
+            continue
+        chunk = json.loads(line)
+        # Le décompte arrive avec le dernier fragment, avant un éventuel arrêt anticipé du lecteur
+        _ollama_usage(call, chunk)
+        yield chunk.get('response', '')
+        if chunk.get('done'):
+            return
+
+
+def ollama_generate(model, prompt, **kwargs):
+    """
+    Appel /api/generate ; retourne le texte généré.
+    La réponse est streamée (LLM_STREAM_JSON ou cancel_event) : la génération s'arrête dès que
+    l'objet JSON de premier niveau est fermé (voir json_stream.py) ou que cancel_event est levé
+    (LLMCancelled) ; fermer la connexion interrompt la génération côté Ollama.
+    Les exceptions requests (Timeout, ConnectionError, HTTPError...) et BackendUnavailable
+    sont propagées à l'appelant ; un délai dépassé pendant le stream (lecture ou délai global)
+    lève requests.exceptions.Timeout, comme sans stream.
+    """
+    with track_llm_call('ollama', model, prompt) as call, _circuit('ollama'):
+        call['text'] = _ollama_generate(model, prompt, call, **kwargs)
+        return call['text']
+
+
+def _ollama_generate(model, prompt, call, timeout=None, cancel_event=None, stop_at_json=None, **payload):
+    stop_at_json = _stream_json_enabled(stop_at_json)
+    stream = stop_at_json or cancel_event is not None
+    body = {'model': model, 'prompt': prompt, 'stream': stream}
+    body.update(payload)
+    timeout = timeout or get_llm_timeout(model)
+    deadline = time.monotonic() + timeout
+    response = get_ollama_session().post(ollama_url('/api/generate'), json=body, timeout=timeout, stream=stream)
+    if response.status_code == 400 and isinstance(body.get('format'), dict):
+        # Ollama < 0.5 n'accepte pas de schéma : simple mode JSON
+        logger.warning("ollama/%s: schéma de sortie refusé, repli sur format='json'", model)
+        response.close()
+        body['format'] = 'json'
+        call['retries'] += 1
+        response = get_ollama_session().post(ollama_url('/api/generate'), json=body, timeout=timeout, stream=stream)
+    if response.status_code >= 400:
+        response.close()
+        response.raise_for_status()
+    if not stream:
+        data = response.json()
+        _ollama_usage(call, data)
+        return data.get('response', '')
+
+    try:
+        text, stopped = consume_stream(
+            _watch_cancel(_ollama_fragments(response, call), cancel_event, f"ollama/{model}"), stop_at_json,
+            deadline=deadline,
+        )
+    except StreamTimeout as e:
+        raise requests.exceptions.Timeout(f"ollama/{model}: {e}") from e
+    except requests.exceptions.ConnectionError as e:
+        # requests signale un délai de lecture en cours de stream comme une ConnectionError
+        if e.args and isinstance(e.args[0], ReadTimeoutError):
+            raise requests.exceptions.ReadTimeout(f"ollama/{model}: {e}") from e
+        raise
+    finally:
+        response.close()
+    if stopped:
+        logger.info("ollama/%s: objet JSON complet, génération interrompue", model)
+    return text
+
+
+# --- HuggingFace (API compatible OpenAI) --------------------------------------
+
+def _count_hf_request(request):
+    # La trace httpx signale l'ouverture de chaque nouvelle connexion TCP
+    def trace(event_name, info):
+        if event_name == 'connection.connect_tcp.complete':
+            _hf_stats['connections'] += 1
+
+    _hf_stats['requests'] += 1
+    request.extensions['trace'] = trace
+
+
+def get_hf_client():
+    """
+    Client OpenAI partagé vers le routeur HuggingFace, ou None si HF_TOKEN est absent
+    """
+    global _hf_client
+    if _hf_client is not None:
+        return _hf_client
+
+    hf_token = os.environ.get('HF_TOKEN', '')
+    if not hf_token:
+        return None
+
+    with _lock:
+        if _hf_client is None:
+            import httpx
+            from openai import OpenAI
+
+            pool_connections, pool_maxsize = _pool_sizes()
+            http_client = httpx.Client(
+                limits=httpx.Limits(max_connections=pool_maxsize, max_keepalive_connections=pool_connections),
+                timeout=get_llm_timeout('qwen'),
+                event_hooks={'request': [_count_hf_request]},
+            )
+            _hf_client = OpenAI(
+                base_url=getattr(settings, 'HF_BASE_URL', DEFAULT_HF_BASE_URL),
+                api_key=hf_token,
+                http_client=http_client,
+            )
+            logger.info("Client HuggingFace initialisé (pool de %d connexions)", pool_maxsize)
+    return _hf_client
+
+
+def _hf_usage(call, usage):
+    if usage is not None:
+        call['prompt_tokens'] = usage.prompt_tokens
+        call['completion_tokens'] = usage.completion_tokens
+
+
+def _hf_fragments(stream, call):
+    for chunk in stream:
+        # Certains fournisseurs joignent le décompte de tokens au dernier fragment
+        _hf_usage(call, getattr(chunk, 'usage', None))
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+def hf_chat(model, prompt, **kwargs):
+    """
+    Complétion chat sur le routeur HuggingFace ; retourne le texte généré.
+    Même streaming que ollama_generate : la réflexion <think> est ignorée et la génération
+    s'arrête à la fermeture de l'objet JSON, à l'annulation ou au délai global. Comme pour
+    Ollama, un délai dépassé (requête, lecture du stream ou délai global) lève
+    requests.exceptions.Timeout.
+    """
+    with track_llm_call('huggingface', model, prompt) as call, _circuit('huggingface'):
+        call['text'] = _hf_chat(model, prompt, call, **kwargs)
+        return call['text']
+
+
+@contextlib.contextmanager
+def _hf_timeouts(model):
+    """
+    Délais du client OpenAI/httpx convertis en exceptions requests, comme sur le chemin Ollama
+    """
+    import httpx
+    from openai import APITimeoutError
+
+    try:
+        yield
+    except StreamTimeout as e:
+        raise requests.exceptions.Timeout(f"{model}: {e}") from e
+    except httpx.ReadTimeout as e:
+        # Le stream OpenAI laisse passer le délai de lecture httpx tel quel
+        raise requests.exceptions.ReadTimeout(f"{model}: {e}") from e
+    except (httpx.TimeoutException, APITimeoutError) as e:
+        raise requests.exceptions.Timeout(f"{model}: {e}") from e
+
+
+def _hf_chat(model, prompt, call, timeout=None, cancel_event=None, stop_at_json=None, **kwargs):
+    client = get_hf_client()
+    if client is None:
+        raise RuntimeError("Client HuggingFace non initialisé (HF_TOKEN manquant)")
+
+    with _hf_timeouts(model):
+        messages = [{'role': 'user', 'content': prompt}]
+        timeout = timeout or get_llm_timeout('qwen')
+        deadline = time.monotonic() + timeout
+        stop_at_json = _stream_json_enabled(stop_at_json)
+        stream = stop_at_json or cancel_event is not None
+        try:
+            response = client.chat.completions.create(
+                model=model, messages=messages, timeout=timeout, stream=stream, **kwargs
+            )
+        except Exception as e:
+            # Fournisseur sans sortie structurée : même appel sans response_format
+            if 'response_format' not in kwargs or getattr(e, 'status_code', None) not in (400, 422):
+                raise
+            logger.warning("%s: response_format refusé (%s), appel sans schéma", model, e)
+            kwargs.pop('response_format')
+            call['retries'] += 1
+            response = client.chat.completions.create(
+                model=model, messages=messages, timeout=timeout, stream=stream, **kwargs
+            )
+        if not stream:
+            _hf_usage(call, response.usage)
+            return (response.choices[0].message.content or '').strip()
+
+        try:
+            text, stopped = consume_stream(
+                _watch_cancel(_hf_fragments(response, call), cancel_event, model), stop_at_json, deadline=deadline
+            )
+        finally:
+            response.close()
+        if stopped:
+            logger.info("%s: objet JSON complet, génération interrompue", model)
+        return text.strip()
+
+
+# --- Gemini -------------------------------------------------------------------
+
+def get_gemini_model(model_name='gemini-2.5-flash', **kwargs):
+    """
+    GenerativeModel Gemini mis en cache ; genai.configure n'est appelé qu'une fois par processus.
+    Retourne None si le paquet ou la clé API manque.
+    """
+    global _gemini_configured
+    try:
+        import google.generativeai as genai
+    except Exception:
+        return None
+
+    api_key = os.environ.get('GOOGLE_API_KEY') or getattr(settings, 'GOOGLE_API_KEY', '')
+    if not api_key or api_key == 'your_google_api_key_here':
+        return None
+
+    key = (model_name, tuple(sorted((name, repr(value)) for name, value in kwargs.items())))
+    model = _gemini_models.get(key)
+    if model is not None:
+        return model
+
+    with _lock:
+        if not _gemini_configured:
+            genai.configure(api_key=api_key)
+            _gemini_configured = True
+        model = _gemini_models.get(key)
+        if model is None:
+            model = genai.GenerativeModel(model_name, **kwargs)
+            _gemini_models[key] = model
+    return model
+
+
+def gemini_generate(model, prompt, timeout=None, **kwargs):
+    """
+    generate_content avec le délai configuré pour Gemini
+    """
+    model_name = getattr(model, 'model_name', 'gemini').replace('models/', '')
+    with track_llm_call('gemini', model_name, prompt) as call, _circuit('gemini'):
+        response = _gemini_generate(model, prompt, call, timeout=timeout, **kwargs)
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is not None:
+            call['prompt_tokens'] = usage.prompt_token_count
+            call['completion_tokens'] = usage.candidates_token_count
+        return response
+
+
+def _gemini_generate(model, prompt, call, timeout=None, **kwargs):
+    try:
+        return _gemini_call(model, prompt, timeout, **kwargs)
+    except ValueError as e:
+        # Versions sans response_schema : le schéma est refusé à la construction de la requête
+        config = kwargs.get('generation_config')
+        if not isinstance(config, dict) or 'response_schema' not in config:
+            raise
+        logger.warning("Gemini: response_schema refusé (%s), appel sans schéma", e)
+        kwargs['generation_config'] = {k: v for k, v in config.items() if k != 'response_schema'}
+        call['retries'] += 1
+        return _gemini_call(model, prompt, timeout, **kwargs)
+
+
+def _gemini_call(model, prompt, timeout, **kwargs):
+    try:
+        return model.generate_content(prompt, request_options={'timeout': timeout or get_llm_timeout('gemini')}, **kwargs)
+    except (TypeError, ValueError) as e:
+        # google-generativeai < 0.4 : request_options inconnu (TypeError ou champ refusé par la requête)
+        if 'request_options' not in str(e):
+            raise
+        return model.generate_content(prompt, **kwargs)
+
+
+# --- Statistiques -------------------------------------------------------------
+
+def llm_connection_stats():
+    """
+    Requêtes envoyées et connexions ouvertes par backend (requêtes - connexions = réutilisations)
+    """
+    stats = {}
+
+    if _ollama_session is not None:
+        requests_count = connections = 0
+        for adapter in set(_ollama_session.adapters.values()):
+            for pool in list(adapter.poolmanager.pools._container.values()):
+                requests_count += pool.num_requests
+                connections += pool.num_connections
+        stats['ollama'] = {
+            'requests': requests_count,
+            'connections': connections,
+            'reused': max(0, requests_count - connections),
+        }
+
+    if _hf_client is not None:
+        stats['huggingface'] = {
+            'requests': _hf_stats['requests'],
+            'connections': _hf_stats['connections'],
+            'reused': max(0, _hf_stats['requests'] - _hf_stats['connections']),
+        }
+
+    stats['gemini'] = {'configured': _gemini_configured, 'models': len(_gemini_models)}
+    return stats
@@ -0,0 +1,112 @@
+"""
+Requêtes LLM "couvertes" (hedging).
+
+Au lieu d'attendre l'échec (ou le délai de 30 s) d'un backend avant de
+passer au suivant, le backend suivant est lancé dès que le précédent n'a
+pas répondu au bout de LLM_HEDGE_DELAY_S secondes, ou immédiatement s'il a
+échoué. La première réponse qui donne un ticket JSON valide l'emporte et les
+autres appels sont annulés via leur cancel_event (les appels streamés
+ferment alors leur connexion, ce qui interrompt la génération).
+"""
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='llm-hedge')
+    return _executor
+
+
+def is_valid_ticket_result(result):
+    """
+    Résultat d'analyse exploitable : un dict sans erreur avec au moins un champ du ticket renseigné
+    """
+    if not isinstance(result, dict) or result.get('error'):
+        return False
+    return bool(result.get('Magasin') or result.get('Total') or result.get('Articles'))
+
+
+def run_hedged(attempts, delay, timeout, validate=is_valid_ticket_result):
+    """
+    attempts : liste ordonnée de (nom, fonction(cancel_event) -> résultat).
+    Retourne (nom du gagnant, résultat) ou (None, {nom: résultat ou exception}) si aucun n'est valide.
+    """
+    executor = _get_executor()
+    start = time.monotonic()
+    deadline = start + timeout
+    pending = {}
+    outcomes = {}
+    cancel_events = {}
+    next_index = 0
+
+    def launch():
+        nonlocal next_index
+        name, func = attempts[next_index]
+        next_index += 1
+        event = threading.Event()
+        cancel_events[name] = event
+        # Copier le contexte pour conserver les ContextVar de la requête (ex. contournement du cache LLM)
+        context = contextvars.copy_context()
+        pending[executor.submit(context.run, func, event)] = name
+        logger.info("LLM hedging: lancement de %s après %.1fs", name, time.monotonic() - start)
+
+    launch()
+    winner = None
+    while pending or next_index < len(attempts):
+        now = time.monotonic()
+        if now >= deadline:
+            break
+        if not pending:
+            launch()
+            continue
+
+        # Attendre une réponse, au plus jusqu'au prochain lancement couvert
+        wait_for = deadline - now
+        if next_index < len(attempts):
+            wait_for = min(wait_for, delay)
+        done, _ = wait(list(pending), timeout=wait_for, return_when=FIRST_COMPLETED)
+
+        if not done:
+            if next_index < len(attempts):
+                launch()
+            continue
+
+        for future in done:
+            name = pending.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                outcomes[name] = e
+                logger.warning("LLM hedging: %s en échec: %s", name, e)
+                continue
+            outcomes[name] = result
+            if winner is None and validate(result):
+                winner = name
+        if winner is not None:
+            break
+        # Échec sans gagnant : ne pas attendre le délai pour lancer le backend suivant
+        if not pending and next_index < len(attempts):
+            launch()
+
+    for name, event in cancel_events.items():
+        if name != winner:
+            event.set()
+
+    elapsed = time.monotonic() - start
+    if winner is None:
+        logger.warning("LLM hedging: aucun backend valide après %.1fs (%s)", elapsed, ', '.join(cancel_events))
+        return None, outcomes
+    logger.info("LLM hedging: %s l'emporte en %.1fs (%d backend(s) lancés)", winner, elapsed, len(cancel_events))
+    return winner, outcomes[winner]
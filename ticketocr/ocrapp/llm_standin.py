@@ -0,0 +1,284 @@
+"""
+Serveur local imitant Ollama et l'API compatible OpenAI (routeur HuggingFace).
+
+Sert les sous-ensembles utilisés par llm_clients.py : POST /api/generate
+(réponse complète ou streaming NDJSON), GET /api/tags, POST
+/v1/chat/completions (réponse complète ou streaming SSE) et GET /v1/models.
+Les réponses sont rejouées depuis des fixtures (llm_standin_fixtures.json : un
+ticket JSON par motif reconnu dans le texte OCR du prompt, y compris les
+prompts groupés de llm_batch.py), avec latence, gigue, erreurs et délais
+d'expiration injectés (StandinConfig) : le pipeline complet peut ainsi être
+testé en charge hors ligne, de façon reproductible (seed).
+
+Lancement : python manage.py llm_standin, puis OLLAMA_URL=http://127.0.0.1:11435
+et HF_BASE_URL=http://127.0.0.1:11435/v1 (HF_TOKEN quelconque).
+"""
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FIXTURES = os.path.join(os.path.dirname(__file__), 'llm_standin_fixtures.json')
+
+TICKET_BLOCK = re.compile(r'=== TICKET (\S+) ===\n(.*?)\n=== FIN TICKET \1 ===', re.S)
+
+
+class StandinConfig:
+    """
+    Injection de latence et de pannes ; model_latency ({modèle: secondes}) prime sur latency
+    """
+
+    def __init__(self, latency=0.5, jitter=0.2, token_delay=0.01, error_rate=0.0, error_status=500,
+                 timeout_rate=0.0, hang=120.0, think_words=0, model_latency=None, seed=None,
+                 fixtures=DEFAULT_FIXTURES):
+        self.latency = latency              # délai avant le premier fragment (secondes)
+        self.jitter = jitter                # gigue uniforme ajoutée à la latence (± secondes)
+        self.token_delay = token_delay      # délai entre deux fragments streamés
+        self.error_rate = error_rate        # proportion de réponses en erreur HTTP
+        self.error_status = error_status
+        self.timeout_rate = timeout_rate    # proportion de requêtes sans réponse (le client expire)
+        self.hang = hang                    # durée de blocage d'une requête « sans réponse »
+        self.think_words = think_words      # bloc <think> préfixé (modèles de raisonnement)
+        self.model_latency = model_latency or {}
+        self.seed = seed
+        self.fixtures = fixtures
+
+
+class Standin:
+    """
+    État partagé du serveur : configuration, fixtures, tirages aléatoires et compteurs
+    """
+
+    def __init__(self, config):
+        self.config = config
+        with open(config.fixtures, encoding='utf-8') as f:
+            self.fixtures = json.load(f)
+        self._random = random.Random(config.seed)
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'errors': 0, 'timeouts': 0, 'streams': 0, 'fixtures': {}}
+
+    def draw(self, model):
+        """
+        Tire le sort de la requête : ('timeout' | 'error' | 'ok', latence en secondes)
+        """
+        config = self.config
+        with self._lock:
+            self.stats['requests'] += 1
+            roll = self._random.random()
+            jitter = self._random.uniform(-config.jitter, config.jitter)
+            if roll < config.timeout_rate:
+                self.stats['timeouts'] += 1
+                return 'timeout', config.hang
+            if roll < config.timeout_rate + config.error_rate:
+                self.stats['errors'] += 1
+                return 'error', 0.0
+        latency = config.model_latency.get(model, config.latency)
+        return 'ok', max(0.0, latency + jitter)
+
+    def count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def match(self, text):
+        upper = (text or '').upper()
+        for fixture in self.fixtures:
+            if all(pattern.upper() in upper for pattern in fixture['match']):
+                with self._lock:
+                    self.stats['fixtures'][fixture['name']] = self.stats['fixtures'].get(fixture['name'], 0) + 1
+                return fixture['ticket']
+        return {}
+
+    def answer(self, prompt):
+        """
+        Réponse JSON rejouée pour un prompt (un ticket, ou {"tickets": [...]} pour un prompt groupé)
+        """
+        blocks = TICKET_BLOCK.findall(prompt)
+        if blocks:
+            data = {'tickets': [dict(self.match(text), id=label) for label, text in blocks]}
+        else:
+            data = self.match(prompt)
+        text = json.dumps(data, ensure_ascii=False, indent=2)
+        if self.config.think_words:
+            think = ' '.join(['analyse'] * self.config.think_words)
+            text = f"<think>\n{think}\n</think>\n\n{text}"
+        return text
+
+
+def _fragments(text, size=4):
+    # Découpage grossier en « tokens » de quelques caractères
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def _estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'LLMStandin/1.0'
+
+    @property
+    def standin(self):
+        return self.server.standin
+
+    def log_message(self, format, *args):
+        logger.debug("llm_standin: " + format, *args)
+
+    # --- Utilitaires ------------------------------------------------------------
+
+    def _send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _start_chunked(self, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+    def _write_chunk(self, data):
+        data = data.encode('utf-8')
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    def _end_chunked(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            return json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return None
+
+    def _inject(self, model):
+        """
+        Applique l'injection tirée pour la requête ; faux si la réponse a déjà été traitée
+        """
+        outcome, delay = self.standin.draw(model)
+        if outcome == 'timeout':
+            time.sleep(delay)
+            self.close_connection = True
+            return False
+        if outcome == 'error':
+            self._send_json(self.standin.config.error_status, {'error': 'stand-in : erreur injectée'})
+            return False
+        time.sleep(delay)
+        return True
+
+    # --- Routes -----------------------------------------------------------------
+
+    def do_GET(self):
+        if self.path == '/api/tags':
+            models = sorted(set(self.standin.config.model_latency) | {'mistral', 'llama2'})
+            self._send_json(200, {'models': [{'name': name, 'model': name} for name in models]})
+        elif self.path == '/v1/models':
+            self._send_json(200, {'object': 'list', 'data': [{'id': 'standin', 'object': 'model'}]})
+        elif self.path == '/standin/stats':
+            self._send_json(200, self.standin.stats)
+        else:
+            self._send_json(404, {'error': f"route inconnue : {self.path}"})
+
+    def do_POST(self):
+        body = self._read_json()
+        if body is None:
+            self._send_json(400, {'error': 'corps JSON invalide'})
+        elif self.path == '/api/generate':
+            self._generate(body)
+        elif self.path == '/v1/chat/completions':
+            self._chat(body)
+        else:
+            self._send_json(404, {'error': f"route inconnue : {self.path}"})
+
+    def _generate(self, body):
+        model = body.get('model', '')
+        prompt = body.get('prompt', '')
+        if not self._inject(model):
+            return
+        text = self.standin.answer(prompt)
+        usage = {'prompt_eval_count': _estimate_tokens(prompt), 'eval_count': _estimate_tokens(text)}
+        if not body.get('stream', True):
+            self._send_json(200, dict({'model': model, 'response': text, 'done': True}, **usage))
+            return
+
+        self.standin.count('streams')
+        self._start_chunked('application/x-ndjson')
+        try:
+            for fragment in _fragments(text):
+                self._write_chunk(json.dumps({'model': model, 'response': fragment, 'done': False}) + '\n')
+                time.sleep(self.standin.config.token_delay)
+            self._write_chunk(json.dumps(dict({'model': model, 'response': '', 'done': True}, **usage)) + '\n')
+            self._end_chunked()
+        except (BrokenPipeError, ConnectionResetError):
+            # Le client a fermé le flux (arrêt anticipé à la fermeture du JSON, annulation)
+            self.close_connection = True
+
+    def _chat(self, body):
+        model = body.get('model', '')
+        prompt = '\n'.join(
+            message.get('content') or '' for message in body.get('messages', []) if isinstance(message, dict)
+        )
+        if not self._inject(model):
+            return
+        text = self.standin.answer(prompt)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        usage = {
+            'prompt_tokens': _estimate_tokens(prompt),
+            'completion_tokens': _estimate_tokens(text),
+            'total_tokens': _estimate_tokens(prompt) + _estimate_tokens(text),
+        }
+        if not body.get('stream'):
+            self._send_json(200, {
+                'id': completion_id,
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text}, 'finish_reason': 'stop'}],
+                'usage': usage,
+            })
+            return
+
+        def event(delta, finish_reason=None, **extra):
+            chunk = dict({
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}],
+            }, **extra)
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n")
+
+        self.standin.count('streams')
+        self._start_chunked('text/event-stream')
+        try:
+            event({'role': 'assistant', 'content': ''})
+            for fragment in _fragments(text):
+                event({'content': fragment})
+                time.sleep(self.standin.config.token_delay)
+            event({}, 'stop', usage=usage)
+            self._write_chunk("data: [DONE]\n\n")
+            self._end_chunked()
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+
+def make_server(config=None, host='127.0.0.1', port=11435):
+    """
+    Serveur prêt à lancer (serve_forever) ; port=0 choisit un port libre (server.server_port)
+    """
+    server = ThreadingHTTPServer((host, port), StandinHandler)
+    server.daemon_threads = True
+    server.standin = Standin(config or StandinConfig())
+    return server
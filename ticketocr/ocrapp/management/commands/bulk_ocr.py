@@ -0,0 +1,60 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand
+
+from ocrapp.doctr_batcher import extract_texts_doctr_batch
+
+EXTENSIONS = ('.jpg', '.jpeg', '.png', '.pdf')
+
+
+class Command(BaseCommand):
+    help = "OCR Doctr en masse de tickets (fichiers ou dossiers), par lots de pages"
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='Fichiers ou dossiers de tickets')
+        parser.add_argument('--output', help='Fichier JSON Lines de sortie (stdout par défaut)')
+        parser.add_argument(
+            '--llm', action='store_true',
+            help="Analyser aussi les tickets avec le LLM, plusieurs tickets par requête (LLM_BATCH_*)",
+        )
+
+    def handle(self, *args, **options):
+        file_paths = []
+        for path in options['paths']:
+            if os.path.isdir(path):
+                for name in sorted(os.listdir(path)):
+                    if name.lower().endswith(EXTENSIONS):
+                        file_paths.append(os.path.join(path, name))
+            else:
+                file_paths.append(path)
+
+        if not file_paths:
+            self.stdout.write(self.style.WARNING('Aucun ticket à traiter.'))
+            return
+
+        results = extract_texts_doctr_batch(file_paths)
+
+        analyses = {}
+        if options.get('llm'):
+            from ocrapp.views import analyze_tickets_batch_with_llm
+
+            analyses = analyze_tickets_batch_with_llm({
+                path: {'doctr': text} for path, text in results.items() if not text.startswith('Erreur')
+            })
+
+        lines = []
+        for path, text in results.items():
+            line = {'file': path, 'doctr': text}
+            if path in analyses:
+                line['analysis'] = analyses[path]
+            lines.append(json.dumps(line, ensure_ascii=False, default=str))
+        if options.get('output'):
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write('\n'.join(lines) + '\n')
+        else:
+            for line in lines:
+                self.stdout.write(line)
+
+        errors = sum(1 for text in results.values() if text.startswith('Erreur'))
+        self.stderr.write(self.style.SUCCESS(f'{len(results) - errors}/{len(results)} ticket(s) traité(s).'))
@@ -0,0 +1,121 @@
+import json
+import os
+from collections import Counter
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ocrapp.merchant_templates import analyze_with_template, get_registry
+from ocrapp.models import TicketHistory
+from ocrapp.template_learning import (
+    Sample, compile_template, cross_validate, evaluate_template, learn_template, merchant_key,
+)
+
+RULE_LABELS = [('total', 'total'), ('articles', 'articles'), ('timbre', 'timbre'), ('date', 'date'), ('numero', 'numéro')]
+
+
+def _percent(value):
+    return '-' if value is None else f"{value:.0%}"
+
+
+class Command(BaseCommand):
+    help = ("Apprend ou rafraîchit les gabarits d'enseigne (MERCHANT_TEMPLATES_DIR) à partir des tickets "
+            "enregistrés et de leurs textes OCR, avec couverture et exactitude de chaque règle mesurées "
+            "par validation croisée (tickets écartés de l'apprentissage)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-tickets', type=int, default=3, help="Tickets corrigés minimum par enseigne")
+        parser.add_argument('--min-accuracy', type=float, default=0.9,
+                            help="Exactitude minimale d'un gabarit appris pour être écrit")
+        parser.add_argument('--magasin', help="N'apprendre que cette enseigne")
+        parser.add_argument('--output-dir', help="Dossier des gabarits (MERCHANT_TEMPLATES_DIR par défaut)")
+        parser.add_argument('--dry-run', action='store_true', help="Évaluer sans écrire de gabarit")
+
+    def handle(self, *args, **options):
+        output_dir = options.get('output_dir') or getattr(settings, 'MERCHANT_TEMPLATES_DIR', None)
+        if not output_dir and not options.get('dry_run'):
+            raise CommandError("Aucun dossier de gabarits : définir MERCHANT_TEMPLATES_DIR ou passer --output-dir (ou --dry-run)")
+        groups = {}
+        for ticket in TicketHistory.objects.filter(extraction__isnull=False).select_related('extraction'):
+            sample = Sample(ticket, ticket.extraction.get_ocr_results())
+            key = merchant_key(ticket.magasin)
+            if sample.texts and key:
+                groups.setdefault(key, []).append(sample)
+
+        if not groups:
+            self.stdout.write(self.style.WARNING('Aucun ticket enregistré avec ses textes OCR.'))
+            return
+
+        registry = get_registry()
+        by_magasin = {merchant_key(template.magasin): template for template in registry.templates.values()}
+        all_samples = [sample for samples in groups.values() for sample in samples]
+        covered_before = {sample.ticket_id for sample in all_samples if analyze_with_template(sample.ocr_results)}
+        covered_after = set(covered_before)
+        written = 0
+
+        for key, samples in sorted(groups.items(), key=lambda item: -len(item[1])):
+            if options.get('magasin') and merchant_key(options['magasin']) != key:
+                continue
+            magasin = Counter(sample.magasin for sample in samples).most_common(1)[0][0]
+            if len(samples) < options['min_tickets']:
+                self.stdout.write(f"{magasin} : {len(samples)} ticket(s), trop peu pour apprendre un gabarit")
+                continue
+
+            current = registry.templates.get(key) or by_magasin.get(key)
+            name = current.name if current else key
+            others = [sample for other, other_samples in groups.items() if other != key for sample in other_samples]
+            before = evaluate_template(current, samples, others) if current else None
+
+            template_magasin = current.magasin if current else magasin
+            data = learn_template(name, template_magasin, samples, others)
+            template = compile_template(data) if data else None
+            if template is None:
+                self.stdout.write(self.style.WARNING(
+                    f"{magasin} : {len(samples)} tickets, aucun gabarit induit (en-tête ou total introuvable)"))
+                continue
+            # Gabarit écrit appris sur tous les tickets ; ses chiffres viennent de tickets écartés de l'apprentissage
+            stats = cross_validate(name, template_magasin, samples, others)
+
+            line = f"{name} ({magasin}) : {len(samples)} tickets"
+            if before:
+                line += f" | actuel : couverture {_percent(before['coverage'])}, exactitude {_percent(before['accuracy'])}"
+            line += f" | appris (validation croisée) : couverture {_percent(stats['coverage'])}, exactitude {_percent(stats['accuracy'])}"
+            self.stdout.write(line)
+            self.stdout.write(
+                f"    règles : identification {_percent(stats['identified'] / stats['tickets'])} "
+                f"({stats['false_identifications']} faux positif(s)), "
+                + ', '.join(f"{label} {_percent(stats['rules'][rule])}" for rule, label in RULE_LABELS)
+            )
+
+            better = before is None or stats['coverage'] * stats['accuracy'] > before['coverage'] * before['accuracy']
+            if stats['accuracy'] < options['min_accuracy'] or not stats['covered'] or stats['false_identifications']:
+                self.stdout.write(self.style.WARNING("    non retenu : exactitude insuffisante ou fausses identifications"))
+                continue
+            if not better:
+                self.stdout.write("    non retenu : le gabarit actuel fait au moins aussi bien")
+                continue
+
+            covered_after -= {sample.ticket_id for sample in samples}
+            covered_after |= stats['covered_ids']
+            if options.get('dry_run'):
+                continue
+            data['learned'].update({
+                'learned_at': datetime.now().isoformat(timespec='seconds'),
+                'coverage': round(stats['coverage'], 3),
+                'accuracy': round(stats['accuracy'], 3),
+                'rules': {rule: None if value is None else round(value, 3) for rule, value in stats['rules'].items()},
+            })
+            os.makedirs(output_dir, exist_ok=True)
+            path = os.path.join(output_dir, f"{name}.json")
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            written += 1
+            self.stdout.write(self.style.SUCCESS(f"    écrit : {path}"))
+
+        total = len(all_samples)
+        self.stdout.write(
+            f"\nTickets extraits sans LLM : {len(covered_before)}/{total} ({_percent(len(covered_before) / total)}) "
+            f"-> {len(covered_after)}/{total} ({_percent(len(covered_after) / total)})"
+            + (" (simulation)" if options.get('dry_run') else f", {written} gabarit(s) écrit(s)")
+        )
@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ocrapp.llm_standin import DEFAULT_FIXTURES, StandinConfig, make_server
+
+
+def _model_latency(value):
+    model, _, seconds = value.partition('=')
+    try:
+        return model, float(seconds)
+    except ValueError:
+        raise CommandError(f"--model-latency attend MODELE=SECONDES, reçu : {value}")
+
+
+class Command(BaseCommand):
+    help = "Serveur local imitant Ollama et l'API OpenAI (HuggingFace) pour les tests de charge et de latence"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=11435)
+        parser.add_argument('--fixtures', default=DEFAULT_FIXTURES, help='Fichier JSON des réponses rejouées')
+        parser.add_argument('--latency', type=float, default=0.5, help='Délai avant le premier fragment (s)')
+        parser.add_argument('--jitter', type=float, default=0.2, help='Gigue uniforme ± sur la latence (s)')
+        parser.add_argument(
+            '--model-latency', action='append', default=[], metavar='MODELE=SECONDES',
+            help='Latence propre à un modèle (répétable), ex. --model-latency mistral=2.5',
+        )
+        parser.add_argument('--token-delay', type=float, default=0.01, help='Délai entre fragments streamés (s)')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Proportion de réponses en erreur (0-1)')
+        parser.add_argument('--error-status', type=int, default=500, help='Statut HTTP des erreurs injectées')
+        parser.add_argument('--timeout-rate', type=float, default=0.0, help='Proportion de requêtes sans réponse (0-1)')
+        parser.add_argument('--hang', type=float, default=120.0, help='Blocage des requêtes sans réponse (s)')
+        parser.add_argument('--think-words', type=int, default=0, help='Taille du bloc <think> préfixé (mots)')
+        parser.add_argument('--seed', type=int, help='Graine des tirages (latence, erreurs) pour rejouer un scénario')
+
+    def handle(self, *args, **options):
+        if options['error_rate'] + options['timeout_rate'] > 1:
+            raise CommandError("--error-rate + --timeout-rate doit rester inférieur ou égal à 1")
+
+        config = StandinConfig(
+            latency=options['latency'],
+            jitter=options['jitter'],
+            token_delay=options['token_delay'],
+            error_rate=options['error_rate'],
+            error_status=options['error_status'],
+            timeout_rate=options['timeout_rate'],
+            hang=options['hang'],
+            think_words=options['think_words'],
+            model_latency=dict(_model_latency(value) for value in options['model_latency']),
+            seed=options['seed'],
+            fixtures=options['fixtures'],
+        )
+        server = make_server(config, options['host'], options['port'])
+        url = f"http://{options['host']}:{server.server_port}"
+        self.stdout.write(self.style.SUCCESS(f"Stand-in LLM à l'écoute sur {url}"))
+        self.stdout.write(f"  OLLAMA_URL={url}")
+        self.stdout.write(f"  HF_BASE_URL={url}/v1  (HF_TOKEN quelconque)")
+        self.stdout.write(f"  Compteurs : {url}/standin/stats")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"Arrêt du stand-in : {server.standin.stats}")
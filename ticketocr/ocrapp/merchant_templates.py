@@ -0,0 +1,277 @@
+"""
+Gabarits de tickets par enseigne : extraction déterministe sans LLM.
+
+Chaque enseigne connue est décrite de façon déclarative (merchant_templates.json
+pour les gabarits fournis, un fichier <nom>.json par enseigne dans
+MERCHANT_TEMPLATES_DIR pour les gabarits locaux, qui remplacent un gabarit
+fourni de même nom) : motifs d'en-tête identifiant l'enseigne, numéro, date,
+grammaire des lignes d'article, remises, timbre fiscal, total et lignes à
+ignorer (paiement, TVA...). Les motifs peuvent utiliser les gabarits {montant},
+{date} et {heure}.
+
+L'enseigne est identifiée par une seule expression précompilée (alternative de
+tous les motifs d'en-tête) appliquée aux HEADER_LINES premières lignes du texte
+OCR : le coût ne dépend pas de la longueur du ticket. Le ticket est ensuite lu
+ligne à ligne, moteur par moteur (doctr, tesseract, docling) ; le premier
+résultat dont les articles, remises et timbre redonnent le total au centime près
+est retourné au format des analyses LLM. Sinon l'appelant interroge le LLM.
+"""
+import json
+import logging
+import os
+import re
+from django.conf import settings
+
+from .amounts import CENTIME, ZERO, format_amount, parse_amount
+from .ocr_cache import ERROR_PREFIXES
+from .ocr_consensus import ENGINE_PRIORITY, split_lines
+
+logger = logging.getLogger(__name__)
+
+BUILTIN_TEMPLATES = os.path.join(os.path.dirname(__file__), 'merchant_templates.json')
+# Lignes d'en-tête examinées pour identifier l'enseigne
+HEADER_LINES = 8
+# Écart toléré entre la somme des lignes et le total (1 centime)
+TOLERANCE = CENTIME
+
+PLACEHOLDERS = {
+    # Montant au format ticket (3 décimales, virgule ou point, O lu à la place de 0)
+    'montant': r'-?\s?[\dO]+[.,][\dO]{3}',
+    'date': r'[0-3]?\d[/-][01]?\d[/-]\d{4}',
+    'heure': r'[0-2]?\d[:h][0-5]\d',
+}
+_PLACEHOLDER = re.compile(r'\{(' + '|'.join(PLACEHOLDERS) + r')\}')
+FIELDS = ('numero', 'date', 'article', 'remise', 'timbre', 'total')
+
+
+def parse_ocr_amount(text):
+    """
+    Montant lu sur le ticket ('13,990', 'O.100', '- 4.010') en Decimal, None si illisible
+    """
+    return parse_amount(text.replace('O', '0'))
+
+
+class MerchantTemplate:
+    """
+    Gabarit compilé d'une enseigne
+    """
+
+    def __init__(self, name, magasin, identify, numero=None, date=None, article=None, remise=None,
+                 timbre=None, total=None, ignore=(), source=''):
+        self.name = name
+        self.magasin = magasin
+        self.identify = list(identify)
+        self.source = source
+        self.patterns = {}
+        for field, pattern in zip(FIELDS, (numero, date, article, remise, timbre, total)):
+            if pattern:
+                self.patterns[field] = re.compile(_PLACEHOLDER.sub(lambda match: PLACEHOLDERS[match[1]], pattern))
+        self.ignore = re.compile('|'.join(f'(?:{p})' for p in ignore), re.IGNORECASE) if ignore else None
+        self._identify = re.compile('|'.join(f'(?:{p})' for p in self.identify), re.IGNORECASE)
+        if 'article' not in self.patterns or 'total' not in self.patterns:
+            raise ValueError(f"Gabarit {name}: motifs 'article' et 'total' obligatoires")
+
+    @classmethod
+    def from_dict(cls, data, source=''):
+        return cls(
+            data['name'], data.get('magasin') or data['name'].upper(), data.get('identify') or [data['name']],
+            ignore=data.get('ignore', ()), source=source,
+            **{field: data.get(field) for field in FIELDS},
+        )
+
+    def identifies(self, text):
+        """
+        Vrai si un motif d'en-tête de ce gabarit apparaît dans l'en-tête de text
+        """
+        return bool(text) and self._identify.search(text, 0, header_end(text)) is not None
+
+    def parse_ocr_results(self, ocr_results):
+        """
+        Premier ticket validé parmi les textes des moteurs reconnus par ce gabarit : (moteur, ticket) ou (None, None)
+        """
+        for engine, text in usable_texts(ocr_results):
+            if self.identifies(text):
+                result = self.parse(text)
+                if result is not None:
+                    return engine, result
+        return None, None
+
+    def parse(self, text):
+        """
+        Lit un texte OCR ; retourne le ticket (dict au format LLM) s'il est complet et cohérent, sinon None
+        """
+        patterns = self.patterns
+        numero = date = total = None
+        timbre = ZERO
+        articles = []  # [ref, nom, prix]
+
+        for line in split_lines(text):
+            if self.ignore is not None and self.ignore.search(line):
+                continue
+            match = patterns['total'].search(line)
+            if match:
+                total = parse_ocr_amount(match['prix'])
+                # Les lignes suivantes (paiement, rendu, TVA) ne font pas partie des achats
+                break
+            match = 'timbre' in patterns and patterns['timbre'].search(line)
+            if match:
+                amount = parse_ocr_amount(match['prix'])
+                if amount is None:
+                    return None
+                timbre += abs(amount)
+                continue
+            match = 'remise' in patterns and patterns['remise'].search(line)
+            if match:
+                amount = parse_ocr_amount(match['prix'])
+                if amount is None or not articles:
+                    return None
+                # Remise imputée à l'article désigné (lettre a, b...) ou à l'article précédent ;
+                # le signe est souvent perdu par l'OCR
+                ref = match.groupdict().get('ref')
+                target = next((a for a in articles if ref and a[0] == ref), articles[-1])
+                target[2] -= abs(amount)
+                continue
+            if numero is None and 'numero' in patterns:
+                match = patterns['numero'].search(line)
+                if match:
+                    numero = match['numero']
+                    continue
+            if date is None and 'date' in patterns:
+                match = patterns['date'].search(line)
+                if match:
+                    date = _normalize_date(match['date'], match.groupdict().get('heure'))
+                    continue
+            match = patterns['article'].search(line)
+            if match:
+                amount = parse_ocr_amount(match['prix'])
+                if amount is None:
+                    return None
+                articles.append([match.groupdict().get('ref'), match['nom'].strip(), amount])
+
+        if total is None or not articles or not date:
+            return None
+        somme = sum(article[2] for article in articles) + timbre
+        if abs(somme - total) >= TOLERANCE:
+            logger.info("Gabarit %s: somme %s != total %s", self.name, somme, total)
+            return None
+
+        lignes = [{"nom": nom, "prix": format_amount(prix)} for _, nom, prix in articles]
+        if timbre:
+            lignes.append({"nom": "TIMBRE FISCAL", "prix": format_amount(timbre)})
+        return {
+            "Magasin": self.magasin,
+            "NumeroTicket": numero or "",
+            "Date": date,
+            "Articles": lignes,
+            "Total": format_amount(total),
+        }
+
+
+def header_end(text):
+    """
+    Fin des HEADER_LINES premières lignes de text (zone examinée pour identifier l'enseigne)
+    """
+    end = -1
+    for _ in range(HEADER_LINES):
+        end = text.find('\n', end + 1)
+        if end < 0:
+            return len(text)
+    return end
+
+
+def usable_texts(ocr_results):
+    """
+    (moteur, texte) exploitables, dans l'ordre de préférence des moteurs
+    """
+    for engine in ENGINE_PRIORITY:
+        text = ocr_results.get(engine) or ""
+        if text.strip() and not text.startswith(ERROR_PREFIXES):
+            yield engine, text
+
+
+def _normalize_date(value, heure=None):
+    day, month, year = re.split(r'[/-]', value)
+    date = f"{int(day):02d}/{int(month):02d}/{year}"
+    return f"{date} {heure.replace('h', ':')}" if heure else date
+
+
+class TemplateRegistry:
+    """
+    Ensemble des gabarits avec l'expression d'identification combinée
+    """
+
+    def __init__(self, templates):
+        self.templates = {template.name: template for template in templates}
+        self._groups = {}
+        alternatives = []
+        for index, template in enumerate(self.templates.values()):
+            group = f't{index}'
+            self._groups[group] = template
+            alternatives.append(f"(?P<{group}>{'|'.join(f'(?:{p})' for p in template.identify)})")
+        self._identify = re.compile('|'.join(alternatives), re.IGNORECASE) if alternatives else None
+
+    def identify(self, text):
+        """
+        Gabarit de l'enseigne dont un motif apparaît dans l'en-tête du texte, ou None
+        """
+        if self._identify is None or not text:
+            return None
+        match = self._identify.search(text, 0, header_end(text))
+        return self._groups[match.lastgroup] if match else None
+
+
+def _load_file(path):
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    return [MerchantTemplate.from_dict(item, source=path) for item in (data if isinstance(data, list) else [data])]
+
+
+def _template_files():
+    files = [BUILTIN_TEMPLATES]
+    directory = getattr(settings, 'MERCHANT_TEMPLATES_DIR', None)
+    if directory and os.path.isdir(directory):
+        files.extend(sorted(entry.path for entry in os.scandir(directory) if entry.name.endswith('.json')))
+    return files
+
+
+_registry = None
+_signature = None
+
+
+def get_registry():
+    """
+    Registre des gabarits, rechargé si un fichier de gabarits a été ajouté ou modifié
+    """
+    global _registry, _signature
+    files = _template_files()
+    signature = tuple((path, os.path.getmtime(path)) for path in files)
+    if signature != _signature:
+        templates = {}
+        for path in files:
+            try:
+                for template in _load_file(path):
+                    templates[template.name] = template  # un gabarit local remplace le gabarit fourni
+            except (OSError, ValueError, KeyError, re.error) as e:
+                logger.warning("Gabarit ignoré (%s): %s", path, e)
+        _registry, _signature = TemplateRegistry(templates.values()), signature
+    return _registry
+
+
+def analyze_with_template(ocr_results):
+    """
+    Analyse sans LLM d'un ticket d'enseigne connue ; None si aucun gabarit ne s'applique ou ne valide
+    """
+    registry = get_registry()
+    for engine, text in usable_texts(ocr_results):
+        template = registry.identify(text)
+        if template is None:
+            continue
+        result = template.parse(text)
+        if result is not None:
+            result.update({
+                "Commentaire": f"Données extraites par le gabarit {template.name} ({engine}), sans LLM",
+                "texte_fusionne": text,
+                "backend_used": f"template:{template.name}",
+            })
+            return result
+    return None
@@ -0,0 +1,43 @@
+# Generated by Django 5.2 on 2026-10-18 10:12
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def fill_content_hash(apps, schema_editor):
+    ExtractionHistory = apps.get_model('ocrapp', 'ExtractionHistory')
+    for extraction in ExtractionHistory.objects.filter(content_hash__isnull=True).iterator():
+        if not extraction.image:
+            continue
+        digest = hashlib.sha256()
+        try:
+            with extraction.image.open('rb') as f:
+                for chunk in f.chunks():
+                    digest.update(chunk)
+        except (OSError, ValueError):
+            # Fichier absent du disque : la ligne ne pourra pas servir de doublon
+            continue
+        extraction.content_hash = digest.hexdigest()
+        extraction.save(update_fields=['content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ocrapp', '0005_alter_extractionhistory_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='extractionhistory',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='extractionhistory',
+            name='analysis_data',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.RunPython(fill_content_hash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 11:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ocrapp', '0006_extractionhistory_content_hash_analysis_data'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='extractionhistory',
+            name='ocr_engines_used',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
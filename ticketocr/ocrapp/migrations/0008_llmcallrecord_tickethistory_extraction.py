@@ -0,0 +1,42 @@
+# Generated by Django 5.2 on 2026-10-18 12:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ocrapp', '0007_extractionhistory_ocr_engines_used'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tickethistory',
+            name='extraction',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='tickets', to='ocrapp.extractionhistory'),
+        ),
+        migrations.CreateModel(
+            name='LLMCallRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('analysis', models.CharField(max_length=50)),
+                ('backend', models.CharField(max_length=50)),
+                ('model', models.CharField(max_length=100)),
+                ('prompt_tokens', models.IntegerField(default=0)),
+                ('completion_tokens', models.IntegerField(default=0)),
+                ('tokens_estimated', models.BooleanField(default=False)),
+                ('duration_ms', models.FloatField(default=0)),
+                ('retries', models.IntegerField(default=0)),
+                ('outcome', models.CharField(choices=[('success', 'Succès'), ('error', 'Erreur'), ('cancelled', 'Annulé'), ('unavailable', 'Backend indisponible'), ('cache', 'Cache')], default='success', max_length=20)),
+                ('error', models.TextField(blank=True, default='')),
+                ('fallback_path', models.JSONField(blank=True, default=list)),
+                ('backend_used', models.CharField(blank=True, default='', max_length=50)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('extraction', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='llm_calls', to='ocrapp.extractionhistory')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
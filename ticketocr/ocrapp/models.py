@@ -1,14 +1,29 @@
+import json
+
 from django.db import models
 from django.utils import timezone
 
 class ExtractionHistory(models.Model):
     image = models.ImageField(upload_to='tickets/')
-    extracted_text = models.TextField(blank=True, null=True)
+    extracted_text = models.TextField(blank=True, null=True)  # Textes OCR par moteur (JSON)
+    content_hash = models.CharField(max_length=64, blank=True, null=True, db_index=True)  # SHA-256 du fichier
+    analysis_data = models.JSONField(default=dict, blank=True)  # Analyses LLM/Gemini déjà calculées
+    ocr_engines_used = models.JSONField(default=list, blank=True)  # Moteurs OCR lancés, dans l'ordre
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f"Ticket du {self.uploaded_at.strftime('%Y-%m-%d %H:%M:%S')}"
 
+    def get_ocr_results(self):
+        """Retourne les textes OCR stockés {'doctr': ..., 'tesseract': ..., 'docling': ...} ou {}"""
+        if not self.extracted_text:
+            return {}
+        try:
+            data = json.loads(self.extracted_text)
+        except (TypeError, ValueError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
 class TicketHistory(models.Model):
     """Historique des tickets analysés"""
     date_ticket = models.DateField()
@@ -19,6 +34,10 @@ class TicketHistory(models.Model):
     llm_analysis = models.JSONField(default=dict)  # Stocke l'analyse LLM complète
     tva_rate = models.DecimalField(max_digits=5, decimal_places=2, default=0)  # Taux de TVA en %
     tva_amount = models.DecimalField(max_digits=10, decimal_places=3, default=0)  # Montant TVA
+    # Upload d'origine (appels LLM, textes OCR) quand le ticket vient de l'analyse
+    extraction = models.ForeignKey(
+        ExtractionHistory, on_delete=models.SET_NULL, null=True, blank=True, related_name='tickets'
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -27,6 +46,37 @@ class TicketHistory(models.Model):
     def __str__(self):
         return f"{self.magasin} - {self.date_ticket} - {self.total} DT"
 
+class LLMCallRecord(models.Model):
+    """Un appel LLM (backend, tokens, durée, repli) fait pendant l'analyse d'un upload"""
+    OUTCOMES = [
+        ('success', 'Succès'),
+        ('error', 'Erreur'),
+        ('cancelled', 'Annulé'),
+        ('unavailable', 'Backend indisponible'),
+        ('cache', 'Cache'),
+    ]
+
+    extraction = models.ForeignKey(ExtractionHistory, on_delete=models.CASCADE, related_name='llm_calls')
+    analysis = models.CharField(max_length=50)  # Clé de l'analyse : 'llm', 'gemini'...
+    backend = models.CharField(max_length=50)  # 'ollama', 'huggingface', 'gemini', 'cache'
+    model = models.CharField(max_length=100)
+    prompt_tokens = models.IntegerField(default=0)
+    completion_tokens = models.IntegerField(default=0)
+    tokens_estimated = models.BooleanField(default=False)  # Tokens estimés (non rapportés par le backend)
+    duration_ms = models.FloatField(default=0)
+    retries = models.IntegerField(default=0)
+    outcome = models.CharField(max_length=20, choices=OUTCOMES, default='success')
+    error = models.TextField(blank=True, default='')
+    fallback_path = models.JSONField(default=list, blank=True)  # Modèles essayés jusqu'à cet appel inclus
+    backend_used = models.CharField(max_length=50, blank=True, default='')  # Backend retenu pour l'analyse
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.model} ({self.outcome}) - {self.duration_ms:.0f} ms"
+
 class AccountingEntry(models.Model):
     """Entrées comptables générées"""
     ticket = models.ForeignKey(TicketHistory, on_delete=models.CASCADE, related_name='accounting_entries')
@@ -0,0 +1,138 @@
+"""
+Cache des résultats OCR adressé par contenu.
+
+Clé = SHA-256 des octets du fichier + moteur + version du moteur/modèle
+(+ configuration du prétraitement et DPI des PDF). Re-téléverser la même
+photo sous un autre nom (aziza1_JAVITpX.jpg, aziza1_XX6Vlms.jpg, ...)
+réutilise donc le texte déjà extrait ; changer de modèle, de langue
+Tesseract ou de prétraitement invalide naturellement les entrées.
+"""
+import functools
+import hashlib
+import logging
+from importlib import metadata
+
+from django.conf import settings
+
+from .cache_store import SqliteCache
+from .ocr_models import get_doctr_config, get_tesseract_status
+from .page_source import DEFAULT_PDF_DPI, file_sha256
+from .preprocessing import get_preprocessing_signature
+
+logger = logging.getLogger(__name__)
+
+_cache = None
+
+# Les messages d'erreur des moteurs ne sont jamais mis en cache
+ERROR_PREFIXES = ('Erreur', 'Tesseract non disponible')
+
+
+def get_ocr_cache():
+    """
+    Retourne le cache OCR du processus, ou None s'il est désactivé (OCR_CACHE_ENABLED)
+    """
+    global _cache
+    if not getattr(settings, 'OCR_CACHE_ENABLED', True):
+        return None
+    if _cache is None:
+        path = getattr(settings, 'OCR_CACHE_PATH', None) or settings.BASE_DIR / 'ocr_cache.sqlite3'
+        _cache = SqliteCache(path, 'ocr', max_entries=getattr(settings, 'OCR_CACHE_MAX_ENTRIES', 5000))
+    return _cache
+
+
+def _package_version(*names):
+    for name in names:
+        try:
+            return metadata.version(name)
+        except metadata.PackageNotFoundError:
+            continue
+    return 'unknown'
+
+
+@functools.lru_cache(maxsize=None)
+def _engine_version_cached(engine, config):
+    if engine == 'tesseract':
+        return f"{get_tesseract_status()['version']}|{config}"
+    if engine == 'doctr':
+        return f"doctr {_package_version('python-doctr', 'doctr')}|{config}"
+    if engine == 'docling':
+        return f"docling {_package_version('docling')}|{config}"
+    return config
+
+
+def engine_version(engine):
+    """
+    Version du moteur et de sa configuration de modèle, incluse dans la clé de cache
+    """
+    if engine == 'tesseract':
+        config = getattr(settings, 'TESSERACT_LANG', 'fra+eng')
+    elif engine == 'doctr':
+        config = '/'.join(get_doctr_config())
+    elif engine == 'docling':
+        config = getattr(settings, 'DOCLING_PIPELINE_PROFILE', 'receipt')
+    else:
+        config = ''
+    return _engine_version_cached(engine, config)
+
+
+def ocr_cache_key(content_hash, engine):
+    parts = (
+        content_hash,
+        engine,
+        engine_version(engine),
+        get_preprocessing_signature(),
+        str(getattr(settings, 'OCR_PDF_DPI', DEFAULT_PDF_DPI)),
+    )
+    return hashlib.sha256('|'.join(parts).encode('utf-8')).hexdigest()
+
+
+def get_cached_text(engine, content_hash):
+    """
+    Texte OCR en cache pour ce contenu et ce moteur, ou None
+    """
+    cache = get_ocr_cache()
+    if cache is None or not content_hash:
+        return None
+    return cache.get(ocr_cache_key(content_hash, engine))
+
+
+def store_text(engine, content_hash, text):
+    cache = get_ocr_cache()
+    if cache is None or not content_hash or not isinstance(text, str):
+        return
+    if text.startswith(ERROR_PREFIXES):
+        return
+    cache.set(ocr_cache_key(content_hash, engine), text)
+
+
+def cached_ocr(engine):
+    """
+    Décorateur des fonctions extract_text_*(file_path, pages=None) : consulte le cache avant tout travail.
+    Avec des pages partagées, l'appelant (run_ocr_engines) a déjà consulté le cache et enregistre lui-même.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(file_path, pages=None):
+            if pages is not None or get_ocr_cache() is None:
+                return func(file_path, pages)
+            try:
+                content_hash = file_sha256(file_path)
+            except (OSError, TypeError):
+                # Fichier illisible : laisser le moteur produire son message d'erreur
+                return func(file_path, pages)
+
+            text = get_cached_text(engine, content_hash)
+            if text is not None:
+                logger.info("OCR %s: résultat en cache pour %s", engine, file_path)
+                return text
+
+            text = func(file_path, pages)
+            store_text(engine, content_hash, text)
+            return text
+        return wrapper
+    return decorator
+
+
+def ocr_cache_stats():
+    cache = get_ocr_cache()
+    return cache.stats() if cache is not None else None
@@ -0,0 +1,226 @@
+"""
+Fusion des textes OCR avant l'appel LLM.
+
+Les trois moteurs (doctr, tesseract, docling) produisent en grande partie le
+même texte : les coller tels quels dans le prompt triple les tokens d'entrée.
+build_consensus() aligne les sorties ligne à ligne (alignement global sur la
+similarité des lignes), vote caractère par caractère sur les lignes qui
+diffèrent (chiffres compris) et ne garde les variantes propres à chaque moteur
+que là où aucune majorité ne se dégage. ocr_prompt_text() insère ce texte
+consolidé dans les prompts quand LLM_PROMPT_OCR_MODE vaut 'consensus' et
+journalise l'estimation de tokens avant/après.
+"""
+import logging
+import math
+import re
+from collections import Counter
+from difflib import SequenceMatcher
+
+from django.conf import settings
+
+from .ocr_cache import ERROR_PREFIXES
+
+logger = logging.getLogger(__name__)
+
+# Ordre de préférence des moteurs (départage des votes et choix de la référence)
+ENGINE_PRIORITY = ('doctr', 'tesseract', 'docling')
+# Similarité minimale pour considérer deux lignes comme la même ligne du ticket
+MATCH_RATIO = 0.5
+# En dessous de cette similarité avec le consensus, la variante d'un moteur est conservée
+AGREEMENT_RATIO = 0.7
+
+
+def split_lines(text):
+    """
+    Lignes non vides d'un texte OCR, blancs regroupés ; le Markdown de docling (titres, gras,
+    tableaux) est aplati pour s'aligner sur les autres moteurs
+    """
+    lines = []
+    for line in (text or '').splitlines():
+        line = re.sub(r'^\s*#+\s*', '', line).replace('**', '').replace('|', ' ')
+        line = re.sub(r'\s+', ' ', line).strip()
+        if line and not re.fullmatch(r'[\s:-]+', line):
+            lines.append(line)
+    return lines
+
+
+def _similarity(a, b):
+    matcher = SequenceMatcher(None, a, b, autojunk=False)
+    if matcher.real_quick_ratio() < MATCH_RATIO or matcher.quick_ratio() < MATCH_RATIO:
+        return 0.0
+    return matcher.ratio()
+
+
+def _align(reference, other):
+    """
+    Alignement global (programmation dynamique) maximisant la similarité cumulée des paires de lignes ;
+    retourne {indice dans other: indice dans reference}
+    """
+    n, m = len(reference), len(other)
+    ratios = [[_similarity(reference[i], other[j]) for j in range(m)] for i in range(n)]
+    scores = [[0.0] * (m + 1) for _ in range(n + 1)]
+    for i in range(n - 1, -1, -1):
+        for j in range(m - 1, -1, -1):
+            best = max(scores[i + 1][j], scores[i][j + 1])
+            if ratios[i][j] >= MATCH_RATIO:
+                best = max(best, ratios[i][j] + scores[i + 1][j + 1])
+            scores[i][j] = best
+
+    pairs = {}
+    i = j = 0
+    while i < n and j < m:
+        ratio = ratios[i][j]
+        if ratio >= MATCH_RATIO and scores[i][j] == ratio + scores[i + 1][j + 1]:
+            pairs[j] = i
+            i += 1
+            j += 1
+        elif scores[i][j] == scores[i + 1][j]:
+            i += 1
+        else:
+            j += 1
+    return pairs
+
+
+def _vote_line(variants):
+    """
+    variants : {moteur: ligne}. Retourne (ligne consensus, sans majorité sur au moins un caractère)
+    """
+    counts = Counter(variants.values())
+    line, count = counts.most_common(1)[0]
+    if count * 2 > len(variants):
+        return line, False
+
+    # Référence : la variante la plus proche des autres (médoïde)
+    engines = list(variants)
+    medoid = max(
+        engines,
+        key=lambda e: (sum(_similarity(variants[e], variants[o]) for o in engines if o != e), -engines.index(e)),
+    )
+    reference = variants[medoid]
+    columns = [[char] for char in reference]
+    for engine in engines:
+        if engine == medoid:
+            continue
+        matcher = SequenceMatcher(None, reference, variants[engine], autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag in ('equal', 'replace') and i2 - i1 == j2 - j1:
+                for offset in range(i2 - i1):
+                    columns[i1 + offset].append(variants[engine][j1 + offset])
+
+    merged = []
+    unresolved = False
+    for column in columns:
+        char, count = Counter(column).most_common(1)[0]
+        if count * 2 <= len(variants) and len(set(column)) > 1:
+            unresolved = True
+            char = column[0]
+        merged.append(char)
+    return ''.join(merged), unresolved
+
+
+def build_consensus(ocr_results):
+    """
+    Retourne (texte consolidé, statistiques). Les moteurs vides ou en erreur sont ignorés ;
+    les lignes lues par un seul moteur sont préfixées par son nom, les désaccords sans
+    majorité sont suivis des variantes entre crochets.
+    """
+    texts = {
+        engine: split_lines(text)
+        for engine, text in sorted(ocr_results.items(), key=lambda item: _priority(item[0]))
+        if text and text.strip() and not text.startswith(ERROR_PREFIXES)
+    }
+    texts = {engine: lines for engine, lines in texts.items() if lines}
+    stats = {'engines': list(texts), 'lines': 0, 'agreed': 0, 'voted': 0, 'disputed': 0, 'single': 0}
+    if not texts:
+        return '', stats
+    if len(texts) == 1:
+        lines = next(iter(texts.values()))
+        stats.update(lines=len(lines), agreed=len(lines))
+        return '\n'.join(lines), stats
+
+    # Référence : le moteur qui a lu le plus de lignes
+    reference_engine = max(texts, key=lambda e: (len(texts[e]), -_priority(e)))
+    reference = texts[reference_engine]
+    slots = [{reference_engine: line} for line in reference]
+    inserted = {}  # indice de la ligne de référence précédente -> lignes lues par un seul moteur
+    for engine, lines in texts.items():
+        if engine == reference_engine:
+            continue
+        pairs = _align(reference, lines)
+        previous = -1
+        for j, line in enumerate(lines):
+            if j in pairs:
+                previous = pairs[j]
+                slots[previous][engine] = line
+            else:
+                inserted.setdefault(previous, []).append((engine, line))
+
+    output = []
+
+    def emit_single(index):
+        for engine, line in inserted.get(index, []):
+            output.append(f"[{engine}] {line}")
+            stats['single'] += 1
+
+    emit_single(-1)
+    for index, variants in enumerate(slots):
+        if len(variants) == 1:
+            engine, line = next(iter(variants.items()))
+            output.append(f"[{engine}] {line}")
+            stats['single'] += 1
+        elif len(set(variants.values())) == 1:
+            output.append(next(iter(variants.values())))
+            stats['agreed'] += 1
+        else:
+            line, unresolved = _vote_line(variants)
+            dissent = {
+                engine: variant for engine, variant in variants.items()
+                if variant != line and (unresolved or _similarity(line, variant) < AGREEMENT_RATIO)
+            }
+            if dissent:
+                details = ' | '.join(f"{engine}: {variant}" for engine, variant in dissent.items())
+                output.append(f"{line} [variantes {details}]")
+                stats['disputed'] += 1
+            else:
+                output.append(line)
+                stats['voted'] += 1
+        emit_single(index)
+
+    stats['lines'] = len(output)
+    return '\n'.join(output), stats
+
+
+def _priority(engine):
+    return ENGINE_PRIORITY.index(engine) if engine in ENGINE_PRIORITY else len(ENGINE_PRIORITY)
+
+
+def estimate_tokens(text):
+    """
+    Estimation grossière (≈ 4 caractères par token), suffisante pour comparer deux prompts
+    """
+    return math.ceil(len(text or '') / 4)
+
+
+def ocr_prompt_text(ocr_results, raw_text, label='LLM'):
+    """
+    Bloc OCR à insérer dans un prompt : raw_text (les textes bruts, comportement historique)
+    ou, si LLM_PROMPT_OCR_MODE vaut 'consensus', le texte consolidé des moteurs
+    """
+    if getattr(settings, 'LLM_PROMPT_OCR_MODE', 'raw') != 'consensus':
+        return raw_text
+
+    consensus, stats = build_consensus(ocr_results)
+    if len(stats['engines']) < 2:
+        return raw_text
+
+    block = (
+        f"Voici le texte OCR du ticket, consolidé à partir de {', '.join(stats['engines'])} "
+        "([moteur] = ligne lue par ce seul moteur, [variantes ...] = lectures divergentes) :\n\n"
+        f"--- OCR consolidé ---\n{consensus}"
+    )
+    before, after = estimate_tokens(raw_text), estimate_tokens(block)
+    logger.info(
+        "%s: prompt OCR consolidé, ~%d -> ~%d tokens (%d lignes : %d identiques, %d votées, %d en désaccord, %d isolées)",
+        label, before, after, stats['lines'], stats['agreed'], stats['voted'], stats['disputed'], stats['single'],
+    )
+    return block
@@ -0,0 +1,136 @@
+"""
+Moteurs OCR (Doctr, Docling, Tesseract).
+
+Ce module ne dépend pas des modèles Django : il peut être importé tel quel
+par les processus workers du pool OCR (voir ocr_pipeline.py). Les
+bibliothèques lourdes sont importées dans les fonctions pour qu'un worker
+ne charge que le moteur qu'il exécute. Chaque moteur consulte d'abord le
+cache OCR adressé par contenu (ocr_cache.py).
+"""
+from pathlib import Path
+
+from django.conf import settings
+
+from .ocr_cache import cached_ocr
+from .ocr_models import get_doctr_predictor, get_docling_converter, get_tesseract_status, tesseract_image_to_string
+from .page_source import PageSourceError, load_pages
+
+
+@cached_ocr('doctr')
+def extract_text_doctr(file_path, pages=None):
+    try:
+        print(f"Doctr: Processing {file_path}")
+
+        # Décoder le fichier si aucune page partagée n'est fournie
+        owns_pages = pages is None
+        if owns_pages:
+            try:
+                pages = load_pages(file_path)
+            except PageSourceError as e:
+                error_msg = f"Erreur Doctr: {e}"
+                print(error_msg)
+                return error_msg
+
+        try:
+            import numpy as np
+
+            images = [np.asarray(img) for img in pages.images()]
+        except Exception as e:
+            error_msg = f"Erreur Doctr: impossible d'ouvrir l'image: {e}"
+            print(error_msg)
+            return error_msg
+        finally:
+            if owns_pages:
+                pages.cleanup()
+
+        if getattr(settings, 'DOCTR_BATCHING_ENABLED', False):
+            # Regrouper avec les pages des autres tickets en attente dans ce processus
+            from .doctr_batcher import get_doctr_batcher
+
+            extracted_text = get_doctr_batcher().submit(images).result()
+        else:
+            # Réutiliser le prédicteur Doctr du processus (chargé une seule fois)
+            model = get_doctr_predictor()
+
+            # Faire la prédiction
+            result = model(images)
+
+            # Extraire le texte brut
+            extracted_text = result.render()
+        print(f"Doctr: Extracted {len(extracted_text)} characters")
+        return extracted_text
+
+    except Exception as e:
+        error_msg = f"Erreur Doctr inattendue: {str(e)}"
+        print(error_msg)
+        return error_msg
+
+
+def _docling_text(document):
+    text_lines = {}
+    if hasattr(document, 'texts'):
+        for text_item in document.texts:
+            if hasattr(text_item, 'prov') and text_item.prov:
+                y_pos = sum([prov.bbox.t for prov in text_item.prov]) / len(text_item.prov)
+                text_lines[y_pos] = text_lines.get(y_pos, "") + " " + text_item.text
+
+    sorted_lines = sorted(text_lines.items(), key=lambda x: -x[0])
+    return "\n".join([line[1].strip() for line in sorted_lines])
+
+
+@cached_ocr('docling')
+def extract_text_docling(file_path, pages=None):
+    try:
+        print(f"Docling: Processing {file_path}")
+        converter = get_docling_converter()
+
+        # Pages déjà rastérisées/prétraitées : convertir les pages partagées au lieu du fichier d'origine
+        if pages is not None and pages.is_derived:
+            page_texts = [_docling_text(converter.convert(Path(page_path)).document) for page_path in pages.page_paths]
+            extracted_text = "\n".join(text for text in page_texts if text)
+        else:
+            result = converter.convert(Path(file_path))
+            extracted_text = _docling_text(result.document)
+
+        print(f"Docling: Extracted {len(extracted_text)} characters")
+        return extracted_text
+
+    except Exception as e:
+        error_msg = f"Erreur Docling: {str(e)}"
+        print(error_msg)
+        return error_msg
+
+
+@cached_ocr('tesseract')
+def extract_text_tesseract(file_path, pages=None):
+    try:
+        print(f"Tesseract: Processing {file_path}")
+        
+        # Vérifier si Tesseract est disponible (détection faite une seule fois par processus)
+        tesseract_status = get_tesseract_status()
+        if tesseract_status['backend'] is None:
+            error_msg = f"Tesseract non disponible: {tesseract_status['error']}\n\nPour installer Tesseract:\n1. Téléchargez: https://github.com/UB-Mannheim/tesseract/wiki\n2. Installez dans C:\\Program Files\\Tesseract-OCR\\\n3. Ajoutez au PATH système"
+            print(error_msg)
+            return error_msg
+        
+        owns_pages = pages is None
+        if owns_pages:
+            try:
+                pages = load_pages(file_path)
+            except PageSourceError as e:
+                return f"Erreur Tesseract: {e}"
+        
+        text = ""
+        try:
+            for img in pages.images():
+                text += tesseract_image_to_string(img) + "\n"
+        finally:
+            if owns_pages:
+                pages.cleanup()
+        extracted_text = text.strip()
+        print(f"Tesseract: Extracted {len(extracted_text)} characters")
+        return extracted_text
+    except Exception as e:
+        error_msg = f"Erreur Tesseract: {str(e)}"
+        print(error_msg)
+        return error_msg
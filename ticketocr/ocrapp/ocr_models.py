@@ -0,0 +1,221 @@
+"""
+Registre des modèles OCR partagés par processus worker.
+
+Les modèles sont construits paresseusement au premier appel puis réutilisés
+par toutes les requêtes (et par les traitements par lots) du même processus.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_registry_lock = threading.Lock()
+_doctr_predictors = {}
+_docling_converters = {}
+_tesseract_local = threading.local()
+_tesseract_status = None
+
+# Options du pipeline Docling désactivées par le profil "receipt" :
+# on ne consomme que document.texts et leurs bounding boxes.
+RECEIPT_DISABLED_DOCLING_OPTIONS = (
+    'do_table_structure',
+    'do_picture_classification',
+    'do_picture_description',
+    'do_code_enrichment',
+    'do_formula_enrichment',
+    'generate_page_images',
+    'generate_picture_images',
+)
+
+
+def get_doctr_config():
+    """
+    Retourne le couple (det_arch, reco_arch) configuré dans les settings
+    """
+    det_arch = getattr(settings, 'DOCTR_DET_ARCH', 'db_resnet50')
+    reco_arch = getattr(settings, 'DOCTR_RECO_ARCH', 'crnn_vgg16_bn')
+    return det_arch, reco_arch
+
+
+def get_doctr_predictor(det_arch=None, reco_arch=None):
+    """
+    Retourne le prédicteur Doctr du processus, construit une seule fois par architecture
+    """
+    default_det, default_reco = get_doctr_config()
+    key = (det_arch or default_det, reco_arch or default_reco)
+
+    predictor = _doctr_predictors.get(key)
+    if predictor is not None:
+        return predictor
+
+    with _registry_lock:
+        # Un autre thread a pu construire le modèle pendant l'attente du verrou
+        predictor = _doctr_predictors.get(key)
+        if predictor is None:
+            from doctr.models import ocr_predictor
+
+            start = time.perf_counter()
+            predictor = ocr_predictor(det_arch=key[0], reco_arch=key[1], pretrained=True)
+            _doctr_predictors[key] = predictor
+            logger.info("Doctr: prédicteur %s/%s chargé en %.2fs", key[0], key[1], time.perf_counter() - start)
+    return predictor
+
+
+def _build_docling_converter(profile):
+    """
+    Construit un DocumentConverter Docling selon le profil demandé ('receipt' ou 'default')
+    """
+    from docling.document_converter import DocumentConverter
+
+    if profile != 'receipt':
+        return DocumentConverter()
+
+    from docling.datamodel.base_models import InputFormat
+    from docling.datamodel.pipeline_options import PdfPipelineOptions
+    from docling.document_converter import ImageFormatOption, PdfFormatOption
+
+    pipeline_options = PdfPipelineOptions()
+    pipeline_options.do_ocr = True
+    for option in RECEIPT_DISABLED_DOCLING_OPTIONS:
+        if hasattr(pipeline_options, option):
+            setattr(pipeline_options, option, False)
+
+    return DocumentConverter(
+        allowed_formats=[InputFormat.PDF, InputFormat.IMAGE],
+        format_options={
+            InputFormat.PDF: PdfFormatOption(pipeline_options=pipeline_options),
+            InputFormat.IMAGE: ImageFormatOption(pipeline_options=pipeline_options),
+        },
+    )
+
+
+def get_docling_converter(profile=None):
+    """
+    Retourne le convertisseur Docling du processus pour le profil configuré (DOCLING_PIPELINE_PROFILE)
+    """
+    profile = profile or getattr(settings, 'DOCLING_PIPELINE_PROFILE', 'receipt')
+
+    converter = _docling_converters.get(profile)
+    if converter is not None:
+        return converter
+
+    with _registry_lock:
+        converter = _docling_converters.get(profile)
+        if converter is None:
+            start = time.perf_counter()
+            try:
+                converter = _build_docling_converter(profile)
+            except ImportError as e:
+                # Version de Docling sans options de pipeline : revenir au pipeline par défaut
+                logger.warning("Profil Docling '%s' indisponible (%s), pipeline par défaut utilisé", profile, e)
+                converter = _build_docling_converter('default')
+            _docling_converters[profile] = converter
+            logger.info("Docling: convertisseur '%s' construit en %.2fs", profile, time.perf_counter() - start)
+    return converter
+
+
+def _detect_tesseract():
+    """
+    Détermine le backend Tesseract utilisable : binding en processus (tesserocr) sinon pytesseract
+    """
+    try:
+        import tesserocr
+
+        version = tesserocr.tesseract_version().splitlines()[0]
+        return {'backend': 'tesserocr', 'version': version, 'error': None}
+    except ImportError:
+        pass
+    except Exception as e:
+        logger.warning("tesserocr présent mais inutilisable, repli sur pytesseract: %s", e)
+
+    try:
+        import pytesseract
+
+        version = pytesseract.get_tesseract_version()
+        return {'backend': 'pytesseract', 'version': f"tesseract {version}", 'error': None}
+    except Exception as e:
+        return {'backend': None, 'version': None, 'error': str(e)}
+
+
+def get_tesseract_status():
+    """
+    Retourne {'backend', 'version', 'error'} ; la détection n'est faite qu'une fois par processus
+    """
+    global _tesseract_status
+    if _tesseract_status is None:
+        with _registry_lock:
+            if _tesseract_status is None:
+                _tesseract_status = _detect_tesseract()
+                logger.info("Tesseract: backend=%s version=%s", _tesseract_status['backend'], _tesseract_status['version'])
+    return _tesseract_status
+
+
+def get_tesseract_api():
+    """
+    Retourne le handle tesserocr du thread courant, avec les traineddata déjà chargés.
+    L'API Tesseract n'est pas thread-safe : un handle persistant par thread worker.
+    """
+    api = getattr(_tesseract_local, 'api', None)
+    if api is None:
+        from tesserocr import PyTessBaseAPI
+
+        start = time.perf_counter()
+        lang = getattr(settings, 'TESSERACT_LANG', 'fra+eng')
+        tessdata = getattr(settings, 'TESSDATA_PREFIX', None)
+        api = PyTessBaseAPI(path=tessdata, lang=lang) if tessdata else PyTessBaseAPI(lang=lang)
+        _tesseract_local.api = api
+        logger.info("Tesseract: API '%s' chargée en %.2fs", lang, time.perf_counter() - start)
+    return api
+
+
+def tesseract_image_to_string(image):
+    """
+    OCR Tesseract d'une image PIL via le handle persistant, ou pytesseract en repli
+    """
+    if get_tesseract_status()['backend'] == 'tesserocr':
+        api = get_tesseract_api()
+        api.SetImage(image)
+        return api.GetUTF8Text()
+
+    import pytesseract
+
+    return pytesseract.image_to_string(image, lang=getattr(settings, 'TESSERACT_LANG', 'fra+eng'))
+
+
+def warmup_ocr_models(engines=None):
+    """
+    Charge les modèles et exécute une inférence à blanc pour que la première requête ne paie pas l'initialisation
+    """
+    engines = engines or ('tesseract', 'doctr', 'docling')
+    start = time.perf_counter()
+
+    if 'tesseract' in engines:
+        try:
+            if get_tesseract_status()['backend'] == 'tesserocr':
+                get_tesseract_api()
+        except Exception as e:
+            logger.warning("Warm-up Tesseract impossible: %s", e)
+
+    if 'doctr' in engines:
+        try:
+            import numpy as np
+
+            predictor = get_doctr_predictor()
+            predictor([np.full((64, 64, 3), 255, dtype=np.uint8)])
+        except Exception as e:
+            logger.warning("Warm-up Doctr impossible: %s", e)
+
+    if 'docling' in engines:
+        try:
+            converter = get_docling_converter()
+            if hasattr(converter, 'initialize_pipeline'):
+                from docling.datamodel.base_models import InputFormat
+
+                converter.initialize_pipeline(InputFormat.IMAGE)
+        except Exception as e:
+            logger.warning("Warm-up Docling impossible: %s", e)
+
+    logger.info("Warm-up OCR (%s) terminé en %.2fs", ', '.join(engines), time.perf_counter() - start)
@@ -0,0 +1,312 @@
+"""
+Exécution concurrente des trois moteurs OCR.
+
+Chaque moteur dispose de sa propre "voie" (pool de workers) : un worker ne
+charge ainsi que le modèle du moteur qu'il exécute, et les trois moteurs
+tournent en parallèle pour un même ticket. La latence d'une requête devient
+celle du moteur le plus lent au lieu de la somme des trois. L'upload est
+décodé une seule fois (page_source.py) et les pages sont partagées.
+
+Modes (settings.OCR_EXECUTOR) :
+- 'process' : un ProcessPoolExecutor par moteur (par défaut, moteurs CPU-bound)
+- 'thread'  : un ThreadPoolExecutor par moteur (développement, pas de fork)
+- 'serial'  : exécution séquentielle dans le processus courant
+
+settings.OCR_MODE = 'adaptive' remplace le fan-out par une escalade
+(run_ocr_adaptive) : le moteur le moins coûteux d'abord, les suivants
+seulement si son texte ne passe pas la validation.
+"""
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+from .ocr_engines import extract_text_doctr, extract_text_docling, extract_text_tesseract
+from .health import backend_available, get_breaker, record_failure, record_success
+from .ocr_cache import ERROR_PREFIXES, get_cached_text, store_text
+from .ocr_models import warmup_ocr_models
+from .page_source import PageSourceError, file_sha256, load_pages
+
+logger = logging.getLogger(__name__)
+
+OCR_ENGINES = {
+    'tesseract': extract_text_tesseract,
+    'doctr': extract_text_doctr,
+    'docling': extract_text_docling,
+}
+
+# Mode adaptatif : du moteur le moins coûteux au plus coûteux
+DEFAULT_ADAPTIVE_ORDER = ('tesseract', 'doctr', 'docling')
+
+DEFAULT_ENGINE_TIMEOUTS = {
+    'tesseract': 60,
+    'doctr': 120,
+    'docling': 180,
+}
+
+_lanes = {}
+_lanes_lock = threading.Lock()
+_warmup_thread = None
+
+
+def _get_mode():
+    return getattr(settings, 'OCR_EXECUTOR', 'process')
+
+
+def _get_timeout(engine):
+    timeouts = getattr(settings, 'OCR_ENGINE_TIMEOUTS', {}) or {}
+    return timeouts.get(engine, DEFAULT_ENGINE_TIMEOUTS[engine])
+
+
+def _init_lane_worker(engine):
+    """
+    Initialiseur des workers : précharge le modèle du moteur de la voie
+    """
+    if getattr(settings, 'OCR_WARMUP_ON_STARTUP', False):
+        warmup_ocr_models([engine])
+
+
+def _noop():
+    return None
+
+
+def _get_lane(engine):
+    """
+    Retourne (ou crée) le pool dédié à un moteur
+    """
+    lane = _lanes.get(engine)
+    if lane is not None:
+        return lane
+
+    with _lanes_lock:
+        lane = _lanes.get(engine)
+        if lane is None:
+            workers = getattr(settings, 'OCR_POOL_WORKERS_PER_ENGINE', 1)
+            if _get_mode() == 'thread':
+                lane = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'ocr-{engine}')
+            else:
+                if engine == 'doctr' and getattr(settings, 'DOCTR_BATCHING_ENABLED', False):
+                    # Un worker de la voie traite un ticket à la fois : rien à regrouper entre uploads
+                    logger.warning("DOCTR_BATCHING_ENABLED sans effet avec OCR_EXECUTOR='process' "
+                                   "(lots limités aux pages d'un même ticket)")
+                context = multiprocessing.get_context(getattr(settings, 'OCR_POOL_START_METHOD', 'spawn'))
+                lane = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=context,
+                    initializer=_init_lane_worker,
+                    initargs=(engine,),
+                )
+            _lanes[engine] = lane
+    return lane
+
+
+def _reset_lane(engine):
+    """
+    Abandonne le pool d'un moteur bloqué ou cassé ; il sera recréé au prochain appel.
+    Les workers process encore occupés sont terminés pour libérer le CPU.
+    """
+    with _lanes_lock:
+        lane = _lanes.pop(engine, None)
+    if lane is None:
+        return
+
+    processes = list((getattr(lane, '_processes', None) or {}).values())
+    lane.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        try:
+            process.terminate()
+        except Exception as e:
+            logger.warning("Impossible de terminer le worker OCR %s: %s", engine, e)
+
+
+def run_ocr_engines(file_path, engines=None):
+    """
+    Lance les moteurs OCR en parallèle et retourne {'tesseract': ..., 'doctr': ..., 'docling': ...}.
+    Un moteur en erreur ou hors délai renvoie un message d'erreur, comme les fonctions extract_text_*.
+    """
+    engines = list(engines or OCR_ENGINES)
+    start = time.perf_counter()
+
+    # Résultats déjà en cache : ni décodage ni envoi aux workers pour ces moteurs
+    try:
+        content_hash = file_sha256(file_path)
+    except (OSError, TypeError):
+        content_hash = None
+    cached = {}
+    for engine in engines:
+        text = get_cached_text(engine, content_hash)
+        if text is not None:
+            cached[engine] = text
+    to_run = [engine for engine in engines if engine not in cached]
+    if not to_run:
+        logger.info("OCR entièrement servi par le cache pour %s", file_path)
+        return cached
+
+    # Décoder l'upload une seule fois ; en cas d'échec chaque moteur rapporte sa propre erreur
+    try:
+        pages = load_pages(file_path, content_hash=content_hash)
+    except PageSourceError as e:
+        logger.warning("Source de pages indisponible pour %s: %s", file_path, e)
+        pages = None
+
+    try:
+        results = _run_engines(file_path, pages, to_run, start)
+    finally:
+        if pages is not None:
+            pages.cleanup()
+    for engine in to_run:
+        store_text(engine, content_hash, results[engine])
+    results.update(cached)
+    return {engine: results[engine] for engine in engines}
+
+
+def _record_result(engine, text):
+    # Les moteurs signalent leurs échecs par un texte "Erreur ..." plutôt qu'une exception
+    if isinstance(text, str) and text.startswith(ERROR_PREFIXES):
+        record_failure(engine, text)
+    else:
+        record_success(engine)
+
+
+def _run_engines(file_path, pages, engines, start):
+    # Moteur connu comme indisponible (disjoncteur ouvert, voir health.py) : ignoré sans attendre son délai
+    results = {}
+    for engine in engines:
+        if not backend_available(engine):
+            results[engine] = f"Erreur {engine}: moteur indisponible ({get_breaker(engine).snapshot()['last_error']})"
+    engines_to_run = [engine for engine in engines if engine not in results]
+
+    if _get_mode() == 'serial':
+        for engine in engines_to_run:
+            try:
+                results[engine] = OCR_ENGINES[engine](file_path, pages)
+            except Exception as e:
+                # Même message d'erreur que les voies process/thread : les autres moteurs continuent
+                results[engine] = f"Erreur {engine}: {e}"
+                record_failure(engine, e)
+                continue
+            _record_result(engine, results[engine])
+        logger.info("OCR séquentiel terminé en %.2fs", time.perf_counter() - start)
+        return {engine: results[engine] for engine in engines}
+
+    futures = {}
+    for engine in engines_to_run:
+        try:
+            futures[engine] = _get_lane(engine).submit(OCR_ENGINES[engine], file_path, pages)
+        except (BrokenProcessPool, RuntimeError) as e:
+            _reset_lane(engine)
+            results[engine] = f"Erreur {engine}: pool OCR indisponible: {e}"
+            record_failure(engine, e)
+
+    # Chaque moteur a son propre délai, compté depuis la soumission commune
+    for engine, future in futures.items():
+        remaining = max(0.0, _get_timeout(engine) - (time.perf_counter() - start))
+        try:
+            results[engine] = future.result(timeout=remaining)
+            _record_result(engine, results[engine])
+        except FutureTimeoutError:
+            if not future.cancel():
+                # Déjà en cours d'exécution : seul l'arrêt du worker libère la voie
+                _reset_lane(engine)
+            results[engine] = f"Erreur {engine}: délai dépassé ({_get_timeout(engine)}s)"
+            logger.warning("OCR %s annulé après %ss", engine, _get_timeout(engine))
+            record_failure(engine, results[engine])
+        except BrokenProcessPool as e:
+            _reset_lane(engine)
+            results[engine] = f"Erreur {engine}: worker OCR interrompu: {e}"
+            record_failure(engine, e)
+        except Exception as e:
+            results[engine] = f"Erreur {engine}: {e}"
+            record_failure(engine, e)
+
+    logger.info("OCR parallèle (%s) terminé en %.2fs", ', '.join(engines), time.perf_counter() - start)
+    return {engine: results[engine] for engine in engines}
+
+
+def run_ocr_adaptive(file_path, validate, order=None, known=None):
+    """
+    Lance les moteurs un par un dans l'ordre OCR_ADAPTIVE_ORDER et s'arrête dès qu'un texte passe
+    validate(texte). known contient des textes déjà extraits (réutilisés sans relancer le moteur).
+    Retourne (résultats par moteur, moteurs utilisés) ; un moteur non lancé a un texte vide.
+    """
+    order = [engine for engine in (order or getattr(settings, 'OCR_ADAPTIVE_ORDER', DEFAULT_ADAPTIVE_ORDER))
+             if engine in OCR_ENGINES]
+    known = known or {}
+    results = {engine: '' for engine in OCR_ENGINES}
+    engines_used = []
+    validated = False
+    start = time.perf_counter()
+
+    try:
+        content_hash = file_sha256(file_path)
+    except (OSError, TypeError):
+        content_hash = None
+
+    pages = None
+    pages_loaded = False
+    try:
+        for engine in order:
+            text = known.get(engine) or get_cached_text(engine, content_hash)
+            if not text:
+                # Décoder l'upload au premier moteur réellement exécuté, une seule fois
+                if not pages_loaded:
+                    pages_loaded = True
+                    try:
+                        pages = load_pages(file_path, content_hash=content_hash)
+                    except PageSourceError as e:
+                        logger.warning("Source de pages indisponible pour %s: %s", file_path, e)
+                text = _run_engines(file_path, pages, [engine], time.perf_counter())[engine]
+                store_text(engine, content_hash, text)
+
+            results[engine] = text
+            engines_used.append(engine)
+            if isinstance(text, str) and text and not text.startswith(ERROR_PREFIXES):
+                try:
+                    validated = bool(validate(text))
+                except Exception as e:
+                    logger.warning("Validation OCR %s en échec: %s", engine, e)
+                if validated:
+                    break
+    finally:
+        if pages is not None:
+            pages.cleanup()
+
+    logger.info(
+        "OCR adaptatif: %s en %.2fs (%s)",
+        ' -> '.join(engines_used), time.perf_counter() - start, 'validé' if validated else 'non validé',
+    )
+    return results, engines_used
+
+
+def warmup_ocr_engines():
+    """
+    Démarre les voies OCR et précharge leurs modèles (dans les workers en mode process)
+    """
+    if _get_mode() == 'process':
+        futures = [_get_lane(engine).submit(_noop) for engine in OCR_ENGINES]
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                logger.warning("Warm-up du pool OCR impossible: %s", e)
+    else:
+        warmup_ocr_models()
+
+
+def schedule_warmup():
+    """
+    Lance le warm-up en arrière-plan au démarrage du serveur (si activé dans les settings)
+    """
+    global _warmup_thread
+    if not getattr(settings, 'OCR_WARMUP_ON_STARTUP', False):
+        return None
+    with _lanes_lock:
+        if _warmup_thread is None:
+            _warmup_thread = threading.Thread(target=warmup_ocr_engines, name='ocr-warmup', daemon=True)
+            _warmup_thread.start()
+    return _warmup_thread
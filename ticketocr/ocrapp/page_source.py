@@ -0,0 +1,217 @@
+"""
+Source de pages partagée par les moteurs OCR.
+
+Un upload est décodé une seule fois en images de pages : les PDF sont
+rastérisés à une résolution contrôlée (OCR_PDF_DPI), chaque page passe par
+le prétraitement (preprocessing.py) et les pages sont écrites en PNG,
+éventuellement dans un cache disque (OCR_PAGE_CACHE_DIR) indexé par le hash
+du fichier et la configuration du prétraitement. Tesseract, Doctr et Docling consomment
+ensuite ces mêmes pages au lieu de re-décoder le fichier chacun de leur côté.
+"""
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+
+from .preprocessing import DEFAULT_MAX_SIDE, get_preprocessing_signature, get_preprocessing_steps, preprocess_image
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PDF_DPI = 200
+
+
+class PageSourceError(Exception):
+    """Le fichier n'a pas pu être décodé en pages"""
+
+
+class PageSource:
+    """
+    Pages d'un upload : chemins des images sur disque + images PIL chargées à la demande.
+
+    Seuls les chemins sont sérialisés (pickle) : un worker process recharge les
+    PNG déjà rastérisés au lieu de recevoir les pixels ou de re-rastériser le PDF.
+    """
+
+    def __init__(self, file_path, page_paths, images=None, temp_dir=None, content_hash=None):
+        self.file_path = file_path
+        self.page_paths = list(page_paths)
+        self.is_pdf = os.path.splitext(file_path)[1].lower() == '.pdf'
+        # Pages dérivées (PDF rastérisé ou image prétraitée) plutôt que le fichier d'origine
+        self.is_derived = self.page_paths != [file_path]
+        self._images = images
+        self._temp_dir = temp_dir
+        self._content_hash = content_hash
+
+    def __len__(self):
+        return len(self.page_paths)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_images'] = None
+        # Le répertoire temporaire reste la propriété du processus qui l'a créé
+        state['_temp_dir'] = None
+        return state
+
+    @property
+    def content_hash(self):
+        """
+        SHA-256 des octets du fichier d'origine (calculé une fois, transmis aux workers)
+        """
+        if self._content_hash is None:
+            self._content_hash = file_sha256(self.file_path)
+        return self._content_hash
+
+    def images(self):
+        """
+        Retourne les pages en images PIL RGB (chargées une seule fois par processus)
+        """
+        if self._images is None:
+            from PIL import Image
+
+            images = []
+            for path in self.page_paths:
+                with Image.open(path) as img:
+                    images.append(img.convert('RGB'))
+            self._images = images
+        return self._images
+
+    def cleanup(self):
+        """
+        Supprime les pages temporaires (les pages du cache disque sont conservées)
+        """
+        if self._temp_dir:
+            shutil.rmtree(self._temp_dir, ignore_errors=True)
+            self._temp_dir = None
+
+
+def file_sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _rasterize_pdf(file_path, dpi):
+    try:
+        from pdf2image import convert_from_path
+    except Exception as e:
+        raise PageSourceError(f"pdf2image non disponible pour convertir le PDF: {e}")
+
+    try:
+        images = convert_from_path(file_path, dpi=dpi)
+    except Exception as e:
+        raise PageSourceError(f"impossible de convertir le PDF en images: {e}")
+    if not images:
+        raise PageSourceError('Aucune page convertie depuis le PDF')
+    return images
+
+
+def _open_image(file_path, max_side=None):
+    from PIL import Image
+
+    try:
+        with Image.open(file_path) as img:
+            if max_side and max(img.size) > max_side:
+                # JPEG : décodage directement à l'échelle 1/2, 1/4 ou 1/8 (jamais sous max_side)
+                ratio = max_side / float(max(img.size))
+                img.draft('RGB', (int(img.width * ratio), int(img.height * ratio)))
+            img.load()
+            return [img.copy()]
+    except Exception as e:
+        raise PageSourceError(f"impossible d'ouvrir l'image: {e}")
+
+
+def _decode_pages(file_path, dpi, steps, output_dir):
+    """
+    Décode le fichier en pages, applique le prétraitement et écrit chaque page en PNG ;
+    toute erreur est levée en PageSourceError
+    """
+    is_pdf = os.path.splitext(file_path)[1].lower() == '.pdf'
+    if is_pdf:
+        images = _rasterize_pdf(file_path, dpi)
+    else:
+        max_side = getattr(settings, 'OCR_MAX_IMAGE_SIDE', DEFAULT_MAX_SIDE) if 'downscale' in steps else None
+        images = _open_image(file_path, max_side)
+
+    page_images = []
+    page_paths = []
+    for index, image in enumerate(images, 1):
+        try:
+            if steps:
+                image = preprocess_image(image, steps, label=f'{os.path.basename(file_path)} p{index}')
+            page_path = os.path.join(output_dir, f'page_{index:03d}.png')
+            image.save(page_path, format='PNG')
+            page_images.append(image.convert('RGB'))
+        except Exception as e:
+            raise PageSourceError(f"impossible de préparer la page {index}: {e}") from e
+        page_paths.append(page_path)
+    return page_images, page_paths
+
+
+def _cached_page_paths(pages_dir):
+    return sorted(os.path.join(pages_dir, name) for name in os.listdir(pages_dir) if name.endswith('.png'))
+
+
+def load_pages(file_path, dpi=None, cache_dir=None, content_hash=None):
+    """
+    Décode un upload (image ou PDF) une seule fois, le prétraite et retourne un PageSource.
+    content_hash évite de re-hacher le fichier si l'appelant l'a déjà calculé.
+    """
+    if not file_path or not os.path.exists(file_path):
+        raise PageSourceError(f"fichier introuvable: {file_path}")
+
+    is_pdf = os.path.splitext(file_path)[1].lower() == '.pdf'
+    steps = get_preprocessing_steps()
+    if not is_pdf and not steps:
+        # Image sans prétraitement : pas de conversion, décodage à la demande
+        return PageSource(file_path, [file_path], content_hash=content_hash)
+
+    dpi = dpi or getattr(settings, 'OCR_PDF_DPI', DEFAULT_PDF_DPI)
+    cache_dir = cache_dir or getattr(settings, 'OCR_PAGE_CACHE_DIR', None)
+    start = time.perf_counter()
+
+    if cache_dir:
+        # La clé inclut la configuration du prétraitement : la changer invalide le cache
+        content_hash = content_hash or file_sha256(file_path)
+        key = f'{content_hash}_{dpi}' if is_pdf else content_hash
+        pages_dir = os.path.join(str(cache_dir), f'{key}_{get_preprocessing_signature()}')
+        if os.path.isdir(pages_dir):
+            page_paths = _cached_page_paths(pages_dir)
+            if page_paths:
+                logger.info("Pages trouvées en cache: %s (%d pages)", pages_dir, len(page_paths))
+                return PageSource(file_path, page_paths, content_hash=content_hash)
+
+        # Décoder dans un répertoire de travail puis le publier d'un bloc
+        os.makedirs(str(cache_dir), exist_ok=True)
+        work_dir = tempfile.mkdtemp(dir=str(cache_dir))
+        try:
+            images, page_paths = _decode_pages(file_path, dpi, steps, work_dir)
+            try:
+                os.replace(work_dir, pages_dir)
+            except OSError:
+                # Un autre worker a publié les mêmes pages entre-temps
+                return PageSource(file_path, _cached_page_paths(pages_dir), content_hash=content_hash)
+        finally:
+            # Déjà renommé en pages_dir si la publication a réussi
+            shutil.rmtree(work_dir, ignore_errors=True)
+        page_paths = [os.path.join(pages_dir, os.path.basename(path)) for path in page_paths]
+        source = PageSource(file_path, page_paths, images=images, content_hash=content_hash)
+    else:
+        temp_dir = tempfile.mkdtemp(prefix='ocr_pages_')
+        decoded = False
+        try:
+            images, page_paths = _decode_pages(file_path, dpi, steps, temp_dir)
+            decoded = True
+        finally:
+            # Les pages décodées restent jusqu'à PageSource.cleanup()
+            if not decoded:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+        source = PageSource(file_path, page_paths, images=images, temp_dir=temp_dir, content_hash=content_hash)
+
+    logger.info("Upload décodé une fois (%d pages) en %.2fs", len(source), time.perf_counter() - start)
+    return source
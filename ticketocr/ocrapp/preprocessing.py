@@ -0,0 +1,204 @@
+"""
+Prétraitement des images de tickets avant OCR.
+
+Les photos de tickets prises au téléphone arrivent en pleine résolution,
+souvent tournées (EXIF), légèrement inclinées et entourées de la table ou
+du fond. Chaque page est normalisée une seule fois ici, puis l'image
+traitée est partagée par les trois moteurs (voir page_source.py).
+
+Étapes disponibles (settings.OCR_PREPROCESSING_STEPS, dans l'ordre donné) :
+- 'exif'      : applique l'orientation EXIF de l'appareil photo
+- 'downscale' : réduit le plus grand côté à OCR_MAX_IMAGE_SIDE pixels
+- 'grayscale' : passe en niveaux de gris
+- 'crop'      : recadre sur le ticket (papier clair sur fond plus sombre)
+- 'deskew'    : redresse une inclinaison de quelques degrés
+
+Les durées de chaque étape sont journalisées pour mesurer ce qu'elles apportent.
+"""
+import hashlib
+import logging
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STEPS = ('exif', 'downscale', 'grayscale', 'crop', 'deskew')
+DEFAULT_MAX_SIDE = 2000
+
+# Recherche de l'inclinaison : angles testés (degrés) et taille de l'image d'analyse
+DESKEW_MAX_ANGLE = 5.0
+DESKEW_STEP = 0.5
+DESKEW_MIN_ANGLE = 0.3
+ANALYSIS_SIDE = 800
+
+# Recadrage : proportion minimale de pixels "papier" d'une ligne/colonne et marge conservée
+CROP_MIN_PAPER_RATIO = 0.35
+CROP_MARGIN = 0.02
+
+
+def get_preprocessing_steps():
+    """
+    Retourne la liste des étapes configurées (vide si le prétraitement est désactivé)
+    """
+    if not getattr(settings, 'OCR_PREPROCESSING_ENABLED', True):
+        return []
+    steps = getattr(settings, 'OCR_PREPROCESSING_STEPS', DEFAULT_STEPS)
+    return [step for step in steps if step in STEPS]
+
+
+def get_preprocessing_signature():
+    """
+    Empreinte courte de la configuration, utilisée dans les clés de cache des pages
+    """
+    steps = get_preprocessing_steps()
+    if not steps:
+        return 'raw'
+    config = f"{','.join(steps)}|{getattr(settings, 'OCR_MAX_IMAGE_SIDE', DEFAULT_MAX_SIDE)}"
+    return hashlib.sha1(config.encode('utf-8')).hexdigest()[:10]
+
+
+def _exif(image):
+    from PIL import ImageOps
+
+    return ImageOps.exif_transpose(image)
+
+
+def _downscale(image):
+    max_side = getattr(settings, 'OCR_MAX_IMAGE_SIDE', DEFAULT_MAX_SIDE)
+    if max(image.size) <= max_side:
+        return image
+    from PIL import Image
+
+    ratio = max_side / float(max(image.size))
+    size = (max(1, int(image.width * ratio)), max(1, int(image.height * ratio)))
+    # reducing_gap : réduction entière rapide puis Lanczos sur la fin
+    return image.resize(size, Image.LANCZOS, reducing_gap=3.0)
+
+
+def _grayscale(image):
+    return image.convert('L')
+
+
+def _analysis_array(image):
+    """
+    Version réduite en niveaux de gris (numpy) pour les analyses de crop/deskew
+    """
+    import numpy as np
+
+    small = image.convert('L')
+    small.thumbnail((ANALYSIS_SIDE, ANALYSIS_SIDE))
+    return np.asarray(small, dtype=np.uint8), image.width / float(small.width), image.height / float(small.height)
+
+
+def _otsu_threshold(gray):
+    """
+    Seuil d'Otsu sur l'histogramme des niveaux de gris
+    """
+    import numpy as np
+
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    levels = np.arange(256)
+    weight_bg = np.cumsum(hist)
+    weight_fg = weight_bg[-1] - weight_bg
+    sum_bg = np.cumsum(hist * levels)
+    mean_bg = sum_bg / np.maximum(weight_bg, 1)
+    mean_fg = (sum_bg[-1] - sum_bg) / np.maximum(weight_fg, 1)
+    variance = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+    return int(np.argmax(variance))
+
+
+def _crop(image):
+    import numpy as np
+
+    gray, scale_x, scale_y = _analysis_array(image)
+    paper = gray > _otsu_threshold(gray)
+
+    rows = np.where(paper.mean(axis=1) >= CROP_MIN_PAPER_RATIO)[0]
+    cols = np.where(paper.mean(axis=0) >= CROP_MIN_PAPER_RATIO)[0]
+    if not len(rows) or not len(cols):
+        return image
+
+    top, bottom = rows[0], rows[-1] + 1
+    left, right = cols[0], cols[-1] + 1
+    margin_y = int(gray.shape[0] * CROP_MARGIN)
+    margin_x = int(gray.shape[1] * CROP_MARGIN)
+    box = (
+        int(max(0, left - margin_x) * scale_x),
+        int(max(0, top - margin_y) * scale_y),
+        int(min(gray.shape[1], right + margin_x) * scale_x),
+        int(min(gray.shape[0], bottom + margin_y) * scale_y),
+    )
+
+    # Ne recadrer que si le ticket est clairement délimité (ni tout le cadre, ni un fragment)
+    area_ratio = ((box[2] - box[0]) * (box[3] - box[1])) / float(image.width * image.height)
+    if area_ratio > 0.95 or area_ratio < 0.15:
+        return image
+    return image.crop(box)
+
+
+def _skew_angle(gray):
+    """
+    Angle maximisant la variance du profil de projection horizontal (lignes de texte alignées)
+    """
+    import numpy as np
+    from PIL import Image
+
+    ink = Image.fromarray(((gray < _otsu_threshold(gray)) * 255).astype(np.uint8))
+    best_angle, best_score = 0.0, None
+    steps = int(DESKEW_MAX_ANGLE / DESKEW_STEP)
+    for index in range(-steps, steps + 1):
+        angle = index * DESKEW_STEP
+        profile = np.asarray(ink.rotate(angle, resample=Image.NEAREST), dtype=np.float64).sum(axis=1)
+        score = float(np.var(profile))
+        if best_score is None or score > best_score:
+            best_angle, best_score = angle, score
+    return best_angle
+
+
+def _deskew(image):
+    from PIL import Image
+
+    gray, _, _ = _analysis_array(image)
+    angle = _skew_angle(gray)
+    if abs(angle) < DESKEW_MIN_ANGLE:
+        return image
+    fill = 255 if image.mode == 'L' else (255, 255, 255)
+    return image.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=fill)
+
+
+STEPS = {
+    'exif': _exif,
+    'downscale': _downscale,
+    'grayscale': _grayscale,
+    'crop': _crop,
+    'deskew': _deskew,
+}
+
+
+def preprocess_image(image, steps=None, label=''):
+    """
+    Applique les étapes de prétraitement à une image PIL et journalise la durée de chacune
+    """
+    steps = get_preprocessing_steps() if steps is None else steps
+    original_size = image.size
+    timings = []
+    total_start = time.perf_counter()
+
+    for step in steps:
+        start = time.perf_counter()
+        try:
+            image = STEPS[step](image)
+        except ImportError as e:
+            # numpy absent : l'étape est ignorée, le reste du pipeline continue
+            logger.warning("Prétraitement '%s' ignoré (%s)", step, e)
+        except Exception as e:
+            logger.warning("Prétraitement '%s' en échec pour %s: %s", step, label, e)
+        timings.append(f"{step}={(time.perf_counter() - start) * 1000:.0f}ms")
+
+    logger.info(
+        "Prétraitement %s: %dx%d -> %dx%d en %.0fms (%s)",
+        label, original_size[0], original_size[1], image.width, image.height,
+        (time.perf_counter() - total_start) * 1000, ', '.join(timings),
+    )
+    return image
@@ -0,0 +1,143 @@
+"""
+Découpage d'un texte OCR de ticket en jetons typés, en un seul passage.
+
+Une expression maîtresse précompilée parcourt le texte une fois (finditer) et
+produit des jetons date, prix, montant, total et libellé (texte qui précède le
+premier prix d'une ligne), chacun avec son numéro de ligne. Seuls les prix et
+les montants consomment le texte : comme avec les findall séparés de
+l'ancienne version, une date ou un prix collé à un autre nombre
+('1.12/05/2024', 'PAIN 1.2.500 DT', '1/05/2024.500 DT') reste trouvé.
+regex_elements() reconstruit à partir de ce flux le résultat historique de
+extraire_elements_avec_regex (dates valides, timbres, total, articles,
+cohérence de la somme), qui balayait auparavant le texte complet quatre fois
+avec des motifs recompilés à chaque appel, sur la concaténation des trois
+textes OCR.
+"""
+import re
+from collections import namedtuple
+from datetime import datetime
+
+from .amounts import CENTIME, TIMBRES_FISCAUX, ZERO, format_amount, parse_amount
+
+# kind : 'date', 'price' (montant en DT au format ticket, ex. 1.200 DT), 'amount' (autre montant en DT,
+# ex. 0,100 DT ou 0.1 DT, sans libellé ni article), 'total' (mot-clé Total), 'label' (nom d'article
+# devant le premier prix de la ligne).
+# value : date normalisée JJ/MM/AAAA (None si invalide), nombre du prix ou du montant, montant en DT qui
+# suit le mot-clé Total (None s'il n'y en a pas) ou libellé en minuscules ; line : numéro de ligne (0 = première).
+Token = namedtuple('Token', 'kind text value line start end')
+
+MOTS_INTERDITS = ('espece', 'rendu', 'recu', 'total', 'remise', 'timbre', 'fiscal', 'taxe', 'stamp', 'pece')
+
+# Une alternative par type de jeton (motifs historiques des dates, des prix et du total). Seuls les
+# prix consomment le texte (deux prix ne se chevauchent pas, comme avec findall), ainsi que les montants
+# que le motif des prix ne reconnaît pas (virgule décimale, une décimale : timbres '0,100 DT') ; la date et le
+# montant qui suit le mot-clé Total sont lus par anticipation, ce qui laisse trouver un prix qui les
+# chevauche. Deux types ne peuvent pas commencer à la même position. L'anticipation initiale écarte
+# d'emblée les positions qui ne peuvent commencer aucun jeton.
+_MASTER = re.compile(
+    r'(?=[\dTt])(?:'
+    r'(?=(?P<date>\b(?P<day>[0-3]?\d)[/-](?P<month>[0-1]?\d)[/-](?P<year>\d{4})\b))'
+    r'|(?P<price>\b(?P<price_number>\d+\.\d{2,3})\s?DT\b)'
+    r'|(?P<amount>\b(?P<amount_number>\d+[.,]\d{1,3})\s?DT\b)'
+    r'|(?P<total>Total|TOTAL|total)(?:(?=\s*[:\-]?\s*(?P<total_number>\d+\.\d{2,3})\s?DT))?'
+    r')'
+)
+_MOTS_INTERDITS = re.compile('|'.join(MOTS_INTERDITS))
+
+
+def _date_value(match):
+    try:
+        return datetime.strptime(f"{match['day']}/{match['month']}/{match['year']}", "%d/%m/%Y").strftime("%d/%m/%Y")
+    except ValueError:
+        return None
+
+
+def tokenize(text):
+    """
+    Produit les jetons de text dans l'ordre, en un seul passage
+    """
+    new = tuple.__new__  # construction directe des Token, sans passer par leur __new__ Python
+    line = 0
+    last = 0
+    labelled_line = -1  # dernière ligne pour laquelle un libellé a été émis
+    date_end = 0  # fin de la dernière date (dates sans chevauchement, comme findall)
+
+    for match in _MASTER.finditer(text):
+        kind = match.lastgroup
+        if kind == 'total_number':
+            kind = 'total'
+        start, end = match.span(kind)
+        if kind == 'date':
+            if start < date_end:
+                continue
+            date_end = end
+        line += text.count('\n', last, start)
+        last = start
+
+        if kind == 'price':
+            price = match['price']
+            # Unité reportée à la ligne suivante : pas de libellé (lecture ligne par ligne)
+            if labelled_line != line and '\n' not in price:
+                labelled_line = line
+                line_start = text.rfind('\n', 0, start) + 1
+                label = text[line_start:start].strip()
+                yield new(Token, ('label', label, label.lower(), line, line_start, start))
+            yield new(Token, ('price', price, match['price_number'], line, start, end))
+        elif kind == 'amount':
+            yield new(Token, ('amount', match['amount'], match['amount_number'], line, start, end))
+        elif kind == 'date':
+            yield new(Token, ('date', match['date'], _date_value(match), line, start, end))
+        else:
+            yield new(Token, ('total', match['total'], match['total_number'], line, start, end))
+
+
+def regex_elements(text):
+    """
+    Résultat de extraire_elements_avec_regex reconstruit à partir du flux de jetons
+    """
+    if not text or not isinstance(text, str):
+        return {}
+
+    dates_valides = []
+    timbres = []
+    articles = []
+    somme_articles = ZERO
+    total = None
+    label = None
+
+    for token in tokenize(text):
+        kind = token.kind
+        if kind == 'label':
+            label = token
+            continue
+        if kind == 'price' or kind == 'amount':
+            # Montant d'un timbre fiscal quelle que soit son écriture (0.100 DT, 0,100 DT, 0.1 DT) ; pas de
+            # parse_timbre : un jeton a toujours des décimales, '500.00 DT' n'est pas un timbre en millimes
+            amount = parse_amount(token.value)
+            if amount in TIMBRES_FISCAUX:
+                timbres.append(format_amount(amount))
+            if kind == 'amount':
+                continue
+            if label is not None and label.end == token.start:
+                if not _MOTS_INTERDITS.search(label.value):
+                    articles.append({"nom": label.text, "prix": token.text})
+                    somme_articles += parse_amount(token.value)
+                label = None
+        elif kind == 'date':
+            if token.value:
+                dates_valides.append(token.value)
+        elif kind == 'total':
+            # Premier mot-clé Total suivi de son montant
+            if total is None and token.value is not None:
+                total = parse_amount(token.value)
+
+    total_correct = total is not None and abs(somme_articles - total) < CENTIME  # marge d'erreur 1 centime
+
+    return {
+        "dates_valides": dates_valides,
+        "timbres_fiscaux": timbres,
+        "total": f"{total:.3f} DT" if total is not None else "",
+        "articles": articles,
+        "somme_articles": f"{somme_articles:.3f} DT",
+        "total_coherent": total_correct,
+    }
@@ -0,0 +1,325 @@
+"""
+Induction hors ligne des gabarits d'enseigne à partir des tickets corrigés.
+
+Les TicketHistory enregistrés (magasin, numéro, date, articles et total validés
+ou corrigés par l'utilisateur) sont rapprochés des textes OCR de leur upload
+(ExtractionHistory). Pour chaque enseigne, learn_template() aligne les lignes
+OCR terminées par un montant sur les valeurs corrigées : lignes d'article
+(montant d'un article), de total, de timbre, de remise (lignes récurrentes
+inexpliquées quand les articles dépassent le total) ou à ignorer, mot-clé du
+numéro et mots distinctifs de l'en-tête. Le gabarit obtenu (format de
+merchant_templates.json) est mesuré par evaluate_template() : couverture
+(tickets extraits sans LLM) et exactitude de chaque règle par rapport aux
+valeurs corrigées. cross_validate() fait cette mesure sur des tickets écartés
+de l'apprentissage (validation croisée), les chiffres obtenus sur les tickets
+d'apprentissage étant optimistes.
+"""
+import re
+import unicodedata
+from collections import Counter
+from difflib import SequenceMatcher
+
+from .amounts import ZERO, parse_amount, split_timbre
+from .merchant_templates import (
+    PLACEHOLDERS, TOLERANCE, MerchantTemplate, header_end, parse_ocr_amount, usable_texts,
+)
+from .ocr_consensus import split_lines
+
+# Ligne terminée par un montant (éventuellement suivi de DT, '=' ou '*')
+_AMOUNT_AT_END = re.compile(r'(?:^|\s)(?P<prix>' + PLACEHOLDERS['montant'] + r')(?P<dt>\s*DT)?[\s=*]*$')
+_KEYWORD = re.compile(r'[^\W\d_]+')
+_HEADER_WORD = re.compile(r'[^\W\d_]{4,}')
+# Part minimale des tickets où une ligne inexpliquée doit revenir pour devenir une règle
+RECURRENCE = 0.2
+# Similarité minimale entre variantes OCR d'un même mot-clé (Total / TotaI / TOTAL)
+VARIANT_RATIO = 0.6
+# Nombre maximal de plis de la validation croisée (un ticket par pli en dessous : leave-one-out)
+FOLDS = 10
+RULES = ('total', 'articles', 'timbre', 'date', 'numero')
+
+
+class Sample:
+    """
+    Un ticket corrigé et les textes OCR de son upload
+    """
+
+    def __init__(self, ticket, ocr_results):
+        self.ticket_id = ticket.id
+        self.magasin = ticket.magasin
+        self.ocr_results = ocr_results
+        self.texts = [text for _, text in usable_texts(ocr_results)]
+        self.total = parse_amount(ticket.total, ZERO)
+        self.numero = (ticket.numero_ticket or '').strip()
+        self.date = ticket.date_ticket.strftime('%d/%m/%Y') if ticket.date_ticket else ''
+        # Prix saisis par l'utilisateur (nombres ou chaînes '3.990 DT'), timbre à part
+        self.articles, self.timbre = split_timbre(ticket.articles_data)
+
+    def headers(self):
+        return [text[:header_end(text)] for text in self.texts]
+
+
+def _ascii(text):
+    return unicodedata.normalize('NFKD', text or '').encode('ascii', 'ignore').decode('ascii')
+
+
+def merchant_key(magasin):
+    """
+    Nom de gabarit dérivé du magasin ('Géant Tunis' -> 'geant_tunis')
+    """
+    return '_'.join(re.findall(r'[a-z0-9]+', _ascii(magasin).lower()))
+
+
+def _magasin_words(magasin):
+    return set(re.findall(r'[A-Z0-9]{3,}', _ascii(magasin).upper()))
+
+
+def _keyword(head):
+    match = _KEYWORD.search(head)
+    return match.group().upper() if match else ''
+
+
+def _variants(counter):
+    """
+    Variantes OCR du mot-clé le plus fréquent (TOTAL, TOTAI...) ; liste vide si counter est vide
+    """
+    if not counter:
+        return []
+    best = counter.most_common(1)[0][0]
+    return sorted(word for word in counter if SequenceMatcher(None, word, best).ratio() >= VARIANT_RATIO)
+
+
+def _keyword_pattern(words):
+    # Mots-clés relevés en majuscules, la casse varie d'un ticket à l'autre (Total / TOTAL)
+    return '(?i:' + '|'.join(re.escape(word) for word in words) + ')'
+
+
+def _contains(header, word):
+    return word.lower() in header.lower()
+
+
+def _identify_words(samples, others):
+    """
+    Mots d'en-tête couvrant le plus de tickets de l'enseigne sans apparaître chez les autres (couverture gloutonne)
+    """
+    headers = [' '.join(sample.headers()) for sample in samples]
+    other_headers = [' '.join(sample.headers()) for sample in others]
+    candidates = Counter()
+    for sample, header in zip(samples, headers):
+        candidates.update({word.upper() for word in _HEADER_WORD.findall(header)})
+        candidates.update(_magasin_words(sample.magasin))
+
+    def covered(word):
+        return {index for index, header in enumerate(headers) if _contains(header, word)}
+
+    distinctive = [
+        word for word in candidates
+        if covered(word) and not any(_contains(header, word) for header in other_headers)
+    ]
+    magasin_words = _magasin_words(samples[0].magasin)
+    # À couverture égale : mot du nom du magasin, puis mot le plus long
+    distinctive.sort(key=lambda word: (len(covered(word)), word in magasin_words, len(word)), reverse=True)
+
+    chosen, remaining = [], set(range(len(samples)))
+    for word in distinctive:
+        gained = covered(word) & remaining
+        if gained:
+            chosen.append(word)
+            remaining -= gained
+        if not remaining or len(chosen) == 3:
+            break
+    return chosen, 1 - len(remaining) / len(samples)
+
+
+def learn_template(name, magasin, samples, others=()):
+    """
+    Gabarit (dict au format merchant_templates.json) induit des tickets corrigés d'une enseigne, ou None
+    si les textes OCR ne permettent pas de retrouver l'en-tête ou la ligne de total
+    """
+    identify, _ = _identify_words(samples, others)
+    if not identify:
+        return None
+
+    # Mot-clé du total : début des lignes dont le montant est le total corrigé
+    total_words = Counter()
+    for sample in samples:
+        for text in sample.texts:
+            for line in split_lines(text):
+                match = _AMOUNT_AT_END.search(line)
+                if match and parse_ocr_amount(match['prix']) == sample.total:
+                    word = _keyword(line[:match.start()])
+                    if word:
+                        total_words[word] += 1
+    total_variants = _variants(total_words)
+    if not total_variants:
+        return None
+    is_total = re.compile(r'^' + _keyword_pattern(total_variants) + r'\b')
+
+    timbre_words, numero_words, unexplained = Counter(), Counter(), {}
+    refs = vat = with_dt = article_lines = 0
+    gross = set()  # tickets dont les articles corrigés dépassent le total (remises)
+    for index, sample in enumerate(samples):
+        if sum(sample.articles) + sample.timbre - sample.total >= TOLERANCE:
+            gross.add(index)
+        for text in sample.texts:
+            remaining = Counter(sample.articles)
+            for line in split_lines(text):
+                if sample.numero and sample.numero in line:
+                    words = _KEYWORD.findall(line[:line.index(sample.numero)])[-2:]
+                    if words:
+                        numero_words[tuple(word.upper() for word in words)] += 1
+                match = _AMOUNT_AT_END.search(line)
+                if not match:
+                    continue
+                head = line[:match.start()].strip()
+                if is_total.match(line):
+                    break
+                amount = parse_ocr_amount(match['prix'])
+                if amount is None:
+                    continue
+                if sample.timbre and abs(amount) == sample.timbre and _keyword(head):
+                    timbre_words[_keyword(head)] += 1
+                elif remaining[amount] > 0:
+                    remaining[amount] -= 1
+                    article_lines += 1
+                    refs += bool(re.match(r'[a-z]\s', head))
+                    vat += bool(re.search(r'\sV[A-Z]$', head))
+                    with_dt += bool(match['dt'])
+                elif _keyword(head):
+                    unexplained.setdefault(_keyword(head), set()).add(index)
+
+    template = {
+        'name': name,
+        'magasin': magasin,
+        'identify': [re.escape(word) for word in identify],
+        'date': '(?P<date>{date})(?:\\s+(?P<heure>{heure}))?',
+        'article': (
+            '^' + ('(?:(?P<ref>[a-z])\\s+)?' if refs else '')
+            + '(?P<nom>.*?[A-Za-z].*?)' + ('(?:\\s+V[A-Z])?' if vat else '')
+            + '\\s+(?P<prix>{montant})' + ('(?:\\s*DT)?' if with_dt else '') + '[\\s=*]*$'
+        ),
+        'total': '^' + _keyword_pattern(total_variants) + '\\b\\W*(?P<prix>{montant})',
+        'ignore': [],
+    }
+    if numero_words:
+        words = numero_words.most_common(1)[0][0]
+        template['numero'] = '(?i:' + '\\s*'.join(re.escape(word) for word in words) + ')\\W*(?P<numero>[A-Z]?\\d+)'
+    timbre_variants = _variants(timbre_words)
+    if timbre_variants:
+        template['timbre'] = _keyword_pattern(timbre_variants) + '\\b.*?(?P<prix>{montant})(?:\\s*DT)?[\\s=*]*$'
+
+    # Lignes inexpliquées récurrentes : remises si elles accompagnent des articles supérieurs au total,
+    # lignes à ignorer sinon
+    remises = []
+    for word, indexes in sorted(unexplained.items()):
+        if len(indexes) < max(2, RECURRENCE * len(samples)):
+            continue
+        if len(indexes & gross) * 2 > len(indexes):
+            remises.append(word)
+        else:
+            template['ignore'].append('^' + re.escape(word) + '\\b')
+    if remises:
+        template['remise'] = (
+            '^' + _keyword_pattern(remises) + '\\b.*?' + ('(?:\\s(?P<ref>[a-z]))?' if refs else '')
+            + '\\s+(?P<prix>{montant})(?:\\s*DT)?[\\s=*]*$'
+        )
+    template['learned'] = {'tickets': len(samples), 'article_lines': article_lines}
+    return template
+
+
+def _same_articles(amounts, sample):
+    """
+    Articles extraits conformes aux articles corrigés ; si l'utilisateur a saisi les prix avant remise,
+    les prix extraits (remise déduite) peuvent être inférieurs, un à un (dans l'ordre croissant)
+    """
+    amounts, expected = sorted(amounts), sorted(sample.articles)
+    if amounts == expected:
+        return True
+    return (
+        len(amounts) == len(expected)
+        and sum(expected) + sample.timbre - sample.total >= TOLERANCE
+        and all(amount <= price for amount, price in zip(amounts, expected))
+    )
+
+
+def _empty_counts():
+    return {
+        'tickets': 0, 'identified': 0, 'covered': 0, 'exact': 0, 'false_identifications': 0,
+        'rule_counts': {rule: [0, 0] for rule in RULES},  # [exacts, évalués]
+        'covered_ids': set(),
+    }
+
+
+def _count(template, samples, others, counts):
+    counts['tickets'] += len(samples)
+    counts['false_identifications'] += sum(
+        1 for sample in others if any(template.identifies(text) for text in sample.texts)
+    )
+    for sample in samples:
+        if any(template.identifies(text) for text in sample.texts):
+            counts['identified'] += 1
+        _, result = template.parse_ocr_results(sample.ocr_results)
+        if result is None:
+            continue
+        counts['covered'] += 1
+        counts['covered_ids'].add(sample.ticket_id)
+
+        articles, timbre = split_timbre(result['Articles'])
+        checks = {
+            'total': parse_amount(result['Total']) == sample.total,
+            'articles': _same_articles(articles, sample),
+            'timbre': timbre == sample.timbre,
+            'date': result['Date'].split()[0] == sample.date,
+        }
+        if sample.numero:
+            checks['numero'] = result['NumeroTicket'] == sample.numero
+        for rule, ok in checks.items():
+            counts['rule_counts'][rule][0] += ok
+            counts['rule_counts'][rule][1] += 1
+        counts['exact'] += all(checks.values())
+    return counts
+
+
+def _rates(counts):
+    stats = dict(counts)
+    stats['coverage'] = counts['covered'] / counts['tickets'] if counts['tickets'] else 0.0
+    stats['accuracy'] = counts['exact'] / counts['covered'] if counts['covered'] else 0.0
+    stats['rules'] = {
+        rule: (ok / evaluated if evaluated else None) for rule, (ok, evaluated) in counts['rule_counts'].items()
+    }
+    return stats
+
+
+def evaluate_template(template, samples, others=()):
+    """
+    Couverture et exactitude d'un gabarit (MerchantTemplate) sur les tickets corrigés de l'enseigne ;
+    others sert à compter les fausses identifications chez les autres enseignes
+    """
+    return _rates(_count(template, samples, others, _empty_counts()))
+
+
+def cross_validate(name, magasin, samples, others=(), folds=FOLDS):
+    """
+    Mêmes mesures que evaluate_template, hors apprentissage : tickets de l'enseigne et des autres
+    enseignes sont répartis en plis, et chaque pli est évalué avec le gabarit appris sur les autres.
+    Un pli pour lequel aucun gabarit n'est induit compte comme non couvert.
+    """
+    folds = max(2, min(folds, len(samples)))
+    others = list(others)
+    counts = _empty_counts()
+    for fold in range(folds):
+        train = [sample for index, sample in enumerate(samples) if index % folds != fold]
+        train_others = [sample for index, sample in enumerate(others) if index % folds != fold]
+        data = learn_template(name, magasin, train, train_others) if train else None
+        template = compile_template(data) if data else None
+        if template is None:
+            counts['tickets'] += len(samples[fold::folds])
+            continue
+        _count(template, samples[fold::folds], others[fold::folds], counts)
+    return _rates(counts)
+
+
+def compile_template(data):
+    try:
+        return MerchantTemplate.from_dict(data)
+    except (ValueError, KeyError, re.error):
+        return None
@@ -0,0 +1,97 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from ocrapp import health, ocr_pipeline, views
+
+COMPLETE = "Boulangerie\nDate: 19/07/2024\nPain 1.200 DT\nLait 0.900 DT\nTotal : 2.100 DT"
+INCOHERENT = "Boulangerie\nDate: 19/07/2024\nPain 1.200 DT\nTotal : 9.900 DT"
+
+
+@override_settings(OCR_EXECUTOR='serial', OCR_CACHE_ENABLED=False)
+class RunOcrAdaptiveTests(SimpleTestCase):
+
+    def setUp(self):
+        self.engines = {name: mock.Mock(return_value=INCOHERENT) for name in ocr_pipeline.OCR_ENGINES}
+        for patcher in (
+            mock.patch.dict(ocr_pipeline.OCR_ENGINES, self.engines),
+            mock.patch.dict(health._breakers, clear=True),
+            mock.patch.object(ocr_pipeline, 'load_pages'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def run_adaptive(self, **kwargs):
+        return ocr_pipeline.run_ocr_adaptive('ticket.jpg', views.ocr_text_is_complete,
+                                             order=['tesseract', 'doctr', 'docling'], **kwargs)
+
+    def test_stops_at_the_first_validated_text(self):
+        self.engines['tesseract'].return_value = COMPLETE
+        results, used = self.run_adaptive()
+        self.assertEqual(used, ['tesseract'])
+        self.assertEqual(results, {'tesseract': COMPLETE, 'doctr': '', 'docling': ''})
+        self.engines['doctr'].assert_not_called()
+        ocr_pipeline.load_pages.assert_called_once()
+
+    def test_escalates_while_the_text_is_incoherent(self):
+        self.engines['doctr'].return_value = COMPLETE
+        results, used = self.run_adaptive()
+        self.assertEqual(used, ['tesseract', 'doctr'])
+        self.assertEqual(results['doctr'], COMPLETE)
+        self.engines['docling'].assert_not_called()
+        # Pages décodées une seule fois pour les moteurs successifs
+        ocr_pipeline.load_pages.assert_called_once()
+
+    def test_engine_errors_escalate(self):
+        self.engines['tesseract'].side_effect = RuntimeError("tesseract absent")
+        self.engines['doctr'].return_value = COMPLETE
+        results, used = self.run_adaptive()
+        self.assertEqual(used, ['tesseract', 'doctr'])
+        self.assertEqual(results['tesseract'], "Erreur tesseract: tesseract absent")
+
+    def test_known_texts_are_not_recomputed(self):
+        results, used = self.run_adaptive(known={'tesseract': INCOHERENT, 'doctr': COMPLETE})
+        self.assertEqual(used, ['tesseract', 'doctr'])
+        for engine in self.engines.values():
+            engine.assert_not_called()
+        ocr_pipeline.load_pages.assert_not_called()
+
+    def test_all_engines_when_nothing_validates(self):
+        results, used = self.run_adaptive()
+        self.assertEqual(used, ['tesseract', 'doctr', 'docling'])
+
+
+class OcrTextIsCompleteTests(SimpleTestCase):
+
+    def test_threshold(self):
+        self.assertTrue(views.ocr_text_is_complete(COMPLETE))
+        self.assertFalse(views.ocr_text_is_complete(INCOHERENT))
+        self.assertFalse(views.ocr_text_is_complete(COMPLETE.replace("Date: 19/07/2024\n", "")))
+        self.assertFalse(views.ocr_text_is_complete(""))
+
+
+@override_settings(OCR_MODE='adaptive')
+class AdaptiveViewTests(TestCase):
+
+    def test_get_or_run_ocr_records_the_engines_used(self):
+        extraction = mock.Mock(id=1, extracted_text=None)
+        extraction.get_ocr_results.return_value = {'docling': "ancien texte"}
+        calls = []
+
+        def run_ocr_adaptive(file_path, validate, known=None):
+            calls.append((file_path, validate, dict(known)))
+            return {'tesseract': INCOHERENT, 'doctr': COMPLETE, 'docling': ''}, ['tesseract', 'doctr']
+
+        with mock.patch.object(views, 'run_ocr_adaptive', run_ocr_adaptive):
+            results = views.get_or_run_ocr(extraction)
+        self.assertEqual(calls, [(extraction.image.path, views.ocr_text_is_complete, {'docling': "ancien texte"})])
+        self.assertEqual(extraction.ocr_engines_used, ['tesseract', 'doctr'])
+        self.assertEqual(results, {'doctr': COMPLETE, 'tesseract': INCOHERENT, 'docling': "ancien texte"})
+
+    def test_resubmission_with_only_the_engines_used(self):
+        # En mode adaptatif, les moteurs non lancés n'envoient pas leur champ caché
+        with mock.patch.object(views, 'analyze_three_texts_with_llm', return_value={"Magasin": "B"}) as analyze:
+            response = self.client.post(reverse('upload_ticket'), {'ocr_tesseract': COMPLETE})
+        self.assertEqual(response.status_code, 200)
+        analyze.assert_called_once_with({'doctr': '', 'tesseract': COMPLETE, 'docling': ''})
@@ -0,0 +1,38 @@
+from decimal import Decimal
+
+from django.test import SimpleTestCase
+
+from ocrapp.amounts import format_amount, is_timbre_article, parse_amount, parse_timbre, split_timbre, sum_articles
+
+
+
+
+class AmountsTests(SimpleTestCase):
+
+    def test_parse_amount(self):
+        self.assertEqual(parse_amount('12,500'), Decimal('12.500'))
+        self.assertEqual(parse_amount('12.500 DT'), Decimal('12.500'))
+        self.assertEqual(parse_amount('1 234,500'), Decimal('1234.500'))
+        self.assertEqual(parse_amount('1.234,500'), Decimal('1234.500'))
+        self.assertEqual(parse_amount('- 4,010'), Decimal('-4.010'))
+        self.assertEqual(parse_amount(3.99), Decimal('3.99'))
+        self.assertEqual(parse_amount(7), Decimal(7))
+        self.assertIsNone(parse_amount('abc'))
+        self.assertIsNone(parse_amount(True))
+        self.assertEqual(parse_amount(None, Decimal('0')), Decimal('0'))
+
+    def test_timbre(self):
+        self.assertEqual(parse_timbre('100 DT'), Decimal('0.100'))
+        self.assertEqual(parse_timbre('0.200 DT'), Decimal('0.200'))
+        articles = [{"nom": "Pain", "prix": "1.200 DT"}, {"nom": "Timbre fiscal", "prix": "100"}, "invalide"]
+        self.assertEqual(split_timbre(articles), ([Decimal('1.200')], Decimal('0.100')))
+
+    def test_sum_and_format(self):
+        articles = [{"nom": "Pain", "prix": "1.200 DT"}, {"nom": "Lait", "prix": "illisible"}, {"nom": "Eau", "prix": "0,800"}]
+        self.assertEqual(sum_articles(articles), Decimal('2.000'))
+        self.assertEqual(format_amount(Decimal('12.5')), '12.500 DT')
+
+    def test_timbre_article(self):
+        self.assertTrue(is_timbre_article({"nom": "TIMBRE LOI FIN.2022", "prix": "0.100"}))
+        self.assertFalse(is_timbre_article({"nom": "Pain", "prix": "0.100"}))
+        self.assertFalse(is_timbre_article("Timbre"))
@@ -0,0 +1,91 @@
+import itertools
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from ocrapp import ocr_cache
+from ocrapp.cache_store import SqliteCache
+
+
+class SqliteCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cache.sqlite3')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_get_set_and_stats(self):
+        cache = SqliteCache(self.path, 'ocr')
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', 'valeur')
+        self.assertEqual(cache.get('a'), 'valeur')
+        self.assertIsNone(SqliteCache(self.path, 'llm').get('a'))
+        stats = SqliteCache(self.path, 'ocr').stats()
+        self.assertEqual((stats['entries'], stats['hits'], stats['misses'], stats['hit_rate']), (1, 1, 1, 0.5))
+
+    def test_lru_eviction(self):
+        cache = SqliteCache(self.path, 'ocr', max_entries=2)
+        with mock.patch('ocrapp.cache_store.time.time', side_effect=itertools.count(1)):
+            cache.set('a', '1')
+            cache.set('b', '2')
+            cache.get('a')
+            cache.set('c', '3')
+            self.assertEqual(cache.get('a'), '1')
+            self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_ttl(self):
+        cache = SqliteCache(self.path, 'ocr', ttl=10)
+        with mock.patch('ocrapp.cache_store.time.time', return_value=100):
+            cache.set('a', '1')
+        with mock.patch('ocrapp.cache_store.time.time', return_value=105):
+            self.assertEqual(cache.get('a'), '1')
+        with mock.patch('ocrapp.cache_store.time.time', return_value=111):
+            self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['entries'], 0)
+
+
+
+@override_settings(OCR_CACHE_ENABLED=True)
+class OcrCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        patcher = mock.patch.object(
+            ocr_cache, '_cache', SqliteCache(os.path.join(self.directory, 'ocr.sqlite3'), 'ocr'),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def test_same_content_under_another_name_is_served_from_cache(self):
+        engine = mock.Mock(return_value="TOTAL 4.090")
+        extract = ocr_cache.cached_ocr('doctr')(engine)
+        self.assertEqual(extract(self.write('aziza1_JAVITpX.jpg', b'image')), "TOTAL 4.090")
+        self.assertEqual(extract(self.write('aziza1_XX6Vlms.jpg', b'image')), "TOTAL 4.090")
+        self.assertEqual(extract(self.write('autre.jpg', b'autre image')), "TOTAL 4.090")
+        self.assertEqual(engine.call_count, 2)
+
+    def test_key_depends_on_engine(self):
+        ocr_cache.store_text('doctr', 'abc', "texte doctr")
+        self.assertEqual(ocr_cache.get_cached_text('doctr', 'abc'), "texte doctr")
+        self.assertIsNone(ocr_cache.get_cached_text('docling', 'abc'))
+
+    def test_errors_are_not_cached(self):
+        engine = mock.Mock(return_value="Erreur Doctr: impossible d'ouvrir l'image")
+        extract = ocr_cache.cached_ocr('doctr')(engine)
+        path = self.write('ticket.jpg', b'image')
+        extract(path)
+        extract(path)
+        self.assertEqual(engine.call_count, 2)
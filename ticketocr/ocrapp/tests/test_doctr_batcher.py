@@ -0,0 +1,69 @@
+import sys
+import types
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from ocrapp import doctr_batcher, ocr_pipeline
+
+
+class FakeDocument:
+
+    def __init__(self, pages):
+        self.pages = pages
+
+    def render(self):
+        return '\n'.join(self.pages)
+
+
+def doctr_modules():
+    elements = types.ModuleType('doctr.io.elements')
+    elements.Document = FakeDocument
+    return {'doctr': types.ModuleType('doctr'), 'doctr.io': types.ModuleType('doctr.io'), 'doctr.io.elements': elements}
+
+
+class DoctrBatcherTests(SimpleTestCase):
+
+    def setUp(self):
+        self.calls = []
+
+        def predictor(pages):
+            self.calls.append(list(pages))
+            return FakeDocument([f"texte {page}" for page in pages])
+
+        for patcher in (
+            mock.patch.dict(sys.modules, doctr_modules()),
+            mock.patch.object(doctr_batcher, 'get_doctr_predictor', return_value=predictor),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_tickets_share_one_batch(self):
+        batcher = doctr_batcher.DoctrBatcher(max_batch_size=8, max_wait=0.2)
+        futures = [batcher.submit(['a1', 'a2']), batcher.submit(['b1']), batcher.submit(['c1'])]
+        results = [future.result(timeout=5) for future in futures]
+        self.assertEqual(results, ["texte a1\ntexte a2", "texte b1", "texte c1"])
+        self.assertEqual(self.calls, [['a1', 'a2', 'b1', 'c1']])
+
+    def test_batch_size_is_bounded(self):
+        batcher = doctr_batcher.DoctrBatcher(max_batch_size=2, max_wait=0.2)
+        futures = [batcher.submit(['a1']), batcher.submit(['b1']), batcher.submit(['c1', 'c2'])]
+        results = [future.result(timeout=5) for future in futures]
+        self.assertEqual(results, ["texte a1", "texte b1", "texte c1\ntexte c2"])
+        self.assertEqual(self.calls, [['a1', 'b1'], ['c1', 'c2']])
+
+    def test_predictor_error_fails_the_batch(self):
+        doctr_batcher.get_doctr_predictor.return_value = mock.Mock(side_effect=RuntimeError("mémoire"))
+        batcher = doctr_batcher.DoctrBatcher(max_batch_size=8, max_wait=0.01)
+        with self.assertRaisesMessage(RuntimeError, "mémoire"):
+            batcher.submit(['a1']).result(timeout=5)
+
+
+class BatchingExecutorTests(SimpleTestCase):
+
+    @override_settings(OCR_EXECUTOR='process', DOCTR_BATCHING_ENABLED=True)
+    def test_process_executor_warns_that_batching_is_per_ticket(self):
+        with mock.patch.dict(ocr_pipeline._lanes, clear=True):
+            with self.assertLogs('ocrapp.ocr_pipeline', 'WARNING') as logs:
+                ocr_pipeline._get_lane('doctr').shutdown()
+        self.assertIn("DOCTR_BATCHING_ENABLED", logs.output[0])
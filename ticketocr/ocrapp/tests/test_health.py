@@ -0,0 +1,122 @@
+from unittest import mock
+
+import requests
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from ocrapp import health, llm_clients, ocr_pipeline
+
+
+class IsolatedHealthMixin:
+
+    def setUp(self):
+        super().setUp()
+        for patcher in (
+            mock.patch.dict(health._breakers, clear=True),
+            mock.patch.dict(health._status, clear=True),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+@override_settings(HEALTH_BREAKER_THRESHOLD=3, HEALTH_BREAKER_COOLDOWN_S=60)
+class CircuitBreakerTests(IsolatedHealthMixin, SimpleTestCase):
+
+    def test_opens_after_threshold_failures(self):
+        for _ in range(2):
+            health.record_failure('ollama', "connexion refusée")
+        self.assertTrue(health.backend_available('ollama'))
+        health.record_failure('ollama', "connexion refusée")
+        self.assertFalse(health.backend_available('ollama'))
+        with self.assertRaisesMessage(health.BackendUnavailable, "connexion refusée"):
+            health.ensure_available('ollama')
+
+    def test_success_resets_the_count(self):
+        for _ in range(2):
+            health.record_failure('ollama')
+        health.record_success('ollama')
+        health.record_failure('ollama')
+        self.assertEqual(health.get_breaker('ollama').snapshot()['state'], 'closed')
+
+    def test_half_open_after_cooldown(self):
+        for _ in range(3):
+            health.record_failure('ollama')
+        breaker = health.get_breaker('ollama')
+        breaker.opened_at -= 61
+        # Un seul appel d'essai, refermé au premier succès
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.snapshot()['state'], 'closed')
+
+    def test_failed_trial_reopens(self):
+        for _ in range(3):
+            health.record_failure('ollama')
+        breaker = health.get_breaker('ollama')
+        breaker.opened_at -= 61
+        breaker.allow()
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+
+    def test_failed_probe_trips_immediately(self):
+        with mock.patch.dict(health.PROBES, {'ollama': mock.Mock(return_value=('down', "injoignable"))}):
+            health.check_backend('ollama')
+        self.assertFalse(health.backend_available('ollama'))
+
+
+@override_settings(HEALTH_BREAKER_THRESHOLD=2, LLM_STREAM_JSON=False)
+class LlmCircuitTests(IsolatedHealthMixin, SimpleTestCase):
+
+    def test_network_errors_open_the_breaker(self):
+        session = mock.Mock()
+        session.post.side_effect = requests.exceptions.ConnectionError("connexion refusée")
+        with mock.patch.object(llm_clients, 'get_ollama_session', return_value=session):
+            for _ in range(2):
+                with self.assertRaises(requests.exceptions.ConnectionError):
+                    llm_clients.ollama_generate('mistral', 'prompt')
+            with self.assertRaises(health.BackendUnavailable):
+                llm_clients.ollama_generate('mistral', 'prompt')
+        self.assertEqual(session.post.call_count, 2)
+
+    def test_client_errors_do_not_count(self):
+        error = requests.exceptions.HTTPError("404", response=mock.Mock(status_code=404))
+        session = mock.Mock()
+        session.post.return_value.status_code = 404
+        session.post.return_value.raise_for_status.side_effect = error
+        with mock.patch.object(llm_clients, 'get_ollama_session', return_value=session):
+            for _ in range(3):
+                with self.assertRaises(requests.exceptions.HTTPError):
+                    llm_clients.ollama_generate('mistral', 'prompt')
+        self.assertEqual(health.get_breaker('ollama').snapshot()['failures'], 0)
+
+
+@override_settings(HEALTH_BREAKER_THRESHOLD=2)
+class OcrEngineHealthTests(IsolatedHealthMixin, SimpleTestCase):
+
+    def test_error_texts_count_as_failures(self):
+        for _ in range(2):
+            ocr_pipeline._record_result('tesseract', "Erreur tesseract: binaire introuvable")
+        self.assertFalse(health.backend_available('tesseract'))
+
+    def test_texts_count_as_successes(self):
+        ocr_pipeline._record_result('tesseract', "Erreur tesseract: binaire introuvable")
+        ocr_pipeline._record_result('tesseract', "Total 4.090")
+        self.assertEqual(health.get_breaker('tesseract').snapshot()['failures'], 0)
+
+
+@override_settings(HEALTH_CHECK_INTERVAL_S=0, HEALTH_BREAKER_THRESHOLD=1, OCR_CACHE_ENABLED=False, LLM_CACHE_ENABLED=False)
+class SystemStatusViewTests(IsolatedHealthMixin, TestCase):
+
+    def test_reports_breakers_and_issues(self):
+        health.record_failure('huggingface', "HTTP 503")
+        # HEALTH_CHECK_INTERVAL_S=0 : pas de sondes en arrière-plan, l'état vient des disjoncteurs
+        response = self.client.get(reverse('system_status'))
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertEqual(data['backends']['huggingface']['breaker']['state'], 'open')
+        self.assertEqual(data['backends']['ollama']['status'], 'unknown')
+        self.assertIn("huggingface: HTTP 503", data['issues'])
+        self.assertEqual(data['caches'], {'ocr': None, 'llm': None})
+
+    def test_get_only(self):
+        self.assertFalse(self.client.post(reverse('system_status')).json()['success'])
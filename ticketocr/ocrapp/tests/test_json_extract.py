@@ -0,0 +1,50 @@
+import json
+import os
+
+from django.test import SimpleTestCase
+
+from ocrapp.json_extract import extract_ticket_json
+
+CORPUS = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                      'bench_data', 'llm_outputs.jsonl')
+
+
+
+
+class JsonExtractTests(SimpleTestCase):
+
+    def test_plain_and_surrounded(self):
+        expected = {"Magasin": "A", "Date": "x", "Total": "1.000 DT"}
+        self.assertEqual(extract_ticket_json('{"Magasin": "A", "Date": "x", "Total": "1.000 DT"}'), expected)
+        self.assertEqual(
+            extract_ticket_json('```json\n{"Magasin": "A", "Date": "x", "Total": "1.000 DT"}\n```\nVoilà.'),
+            expected,
+        )
+
+    def test_repairs(self):
+        self.assertEqual(
+            extract_ticket_json("{'Magasin': 'A', 'Total': '2.000 DT', 'Articles': [],}"),
+            {"Magasin": "A", "Total": "2.000 DT", "Articles": []},
+        )
+
+    def test_newline_inside_string(self):
+        result = extract_ticket_json(
+            '{"Magasin": "A", "Date": "x", "Total": "1.000 DT", "Commentaire": "ligne1\nligne2"}'
+        )
+        self.assertEqual(result["Magasin"], "A")
+        self.assertEqual(result["Commentaire"].split(), ["ligne1", "ligne2"])
+
+    def test_unclosed_quote_in_reasoning(self):
+        text = 'Peut-être {"Magasin": "Carrefour} ? Non.\nRéponse :\n{"Magasin": "A", "Date": "x", "Total": "1.000 DT"}'
+        self.assertEqual(extract_ticket_json(text), {"Magasin": "A", "Date": "x", "Total": "1.000 DT"})
+
+    def test_no_ticket(self):
+        self.assertIsNone(extract_ticket_json('{"autre": 1}'))
+        self.assertIsNone(extract_ticket_json('pas de JSON'))
+
+    def test_benchmark_corpus(self):
+        with open(CORPUS, encoding='utf-8') as f:
+            corpus = [json.loads(line) for line in f if line.strip()]
+        for case in corpus:
+            with self.subTest(case=case['name']):
+                self.assertEqual(extract_ticket_json(case['text']), case['expected'])
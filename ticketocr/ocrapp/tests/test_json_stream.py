@@ -0,0 +1,146 @@
+import itertools
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+import httpx
+import requests
+from django.test import SimpleTestCase, override_settings
+from openai import APITimeoutError
+from urllib3.exceptions import ReadTimeoutError
+
+from ocrapp import health, llm_clients
+from ocrapp.json_stream import JsonObjectScanner, StreamTimeout, consume_stream
+
+
+class JsonStreamTests(SimpleTestCase):
+
+    def test_scanner_stops_at_closing_brace(self):
+        scanner = JsonObjectScanner()
+        self.assertFalse(scanner.feed('Voici : {"Magasin": "A", "Articles": [{"nom": "x"'))
+        self.assertTrue(scanner.feed('}]} et du texte après'))
+        self.assertEqual(scanner.json_text, '{"Magasin": "A", "Articles": [{"nom": "x"}]}')
+
+    def test_scanner_ignores_braces_in_strings_and_think(self):
+        scanner = JsonObjectScanner()
+        for fragment in ('<thi', 'nk>{"faux": 1}</th', 'ink>{"nom": "a}\\"b"', ', "n": 1}'):
+            scanner.feed(fragment)
+        self.assertTrue(scanner.complete)
+        self.assertEqual(scanner.json_text, '{"nom": "a}\\"b", "n": 1}')
+
+    def test_consume_stream(self):
+        self.assertEqual(consume_stream(iter(['{"a": ', '1}', ' reste'])), ('{"a": 1}', True))
+        self.assertEqual(consume_stream(iter(['{"a": ', '1'])), ('{"a": 1', False))
+        self.assertEqual(consume_stream(iter(['a', 'b']), stop_at_json=False), ('ab', False))
+
+    def test_consume_stream_deadline(self):
+        with mock.patch('ocrapp.json_stream.time.monotonic', side_effect=itertools.count(0)):
+            with self.assertRaises(StreamTimeout):
+                consume_stream(iter(['{"a": ', '1', ', "b": 2}']), deadline=0.5)
+
+
+def slow_fragments(fragments, delay):
+    for fragment in fragments:
+        time.sleep(delay)
+        yield fragment
+
+
+class FakeOllamaResponse:
+    status_code = 200
+
+    def __init__(self, lines, delay=0.0, error=None):
+        self.lines = lines
+        self.delay = delay
+        self.error = error
+        self.closed = False
+
+    def iter_lines(self):
+        yield from slow_fragments(self.lines, self.delay)
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        self.closed = True
+
+
+class FakeHfStream:
+
+    def __init__(self, fragments, delay=0.0, error=None):
+        self.fragments = fragments
+        self.delay = delay
+        self.error = error
+        self.closed = False
+
+    def __iter__(self):
+        for fragment in slow_fragments(self.fragments, self.delay):
+            yield SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=fragment))])
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        self.closed = True
+
+
+@override_settings(LLM_STREAM_JSON=True)
+class StreamTimeoutTests(SimpleTestCase):
+    """
+    Les deux backends streamés lèvent les mêmes exceptions requests quand un délai est dépassé
+    """
+
+    def setUp(self):
+        patcher = mock.patch.dict(health._breakers, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def ollama(self, response):
+        session = mock.Mock()
+        session.post.return_value = response
+        with mock.patch.object(llm_clients, 'get_ollama_session', return_value=session):
+            return llm_clients.ollama_generate('mistral', 'prompt', timeout=0.05)
+
+    def hf(self, stream=None, error=None):
+        client = mock.Mock()
+        client.chat.completions.create.return_value = stream
+        client.chat.completions.create.side_effect = error
+        with mock.patch.object(llm_clients, 'get_hf_client', return_value=client):
+            return llm_clients.hf_chat('Qwen/Qwen3-30B-A3B', 'prompt', timeout=0.05)
+
+    def test_ollama_total_deadline(self):
+        lines = [b'{"response": "{\\"Magasin\\": "}'] * 5
+        response = FakeOllamaResponse(lines, delay=0.03)
+        with self.assertRaises(requests.exceptions.Timeout):
+            self.ollama(response)
+        self.assertTrue(response.closed)
+
+    def test_ollama_read_timeout(self):
+        error = requests.exceptions.ConnectionError(ReadTimeoutError(None, None, "Read timed out."))
+        with self.assertRaises(requests.exceptions.ReadTimeout):
+            self.ollama(FakeOllamaResponse([b'{"response": "{"}'], error=error))
+
+    def test_hf_total_deadline(self):
+        stream = FakeHfStream(['{"Magasin": '] * 5, delay=0.03)
+        with self.assertRaises(requests.exceptions.Timeout) as context:
+            self.hf(stream)
+        self.assertIsInstance(context.exception.__cause__, StreamTimeout)
+        self.assertTrue(stream.closed)
+
+    def test_hf_read_timeout(self):
+        stream = FakeHfStream(['{"Magasin": '], error=httpx.ReadTimeout("timed out"))
+        with self.assertRaises(requests.exceptions.ReadTimeout):
+            self.hf(stream)
+
+    def test_hf_request_timeout(self):
+        error = APITimeoutError(request=httpx.Request('POST', 'https://router.huggingface.co/v1/chat/completions'))
+        with self.assertRaises(requests.exceptions.Timeout):
+            self.hf(error=error)
+
+    def test_timeouts_count_as_breaker_failures(self):
+        stream = FakeHfStream(['{"Magasin": '], error=httpx.ReadTimeout("timed out"))
+        with self.assertRaises(requests.exceptions.Timeout):
+            self.hf(stream)
+        self.assertEqual(health.get_breaker('huggingface').snapshot()['failures'], 1)
+
+    def test_hf_stops_at_the_closing_brace(self):
+        stream = FakeHfStream(['<think>{"faux"}</think>', '{"Magasin": "A"}', ' et la suite'])
+        self.assertEqual(self.hf(stream), '{"Magasin": "A"}')
+        self.assertTrue(stream.closed)
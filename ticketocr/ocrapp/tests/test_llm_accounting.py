@@ -0,0 +1,98 @@
+import json
+from unittest import mock
+
+import requests
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from ocrapp import health, llm_clients, views
+from ocrapp.llm_accounting import collect_llm_calls, track_llm_call
+from ocrapp.models import ExtractionHistory, LLMCallRecord
+
+OCR_RESULTS = {'doctr': "AZIZA\nTotal 4.090", 'tesseract': "AZIZA\nTotaI 4.090", 'docling': "AZIZA\nTotal 4.090"}
+RESPONSE = json.dumps({"Magasin": "AZIZA", "Date": "03/01/2025", "Total": "4.090 DT", "Articles": []})
+
+
+class TrackLlmCallTests(SimpleTestCase):
+
+    def test_reported_tokens(self):
+        with collect_llm_calls('llm') as calls:
+            with track_llm_call('ollama', 'mistral', "prompt") as call:
+                call.update(prompt_tokens=120, completion_tokens=40)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual((calls[0]['prompt_tokens'], calls[0]['completion_tokens']), (120, 40))
+        self.assertFalse(calls[0]['tokens_estimated'])
+        self.assertEqual((calls[0]['outcome'], calls[0]['analysis']), ('success', 'llm'))
+
+    def test_errors_are_recorded_with_estimated_tokens(self):
+        with collect_llm_calls('llm') as calls:
+            with self.assertRaises(requests.exceptions.Timeout):
+                with track_llm_call('ollama', 'mistral', "x" * 400):
+                    raise requests.exceptions.Timeout("délai dépassé")
+        self.assertEqual((calls[0]['outcome'], calls[0]['error']), ('error', "délai dépassé"))
+        self.assertTrue(calls[0]['tokens_estimated'])
+        self.assertGreater(calls[0]['prompt_tokens'], 0)
+
+    def test_fallback_path_grows_with_each_call(self):
+        with collect_llm_calls('llm') as calls:
+            for model in ('mistral', 'llama2'):
+                with track_llm_call('ollama', model):
+                    pass
+        self.assertEqual([call['fallback_path'] for call in calls], [['mistral'], ['mistral', 'llama2']])
+
+    def test_no_collector(self):
+        with track_llm_call('ollama', 'mistral') as call:
+            call['text'] = "réponse"
+
+
+@override_settings(LLM_STREAM_JSON=False, LLM_CACHE_ENABLED=False)
+class LlmCallRecordTests(TestCase):
+
+    def setUp(self):
+        self.extraction = ExtractionHistory.objects.create(image='tickets/ticket.png')
+        response = mock.Mock(status_code=200)
+        response.json.return_value = {'response': RESPONSE, 'prompt_eval_count': 120, 'eval_count': 40}
+        # mistral dépasse son délai, llama2 répond
+        self.session = mock.Mock()
+        self.session.post.side_effect = [requests.exceptions.Timeout("délai dépassé"), response]
+        for patcher in (
+            mock.patch.dict(health._breakers, clear=True),
+            mock.patch.object(llm_clients, 'get_ollama_session', return_value=self.session),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def analyze(self):
+        return views.get_or_run_analysis(self.extraction, 'llm', views.analyze_three_texts_with_llm_fast, OCR_RESULTS)
+
+    def test_one_row_per_call(self):
+        result = self.analyze()
+        self.assertEqual(result['backend_used'], 'llama2')
+        records = list(self.extraction.llm_calls.order_by('id'))
+        self.assertEqual(
+            [(record.model, record.outcome, record.analysis) for record in records],
+            [('mistral', 'error', 'llm'), ('llama2', 'success', 'llm')],
+        )
+        self.assertTrue(records[0].tokens_estimated)
+        self.assertEqual((records[1].prompt_tokens, records[1].completion_tokens), (120, 40))
+        self.assertEqual(records[1].fallback_path, ['mistral', 'llama2'])
+        self.assertEqual({record.backend_used for record in records}, {'llama2'})
+
+    def test_stored_analysis_adds_no_rows(self):
+        self.analyze()
+        self.extraction.refresh_from_db()
+        self.analyze()
+        self.assertEqual(LLMCallRecord.objects.count(), 2)
+
+    def test_usage_report(self):
+        self.analyze()
+        report = self.client.get(reverse('llm_usage_report'), {'days': 7}).json()
+        self.assertEqual(report['totals']['calls'], 2)
+        self.assertEqual(report['totals']['prompt_tokens'], 120 + LLMCallRecord.objects.get(model='mistral').prompt_tokens)
+        self.assertEqual(
+            {(entry['model'], entry['outcome']): entry['calls'] for entry in report['by_model']},
+            {('mistral', 'error'): 1, ('llama2', 'success'): 1},
+        )
+        self.assertEqual(report['fallback_paths'], [
+            {'path': 'mistral -> llama2', 'analyses': 1, 'backend_used': {'llama2': 1}},
+        ])
@@ -0,0 +1,89 @@
+import json
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from ocrapp import llm_batch
+from ocrapp.llm_batch import analyze_tickets_batch, context_tokens, pack_batches, parse_batch_response
+
+
+def ticket(magasin, total):
+    return {"Magasin": magasin, "NumeroTicket": "", "Date": "03/01/2025", "Articles": [], "Total": total}
+
+
+class ParseBatchResponseTests(SimpleTestCase):
+
+    def test_object_and_list(self):
+        self.assertEqual(
+            parse_batch_response('{"tickets": [{"id": 1, "Total": "1.000 DT"}, {"id": "t2"}]}'),
+            {'1': {"id": 1, "Total": "1.000 DT"}, 't2': {"id": "t2"}},
+        )
+        self.assertEqual(parse_batch_response('[{"id": "a"}]'), {'a': {"id": "a"}})
+
+    def test_surrounding_text(self):
+        text = '<think>{"tickets": []}</think>Réponse : {"tickets": [{"id": "a"}, {"sans": "id"}, 3]} fin'
+        self.assertEqual(parse_batch_response(text), {'a': {"id": "a"}})
+
+    def test_invalid(self):
+        for text in ('', None, 'rien', '{"tickets": "non"}', '{"tickets": [{"id": "a"}'):
+            self.assertEqual(parse_batch_response(text), {})
+
+
+
+class PackBatchesTests(SimpleTestCase):
+
+    tickets = [(f"t{i}", {'doctr': f"Ticket {i}\nTotal {i}.000 DT"}) for i in range(5)]
+
+    def test_max_tickets(self):
+        batches = pack_batches(self.tickets, token_budget=100000, max_tickets=2)
+        self.assertEqual([[key for key, _ in batch] for batch in batches], [['t0', 't1'], ['t2', 't3'], ['t4']])
+
+    def test_token_budget(self):
+        base = llm_batch.estimate_tokens(llm_batch.BATCH_INSTRUCTIONS)
+        batches = pack_batches(self.tickets, token_budget=base + 300, max_tickets=10, output_tokens=250)
+        self.assertEqual(len(batches), 5)
+
+    def test_context_tokens(self):
+        self.assertEqual(context_tokens("x", 1, output_tokens=10), llm_batch.MIN_CONTEXT)
+        self.assertEqual(context_tokens("x" * 8000, 4, output_tokens=250) % 1024, 0)
+
+
+@override_settings(LLM_CACHE_ENABLED=False, LLM_BATCH_BACKEND='mistral')
+class AnalyzeTicketsBatchTests(SimpleTestCase):
+
+    tickets = {
+        'a': {'doctr': "AZIZA\nTotal 4.090 DT"},
+        'b': {'doctr': "MONOPRIX\nTotal 12.500 DT"},
+        'c': {'doctr': "CARREFOUR\nTotal 7.000 DT"},
+    }
+
+    def test_only_missing_or_invalid_tickets_are_reanalysed(self):
+        response = json.dumps({"tickets": [
+            dict(ticket("AZIZA", "4.090 DT"), id="T1"),
+            dict(ticket("MONOPRIX", "12.500 DT"), id="T2", Articles="non"),
+        ]})
+        analyze_one = mock.Mock(side_effect=lambda ocr_results: {"Magasin": "seul"})
+        with mock.patch.object(llm_batch, '_generate', return_value=response) as generate:
+            results = analyze_tickets_batch(self.tickets, analyze_one)
+        generate.assert_called_once()
+        self.assertEqual(list(results), ['a', 'b', 'c'])
+        self.assertEqual(results['a']['Magasin'], "AZIZA")
+        self.assertEqual(results['a']['backend_used'], "mistral-batch")
+        self.assertEqual(results['b'], {"Magasin": "seul"})
+        self.assertEqual([call.args[0] for call in analyze_one.call_args_list], [self.tickets['b'], self.tickets['c']])
+
+    def test_batch_error_falls_back_to_single_analyses(self):
+        analyze_one = mock.Mock(return_value={"Magasin": "seul"})
+        with mock.patch.object(llm_batch, '_generate', side_effect=RuntimeError("Ollama")):
+            results = analyze_tickets_batch(self.tickets, analyze_one)
+        self.assertEqual(analyze_one.call_count, 3)
+        self.assertEqual(set(results), set(self.tickets))
+
+    def test_finalize_and_validate(self):
+        response = json.dumps({"tickets": [dict(ticket("AZIZA", "4.090 DT"), id=label) for label in ("T1", "T2", "T3")]})
+        finalize = mock.Mock(side_effect=lambda result, ocr_results: dict(result, finalise=True))
+        validate = mock.Mock(side_effect=lambda result: result['Total'] != "")
+        with mock.patch.object(llm_batch, '_generate', return_value=response):
+            results = analyze_tickets_batch(self.tickets, mock.Mock(), finalize=finalize, validate=validate)
+        self.assertTrue(all(result['finalise'] for result in results.values()))
+        self.assertEqual(validate.call_count, 3)
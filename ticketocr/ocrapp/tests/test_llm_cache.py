@@ -0,0 +1,78 @@
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from ocrapp import llm_cache, views
+from ocrapp.cache_store import SqliteCache
+from ocrapp.llm_accounting import collect_llm_calls
+
+OCR_RESULTS = {'doctr': "AZIZA\nTotal 4.090", 'tesseract': "AZIZA\nTotaI 4.090", 'docling': "AZIZA\nTotal 4.090"}
+RESPONSE = json.dumps({"Magasin": "AZIZA", "Date": "03/01/2025", "Total": "4.090 DT", "Articles": []})
+
+
+@override_settings(LLM_CACHE_ENABLED=True)
+class LlmCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        for patcher in (
+            mock.patch.object(llm_cache, '_cache', SqliteCache(os.path.join(directory, 'llm.sqlite3'), 'llm')),
+            mock.patch.object(views, 'ollama_generate', return_value=RESPONSE),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def analyze(self, ocr_results=OCR_RESULTS):
+        return views.analyze_three_texts_with_llm_fast(ocr_results)
+
+    def test_cache_hit_skips_the_llm(self):
+        first = self.analyze()
+        with collect_llm_calls('llm') as calls:
+            second = self.analyze()
+        views.ollama_generate.assert_called_once()
+        self.assertEqual(second['Magasin'], first['Magasin'])
+        self.assertEqual([(call['backend'], call['outcome']) for call in calls], [('cache', 'cache')])
+
+    def test_key_ignores_whitespace_but_not_content(self):
+        self.analyze()
+        self.analyze({engine: f"  {text.replace(chr(10), chr(10) * 2)}  " for engine, text in OCR_RESULTS.items()})
+        self.assertEqual(views.ollama_generate.call_count, 1)
+        self.analyze(dict(OCR_RESULTS, doctr="AZIZA\nTotal 5.090"))
+        self.assertEqual(views.ollama_generate.call_count, 2)
+
+    def test_key_depends_on_the_model(self):
+        self.assertNotEqual(
+            llm_cache.completion_key('ollama/mistral', OCR_RESULTS),
+            llm_cache.completion_key('ollama/llama2', OCR_RESULTS),
+        )
+
+    def test_unusable_response_is_not_stored(self):
+        views.ollama_generate.return_value = "pas de JSON"
+        self.analyze()
+        self.analyze()
+        self.assertEqual(views.ollama_generate.call_count, 2)
+
+    def test_bypass(self):
+        self.analyze()
+        with llm_cache.llm_cache_bypass():
+            self.analyze()
+        self.assertEqual(views.ollama_generate.call_count, 2)
+
+    def test_no_cache_request_bypasses_the_cache(self):
+        analyze = views.analyze_three_texts_with_llm_fast
+        views.get_or_run_analysis(None, 'llm', analyze, OCR_RESULTS)
+        views.get_or_run_analysis(None, 'llm', analyze, OCR_RESULTS)
+        self.assertEqual(views.ollama_generate.call_count, 1)
+        views.get_or_run_analysis(None, 'llm', analyze, OCR_RESULTS, use_cache=False)
+        self.assertEqual(views.ollama_generate.call_count, 2)
+
+    @override_settings(LLM_CACHE_ENABLED=False)
+    def test_disabled(self):
+        self.analyze()
+        self.analyze()
+        self.assertEqual(views.ollama_generate.call_count, 2)
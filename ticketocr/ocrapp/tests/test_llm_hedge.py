@@ -0,0 +1,103 @@
+import threading
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from ocrapp import views
+from ocrapp.llm_hedge import is_valid_ticket_result, run_hedged
+
+TICKET = {"Magasin": "AZIZA", "Total": "4.090 DT"}
+
+
+class SlowBackend:
+    """
+    Backend factice : répond après delay secondes sauf s'il est annulé avant
+    """
+
+    def __init__(self, result, delay=0.0, error=None):
+        self.result = result
+        self.delay = delay
+        self.error = error
+        self.started = threading.Event()
+        self.cancelled = threading.Event()
+
+    def __call__(self, cancel_event):
+        self.started.set()
+        if cancel_event.wait(self.delay):
+            self.cancelled.set()
+            raise RuntimeError("annulé")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class RunHedgedTests(SimpleTestCase):
+
+    def test_first_valid_response_wins_and_losers_are_cancelled(self):
+        slow = SlowBackend(dict(TICKET, Magasin="LENT"), delay=5)
+        fast = SlowBackend(TICKET, delay=0.05)
+        start = time.monotonic()
+        winner, result = run_hedged([('qwen', slow), ('mistral', fast)], delay=0.05, timeout=5)
+        self.assertEqual((winner, result), ('mistral', TICKET))
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertTrue(slow.cancelled.wait(2))
+
+    def test_next_backend_waits_for_the_delay(self):
+        first = SlowBackend(TICKET, delay=0.05)
+        second = SlowBackend(TICKET)
+        winner, _ = run_hedged([('qwen', first), ('mistral', second)], delay=2, timeout=5)
+        self.assertEqual(winner, 'qwen')
+        self.assertFalse(second.started.is_set())
+
+    def test_failure_launches_the_next_backend_without_waiting(self):
+        failing = SlowBackend(None, error=RuntimeError("HTTP 503"))
+        fallback = SlowBackend(TICKET)
+        start = time.monotonic()
+        winner, result = run_hedged([('qwen', failing), ('mistral', fallback)], delay=5, timeout=10)
+        self.assertEqual((winner, result), ('mistral', TICKET))
+        self.assertLess(time.monotonic() - start, 2)
+
+    def test_invalid_results_and_errors_are_reported(self):
+        winner, outcomes = run_hedged(
+            [('qwen', SlowBackend({"error": "JSON invalide"})), ('mistral', SlowBackend(None, error=ValueError("x")))],
+            delay=0.01, timeout=5,
+        )
+        self.assertIsNone(winner)
+        self.assertEqual(outcomes['qwen'], {"error": "JSON invalide"})
+        self.assertIsInstance(outcomes['mistral'], ValueError)
+
+    def test_timeout_cancels_everything(self):
+        backend = SlowBackend(TICKET, delay=5)
+        winner, outcomes = run_hedged([('qwen', backend)], delay=0.01, timeout=0.1)
+        self.assertEqual((winner, outcomes), (None, {}))
+        self.assertTrue(backend.cancelled.wait(2))
+
+    def test_valid_ticket_result(self):
+        self.assertTrue(is_valid_ticket_result(TICKET))
+        self.assertFalse(is_valid_ticket_result({"Magasin": "", "Articles": []}))
+        self.assertFalse(is_valid_ticket_result(dict(TICKET, error="x")))
+        self.assertFalse(is_valid_ticket_result("texte"))
+
+
+@override_settings(LLM_HEDGE_ORDER=['qwen', 'mistral', 'llama2'], LLM_HEDGE_DELAY_S=0.05, LLM_HEDGE_TIMEOUT_S=5)
+class HedgedAnalysisTests(SimpleTestCase):
+
+    ocr_results = {'doctr': "Pain 1.200 DT\nTotal : 1.200 DT", 'tesseract': '', 'docling': ''}
+
+    def test_view_returns_the_winner(self):
+        with mock.patch.object(views, 'analyze_three_texts_with_qwen', side_effect=RuntimeError("HF indisponible")), \
+                mock.patch.object(views, 'analyze_three_texts_with_llm_fast', return_value=TICKET) as fast, \
+                mock.patch.object(views, 'analyze_three_texts_with_llm_ultra_fast') as ultra_fast:
+            self.assertEqual(views.analyze_three_texts_with_llm_hedged(self.ocr_results), TICKET)
+        # Le backend couvert ne se replie pas lui-même sur llama2 : c'est le rôle du hedging
+        self.assertFalse(fast.call_args.kwargs['allow_fallback'])
+        ultra_fast.assert_not_called()
+
+    def test_view_falls_back_to_regex(self):
+        with mock.patch.object(views, 'analyze_three_texts_with_qwen', return_value={"error": "JSON invalide"}), \
+                mock.patch.object(views, 'analyze_three_texts_with_llm_fast', side_effect=RuntimeError("Ollama")), \
+                mock.patch.object(views, 'analyze_three_texts_with_llm_ultra_fast', return_value={"Magasin": ""}):
+            result = views.analyze_three_texts_with_llm_hedged(self.ocr_results)
+        self.assertEqual(result['backend_used'], 'regex')
+        self.assertIn("qwen: JSON invalide", result['Commentaire'])
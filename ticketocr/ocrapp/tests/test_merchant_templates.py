@@ -0,0 +1,76 @@
+import json
+import os
+import shutil
+import tempfile
+
+from django.test import SimpleTestCase, override_settings
+
+from ocrapp.merchant_templates import MerchantTemplate, analyze_with_template, get_registry
+
+AZIZA_TEXT = (
+    "MAGASINS AZIZA\nNUM VERT 80102080\n3/01/2025 07:38 Caissier 10047 du 1069\n"
+    "LOT 2 SAVON MAIN 1L 3.990\nTIMBRE LOI FIN.2022 0.100\nTotal 4.090\n"
+)
+
+
+
+class MerchantTemplateTests(SimpleTestCase):
+
+    def setUp(self):
+        self.template = MerchantTemplate.from_dict({
+            'name': 'test',
+            'identify': ['BOUTIQUE TEST'],
+            'date': r'(?P<date>{date})',
+            'article': r'^(?P<nom>.+?)\s+(?P<prix>{montant})$',
+            'remise': r'^REMISE\s+(?P<prix>{montant})$',
+            'timbre': r'^TIMBRE\s+(?P<prix>{montant})$',
+            'total': r'^TOTAL\s+(?P<prix>{montant})$',
+        })
+
+    def test_parse(self):
+        text = "BOUTIQUE TEST\n5/02/2025\nPAIN 1.200\nLAIT 2,000\nREMISE -0.200\nTIMBRE O.100\nTOTAL 3.100\nESPECES 5.000"
+        self.assertTrue(self.template.identifies(text))
+        self.assertEqual(self.template.parse(text), {
+            "Magasin": "TEST",
+            "NumeroTicket": "",
+            "Date": "05/02/2025",
+            "Articles": [
+                {"nom": "PAIN", "prix": "1.200 DT"},
+                {"nom": "LAIT", "prix": "1.800 DT"},
+                {"nom": "TIMBRE FISCAL", "prix": "0.100 DT"},
+            ],
+            "Total": "3.100 DT",
+        })
+
+    def test_inconsistent_total_is_rejected(self):
+        self.assertIsNone(self.template.parse("BOUTIQUE TEST\n5/02/2025\nPAIN 1.200\nTOTAL 9.000"))
+        self.assertIsNone(self.template.parse("BOUTIQUE TEST\nPAIN 1.200\nTOTAL 1.200"))
+
+    def test_builtin_aziza(self):
+        template = get_registry().identify(AZIZA_TEXT)
+        self.assertEqual(template.name, 'aziza')
+        result = template.parse(AZIZA_TEXT)
+        self.assertEqual(result["Total"], "4.090 DT")
+        self.assertEqual(result["Articles"][-1], {"nom": "TIMBRE FISCAL", "prix": "0.100 DT"})
+
+    def test_analyze_tries_the_next_engine(self):
+        result = analyze_with_template({
+            'doctr': AZIZA_TEXT.replace("Total 4.090", "Total 9.090"),
+            'tesseract': AZIZA_TEXT,
+            'docling': "Erreur Docling: boom",
+        })
+        self.assertEqual(result["backend_used"], "template:aziza")
+        self.assertIn("(tesseract)", result["Commentaire"])
+
+    def test_unknown_merchant(self):
+        self.assertIsNone(analyze_with_template({'doctr': "BOULANGERIE\nPain 1.200\nTotal 1.200"}))
+
+    def test_local_template_replaces_the_builtin(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        with open(os.path.join(directory, 'aziza.json'), 'w', encoding='utf-8') as f:
+            json.dump({'name': 'aziza', 'magasin': 'AZIZA LOCAL', 'identify': ['MAGASINS AZIZA'],
+                       'article': r'^(?P<nom>.+?)\s+(?P<prix>{montant})$', 'total': r'^Total\s+(?P<prix>{montant})$'}, f)
+        with override_settings(MERCHANT_TEMPLATES_DIR=directory):
+            self.assertEqual(get_registry().identify(AZIZA_TEXT).magasin, 'AZIZA LOCAL')
+        self.assertNotEqual(get_registry().identify(AZIZA_TEXT).magasin, 'AZIZA LOCAL')
@@ -0,0 +1,58 @@
+from django.test import SimpleTestCase, override_settings
+
+from ocrapp.llm_cache import completion_key
+from ocrapp.ocr_consensus import build_consensus, ocr_prompt_text, split_lines
+
+OCR_RESULTS = {
+    'doctr': "Pain 1.200 DT\nTotal 2.200 DT",
+    'tesseract': "Pain 1.200 DT\nTotaI 2.200 DT",
+    'docling': "Pain 1.200 DT\nTotal 2.200 DT",
+}
+
+
+class OcrConsensusTests(SimpleTestCase):
+
+    def test_split_lines_flattens_markdown(self):
+        self.assertEqual(split_lines("## **Total:**\n| Pain   1.200 DT |\n---\n\n"), ["Total:", "Pain 1.200 DT"])
+
+    def test_agreement_and_vote(self):
+        text, stats = build_consensus(OCR_RESULTS)
+        self.assertEqual(text, "Pain 1.200 DT\nTotal 2.200 DT")
+        self.assertEqual((stats['agreed'], stats['voted'], stats['disputed']), (1, 1, 0))
+
+    def test_single_engine_line_is_prefixed(self):
+        text, stats = build_consensus({
+            'doctr': "CARREFOUR\nPain 1.200 DT\nTotal 1.200 DT",
+            'tesseract': "CARREFOUR\nTotal 1.200 DT",
+        })
+        self.assertIn("[doctr] Pain 1.200 DT", text.splitlines())
+        self.assertEqual(stats['single'], 1)
+
+    def test_errors_and_empty_are_ignored(self):
+        text, stats = build_consensus({'doctr': "Pain 1.200 DT", 'tesseract': "Erreur OCR: boom", 'docling': ""})
+        self.assertEqual(text, "Pain 1.200 DT")
+        self.assertEqual(stats['engines'], ['doctr'])
+        self.assertEqual(build_consensus({}), ('', {
+            'engines': [], 'lines': 0, 'agreed': 0, 'voted': 0, 'disputed': 0, 'single': 0,
+        }))
+
+
+class OcrPromptTextTests(SimpleTestCase):
+
+    def test_raw_mode_keeps_the_raw_texts(self):
+        self.assertEqual(ocr_prompt_text(OCR_RESULTS, "textes bruts"), "textes bruts")
+
+    @override_settings(LLM_PROMPT_OCR_MODE='consensus')
+    def test_consensus_mode(self):
+        block = ocr_prompt_text(OCR_RESULTS, "textes bruts")
+        self.assertIn("consolidé à partir de doctr, tesseract, docling", block)
+        self.assertTrue(block.endswith("--- OCR consolidé ---\nPain 1.200 DT\nTotal 2.200 DT"))
+
+    @override_settings(LLM_PROMPT_OCR_MODE='consensus')
+    def test_single_engine_keeps_the_raw_texts(self):
+        self.assertEqual(ocr_prompt_text({'doctr': "Pain 1.200 DT", 'tesseract': ''}, "textes bruts"), "textes bruts")
+
+    def test_cache_key_depends_on_the_prompt_mode(self):
+        raw = completion_key('ollama/mistral', OCR_RESULTS)
+        with self.settings(LLM_PROMPT_OCR_MODE='consensus'):
+            self.assertNotEqual(completion_key('ollama/mistral', OCR_RESULTS), raw)
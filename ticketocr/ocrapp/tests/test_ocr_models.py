@@ -0,0 +1,88 @@
+import sys
+import threading
+import time
+import types
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from ocrapp import ocr_models
+
+
+class FakeDoctr:
+    """
+    Module doctr.models factice : compte les constructions de prédicteur
+    """
+
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.builds = []
+        self.module = types.ModuleType('doctr.models')
+        self.module.ocr_predictor = self.ocr_predictor
+
+    def ocr_predictor(self, det_arch, reco_arch, pretrained):
+        self.builds.append((det_arch, reco_arch))
+        time.sleep(self.delay)
+        return mock.Mock(name=f'predictor-{det_arch}-{reco_arch}')
+
+    def modules(self):
+        return {'doctr': types.ModuleType('doctr'), 'doctr.models': self.module}
+
+
+@override_settings(DOCTR_DET_ARCH='db_resnet50', DOCTR_RECO_ARCH='crnn_vgg16_bn')
+class DoctrPredictorRegistryTests(SimpleTestCase):
+
+    def setUp(self):
+        patcher = mock.patch.dict(ocr_models._doctr_predictors, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_same_instance_across_calls(self):
+        fake = FakeDoctr()
+        with mock.patch.dict(sys.modules, fake.modules()):
+            first = ocr_models.get_doctr_predictor()
+            self.assertIs(ocr_models.get_doctr_predictor(), first)
+            self.assertIs(ocr_models.get_doctr_predictor('db_resnet50', 'crnn_vgg16_bn'), first)
+        self.assertEqual(fake.builds, [('db_resnet50', 'crnn_vgg16_bn')])
+
+    def test_one_instance_per_architecture(self):
+        fake = FakeDoctr()
+        with mock.patch.dict(sys.modules, fake.modules()):
+            default = ocr_models.get_doctr_predictor()
+            other = ocr_models.get_doctr_predictor(det_arch='linknet_resnet18')
+        self.assertIsNot(default, other)
+        self.assertEqual(len(fake.builds), 2)
+
+    def test_concurrent_first_build_runs_once(self):
+        fake = FakeDoctr(delay=0.05)
+        barrier = threading.Barrier(8)
+        results = []
+
+        def worker():
+            barrier.wait()
+            results.append(ocr_models.get_doctr_predictor())
+
+        with mock.patch.dict(sys.modules, fake.modules()):
+            threads = [threading.Thread(target=worker) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(fake.builds), 1)
+        self.assertEqual(len(results), 8)
+        self.assertTrue(all(result is results[0] for result in results))
+
+    def test_warmup_runs_a_blank_inference(self):
+        fake = FakeDoctr()
+        with mock.patch.dict(sys.modules, fake.modules()):
+            ocr_models.warmup_ocr_models(['doctr'])
+            predictor = ocr_models.get_doctr_predictor()
+        predictor.assert_called_once()
+        self.assertEqual(len(fake.builds), 1)
+
+    def test_warmup_failure_is_logged(self):
+        with mock.patch.object(ocr_models, 'get_doctr_predictor', side_effect=RuntimeError('poids absents')):
+            with self.assertLogs('ocrapp.ocr_models', 'WARNING') as logs:
+                ocr_models.warmup_ocr_models(['doctr'])
+        self.assertIn('poids absents', logs.output[0])
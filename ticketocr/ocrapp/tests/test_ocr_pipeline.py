@@ -0,0 +1,66 @@
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from ocrapp import health, ocr_pipeline
+
+
+def failing_engine(file_path, pages=None):
+    raise RuntimeError("modèle introuvable")
+
+
+def fake_engines(**texts):
+    engines = {
+        engine: (lambda text: lambda file_path, pages=None: text)(text)
+        for engine, text in texts.items()
+    }
+    engines['doctr'] = failing_engine
+    return engines
+
+
+@override_settings(HEALTH_BREAKER_THRESHOLD=3)
+class RunEnginesTests(SimpleTestCase):
+
+    def setUp(self):
+        for patcher in (
+            mock.patch.dict(health._breakers, clear=True),
+            mock.patch.dict(ocr_pipeline.OCR_ENGINES, fake_engines(tesseract="TOTAL 1.000", docling="TOTAL 1.000")),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def run_engines(self):
+        return ocr_pipeline._run_engines('ticket.jpg', None, ['tesseract', 'doctr', 'docling'], time.perf_counter())
+
+    def test_serial_engine_exception_becomes_error_text(self):
+        with override_settings(OCR_EXECUTOR='serial'):
+            results = self.run_engines()
+        self.assertEqual(results, {
+            'tesseract': "TOTAL 1.000",
+            'doctr': "Erreur doctr: modèle introuvable",
+            'docling': "TOTAL 1.000",
+        })
+        self.assertEqual(health.get_breaker('doctr').snapshot()['failures'], 1)
+        self.assertEqual(health.get_breaker('tesseract').snapshot()['failures'], 0)
+
+    def test_serial_and_thread_modes_agree(self):
+        with override_settings(OCR_EXECUTOR='serial'):
+            serial = self.run_engines()
+        with override_settings(OCR_EXECUTOR='thread'), mock.patch.dict(ocr_pipeline._lanes, clear=True):
+            try:
+                threaded = self.run_engines()
+            finally:
+                for lane in ocr_pipeline._lanes.values():
+                    lane.shutdown()
+        self.assertEqual(serial, threaded)
+
+    def test_open_breaker_skips_engine(self):
+        with override_settings(OCR_EXECUTOR='serial'):
+            for _ in range(3):
+                self.run_engines()
+            doctr = mock.Mock()
+            with mock.patch.dict(ocr_pipeline.OCR_ENGINES, doctr=doctr):
+                results = self.run_engines()
+        doctr.assert_not_called()
+        self.assertTrue(results['doctr'].startswith("Erreur doctr: moteur indisponible"))
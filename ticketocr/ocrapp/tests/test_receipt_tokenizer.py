@@ -0,0 +1,50 @@
+from django.test import SimpleTestCase
+
+from ocrapp import views
+from ocrapp.receipt_tokenizer import regex_elements, tokenize
+
+
+class ReceiptTokenizerTests(SimpleTestCase):
+
+    def test_elements(self):
+        result = regex_elements("Date: 19/07/2024\nPain 1.200 DT\nLait 0.900 DT\nTimbre Fiscal 0.100 DT\nTotal : 2.200 DT\n")
+        self.assertEqual(result["dates_valides"], ["19/07/2024"])
+        self.assertEqual(result["timbres_fiscaux"], ["0.100 DT"])
+        self.assertEqual(result["articles"], [{"nom": "Pain", "prix": "1.200 DT"}, {"nom": "Lait", "prix": "0.900 DT"}])
+        self.assertEqual(result["total"], "2.200 DT")
+        self.assertEqual(result["somme_articles"], "2.100 DT")
+        self.assertFalse(result["total_coherent"])
+
+    def test_timbres_in_any_notation(self):
+        result = regex_elements("Pain 1.200 DT\nTimbre 0,100 DT\nTaxe 0.1 DT\nTotal : 1.200 DT\n")
+        self.assertEqual(result["timbres_fiscaux"], ["0.100 DT", "0.100 DT"])
+        self.assertEqual(result["articles"], [{"nom": "Pain", "prix": "1.200 DT"}])
+        self.assertTrue(result["total_coherent"])
+        self.assertEqual(regex_elements("Rendu 1,250 DT\nVin 500.00 DT")["timbres_fiscaux"], [])
+
+    def test_line_numbers(self):
+        kinds = [(token.kind, token.line) for token in tokenize("A 1.000 DT\n\nTotal: 1.000 DT")]
+        self.assertEqual(kinds, [('label', 0), ('price', 0), ('total', 2), ('label', 2), ('price', 2)])
+
+    def test_date_overlapping_number(self):
+        self.assertEqual(regex_elements("Date 1.12/05/2024")["dates_valides"], ["12/05/2024"])
+
+    def test_price_overlapping_number(self):
+        self.assertEqual(regex_elements("PAIN 1.2.500 DT")["articles"], [{"nom": "PAIN 1.", "prix": "2.500 DT"}])
+
+    def test_date_and_price_overlapping(self):
+        result = regex_elements("LAIT 1/05/2024.500 DT")
+        self.assertEqual(result["dates_valides"], ["01/05/2024"])
+        self.assertEqual(result["articles"], [{"nom": "LAIT 1/05/", "prix": "2024.500 DT"}])
+
+    def test_empty(self):
+        self.assertEqual(regex_elements(""), {})
+        self.assertEqual(regex_elements(None), {})
+
+    def test_regex_fallback_uses_the_tokenizer(self):
+        # Textes des trois moteurs concaténés, comme dans valider_et_corriger_avec_regex
+        text = "MAGASINS AZIZA\nLOT 2 SAVON MAIN 1L 3.990 DT\nTotal 4.090 DT\n" * 3
+        result = views.extraire_elements_avec_regex(text)
+        self.assertEqual(result, regex_elements(text))
+        self.assertEqual(result["total"], "4.090 DT")
+        self.assertEqual(len(result["articles"]), 3)
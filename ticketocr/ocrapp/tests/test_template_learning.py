@@ -0,0 +1,136 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+from datetime import date
+from decimal import Decimal
+from types import SimpleNamespace
+
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from ocrapp.models import ExtractionHistory, TicketHistory
+from ocrapp.template_learning import Sample, compile_template, cross_validate, learn_template
+
+ARTICLES = [
+    ("PAIN COMPLET", "1.200"), ("LAIT DELICE 1L", "1.350"), ("YAOURT VANILLE", "0.650"),
+    ("CAFE BON 250G", "5.400"), ("HUILE OLIVE 1L", "14.900"), ("SUCRE 1KG", "1.400"),
+]
+AZIZA_TEXT = (
+    "MAGASINS AZIZA\nNUM VERT 80102080\n3/01/2025 07:38 Caissier 10047 du 1069\n"
+    "LOT 2 SAVON MAIN 1L 3.990\nTIMBRE LOI FIN.2022 0.100\nTotal 4.090\n"
+)
+
+
+def salem_ticket(index):
+    """
+    (champs du ticket corrigé, texte OCR) d'un ticket de l'enseigne fictive Epicerie Salem
+    """
+    items = ARTICLES[index % 3:index % 3 + 2 + index % 2]
+    total = sum(Decimal(prix) for _, prix in items) + Decimal('0.100')
+    text = (
+        f"EPICERIE SALEM\nRUE DE MARSEILLE TUNIS\nTICKET N {1000 + index}\n{10 + index:02d}/03/2025 09:1{index % 10}\n"
+        + ''.join(f"{nom} {prix}\n" for nom, prix in items)
+        + f"TIMBRE FISCAL 0.100\nTOTAL {total:.3f}\nESPECES 20.000\n"
+    )
+    fields = {
+        'magasin': "Epicerie Salem",
+        'total': total,
+        'numero_ticket': str(1000 + index),
+        'date_ticket': date(2025, 3, 10 + index),
+        'articles_data': [{"nom": nom, "prix": f"{prix} DT"} for nom, prix in items]
+        + [{"nom": "Timbre fiscal", "prix": "0.100 DT"}],
+    }
+    return fields, text
+
+
+def salem_sample(index):
+    fields, text = salem_ticket(index)
+    return Sample(SimpleNamespace(id=index + 1, **fields), {'doctr': text, 'tesseract': '', 'docling': ''})
+
+
+class LearnTemplateTests(SimpleTestCase):
+
+    samples = [salem_sample(index) for index in range(6)]
+
+    def test_learned_template_reads_an_unseen_ticket(self):
+        data = learn_template('epicerie_salem', "Epicerie Salem", self.samples)
+        self.assertEqual(data['identify'], ['EPICERIE'])
+        self.assertEqual(data['learned']['tickets'], 6)
+        template = compile_template(data)
+        fields, text = salem_ticket(7)
+        result = template.parse(text)
+        self.assertEqual(result["Total"], f"{fields['total']:.3f} DT")
+        self.assertEqual(result["NumeroTicket"], "1007")
+        self.assertEqual(result["Articles"][-1], {"nom": "TIMBRE FISCAL", "prix": "0.100 DT"})
+
+    def test_no_total_line(self):
+        samples = []
+        for index in range(3):
+            fields, text = salem_ticket(index)
+            text = '\n'.join(line for line in text.splitlines() if not line.startswith("TOTAL"))
+            samples.append(Sample(SimpleNamespace(id=index, **fields), {'doctr': text}))
+        self.assertIsNone(learn_template('epicerie_salem', "Epicerie Salem", samples))
+
+    def test_cross_validation(self):
+        other = Sample(
+            SimpleNamespace(id=99, magasin="Aziza", total=Decimal('4.090'), numero_ticket='', date_ticket=None,
+                            articles_data=[{"nom": "LOT 2 SAVON MAIN 1L", "prix": "3.990 DT"}]),
+            {'doctr': AZIZA_TEXT},
+        )
+        stats = cross_validate('epicerie_salem', "Epicerie Salem", self.samples, [other], folds=3)
+        self.assertEqual((stats['tickets'], stats['covered'], stats['false_identifications']), (6, 6, 0))
+        self.assertEqual(stats['accuracy'], 1.0)
+        self.assertEqual(stats['covered_ids'], {1, 2, 3, 4, 5, 6})
+
+    def test_cross_validation_counts_wrong_corrections(self):
+        samples = [salem_sample(index) for index in range(6)]
+        samples[0].total = Decimal('9.999')
+        stats = cross_validate('epicerie_salem', "Epicerie Salem", samples, folds=3)
+        self.assertLess(stats['accuracy'], 1.0)
+        self.assertLess(stats['rules']['total'], 1.0)
+
+
+class LearnMerchantTemplatesCommandTests(TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir, ignore_errors=True)
+        for index in range(6):
+            fields, text = salem_ticket(index)
+            extraction = ExtractionHistory.objects.create(
+                image='tickets/salem.png', extracted_text=json.dumps({'doctr': text}),
+            )
+            TicketHistory.objects.create(extraction=extraction, **fields)
+
+    def learn(self, **options):
+        stdout = io.StringIO()
+        call_command('learn_merchant_templates', stdout=stdout, **options)
+        return stdout.getvalue()
+
+    def test_writes_the_learned_template(self):
+        output = self.learn(output_dir=self.output_dir)
+        path = os.path.join(self.output_dir, 'epicerie_salem.json')
+        self.assertIn(f"écrit : {path}", output)
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        self.assertEqual(data['magasin'], "Epicerie Salem")
+        self.assertEqual(data['learned']['accuracy'], 1.0)
+        self.assertIn("0/6 (0%) -> 6/6 (100%), 1 gabarit(s) écrit(s)", output)
+
+    def test_dry_run_writes_nothing(self):
+        output = self.learn(output_dir=self.output_dir, dry_run=True)
+        self.assertEqual(os.listdir(self.output_dir), [])
+        self.assertIn("(simulation)", output)
+
+    def test_too_few_tickets(self):
+        output = self.learn(output_dir=self.output_dir, min_tickets=10)
+        self.assertIn("trop peu pour apprendre un gabarit", output)
+        self.assertEqual(os.listdir(self.output_dir), [])
+
+    @override_settings(MERCHANT_TEMPLATES_DIR=None)
+    def test_missing_output_dir_fails_before_learning(self):
+        with self.assertRaisesMessage(CommandError, "MERCHANT_TEMPLATES_DIR"):
+            self.learn()
+        self.assertIn("(simulation)", self.learn(dry_run=True))
@@ -0,0 +1,62 @@
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from ocrapp import health, llm_clients
+from ocrapp.llm_accounting import collect_llm_calls
+
+TICKET_JSON = '{"Magasin": "AZIZA", "Total": "4.090 DT"}'
+
+
+class OldGeminiModel:
+    """
+    Modèle factice à la google-generativeai 0.3 : ni request_options ni response_schema
+    """
+
+    model_name = 'models/gemini-pro'
+
+    def __init__(self, request_options_error=TypeError):
+        self.request_options_error = request_options_error
+        self.calls = []
+
+    def generate_content(self, prompt, **kwargs):
+        self.calls.append(kwargs)
+        if 'request_options' in kwargs:
+            if self.request_options_error is TypeError:
+                raise TypeError("generate_content() got an unexpected keyword argument 'request_options'")
+            raise ValueError("Unknown field for GenerateContentRequest: request_options")
+        if 'response_schema' in kwargs.get('generation_config', {}):
+            raise ValueError("Unknown field for GenerationConfig: response_schema")
+        return SimpleNamespace(text=TICKET_JSON, usage_metadata=None)
+
+
+class GeminiFallbackTests(SimpleTestCase):
+
+    config = {'response_mime_type': 'application/json', 'response_schema': {'type': 'object'}}
+
+    def setUp(self):
+        patcher = mock.patch.dict(health._breakers, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def generate(self, model):
+        with collect_llm_calls('llm') as calls:
+            response = llm_clients.gemini_generate(model, 'prompt', generation_config=dict(self.config))
+        return response, calls
+
+    def test_model_rejecting_both_arguments(self):
+        for error in (TypeError, ValueError):
+            with self.subTest(error=error.__name__):
+                model = OldGeminiModel(error)
+                response, calls = self.generate(model)
+                self.assertEqual(response.text, TICKET_JSON)
+                self.assertEqual(model.calls[-1], {'generation_config': {'response_mime_type': 'application/json'}})
+                self.assertEqual(calls[0]['retries'], 1)
+
+    def test_other_type_errors_are_raised(self):
+        model = mock.Mock(model_name='gemini-pro')
+        model.generate_content.side_effect = TypeError("contents must not be None")
+        with self.assertRaisesMessage(TypeError, "contents must not be None"):
+            llm_clients.gemini_generate(model, None)
+        model.generate_content.assert_called_once()
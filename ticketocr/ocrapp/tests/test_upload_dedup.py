@@ -0,0 +1,144 @@
+import io
+import json
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from ocrapp import views
+from ocrapp.forms import TicketUploadForm
+from ocrapp.models import ExtractionHistory
+
+OCR_RESULTS = {'doctr': "AZIZA\nTotal 4.090", 'tesseract': "AZIZA\nTotaI 4.090", 'docling': "AZIZA\nTotal 4.090"}
+ANALYSIS = {"Magasin": "AZIZA", "Date": "03/01/2025", "Total": "4.090 DT", "Articles": []}
+
+
+def png_upload(name='ticket.png', color='white'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (32, 32), color).save(buffer, format='PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class MediaRootMixin:
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def upload(self, **kwargs):
+        form = TicketUploadForm({}, {'image': png_upload(**kwargs)})
+        self.assertTrue(form.is_valid(), form.errors)
+        return form, form.save()
+
+
+class UploadDeduplicationTests(MediaRootMixin, TestCase):
+
+    def test_same_file_reuses_the_entry(self):
+        _, first = self.upload(name='aziza1_JAVITpX.png')
+        form, second = self.upload(name='aziza1_XX6Vlms.png')
+        self.assertTrue(form.is_duplicate)
+        self.assertEqual(second.pk, first.pk)
+        self.assertEqual(ExtractionHistory.objects.count(), 1)
+
+    def test_other_file_is_a_new_entry(self):
+        _, first = self.upload()
+        form, second = self.upload(color='black')
+        self.assertFalse(form.is_duplicate)
+        self.assertNotEqual(second.pk, first.pk)
+
+    @override_settings(OCR_MODE='all')
+    def test_stored_ocr_texts_are_returned_without_running_engines(self):
+        _, extraction = self.upload()
+        extraction.extracted_text = json.dumps(OCR_RESULTS)
+        extraction.save()
+        with mock.patch.object(views, 'run_ocr_engines') as run_ocr_engines:
+            self.assertEqual(views.get_or_run_ocr(extraction), OCR_RESULTS)
+        run_ocr_engines.assert_not_called()
+
+    @override_settings(OCR_MODE='all')
+    def test_only_missing_engines_are_run(self):
+        _, extraction = self.upload()
+        extraction.extracted_text = json.dumps({'doctr': OCR_RESULTS['doctr']})
+        extraction.save()
+        with mock.patch.object(views, 'run_ocr_engines', return_value={
+            'tesseract': OCR_RESULTS['tesseract'], 'docling': "Erreur Docling: boom",
+        }) as run_ocr_engines:
+            results = views.get_or_run_ocr(extraction)
+        run_ocr_engines.assert_called_once_with(extraction.image.path, engines=['tesseract', 'docling'])
+        self.assertEqual(results['docling'], "Erreur Docling: boom")
+        extraction.refresh_from_db()
+        # Les erreurs ne sont pas stockées : le moteur sera relancé au prochain passage
+        self.assertEqual(extraction.get_ocr_results(), {'doctr': OCR_RESULTS['doctr'], 'tesseract': OCR_RESULTS['tesseract']})
+
+
+class StoredAnalysisTests(MediaRootMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        _, self.extraction = self.upload()
+
+    def test_analysis_is_reused_for_the_same_ocr_texts(self):
+        analyze = mock.Mock(return_value=dict(ANALYSIS))
+        views.get_or_run_analysis(self.extraction, 'llm', analyze, OCR_RESULTS)
+        self.extraction.refresh_from_db()
+        self.assertEqual(views.get_or_run_analysis(self.extraction, 'llm', analyze, dict(OCR_RESULTS)), ANALYSIS)
+        analyze.assert_called_once()
+
+    def test_analysis_is_recomputed_for_other_ocr_texts(self):
+        analyze = mock.Mock(return_value=dict(ANALYSIS))
+        views.get_or_run_analysis(self.extraction, 'llm', analyze, OCR_RESULTS)
+        views.get_or_run_analysis(self.extraction, 'llm', analyze, dict(OCR_RESULTS, doctr="AZIZA\nTotal 5.000"))
+        self.assertEqual(analyze.call_count, 2)
+
+    def test_no_cache_forces_a_new_analysis(self):
+        analyze = mock.Mock(return_value=dict(ANALYSIS))
+        views.get_or_run_analysis(self.extraction, 'llm', analyze, OCR_RESULTS)
+        views.get_or_run_analysis(self.extraction, 'llm', analyze, OCR_RESULTS, use_cache=False)
+        self.assertEqual(analyze.call_count, 2)
+
+    def test_errors_are_not_stored(self):
+        analyze = mock.Mock(return_value={"error": "Timeout API"})
+        views.get_or_run_analysis(self.extraction, 'llm', analyze, OCR_RESULTS)
+        views.get_or_run_analysis(self.extraction, 'llm', analyze, OCR_RESULTS)
+        self.assertEqual(analyze.call_count, 2)
+        self.extraction.refresh_from_db()
+        self.assertNotIn('llm', self.extraction.analysis_data)
+
+
+class ResubmitAnalysisTests(MediaRootMixin, TestCase):
+
+    def post_ocr_texts(self):
+        data = {'ocr_' + engine: text for engine, text in OCR_RESULTS.items()}
+        return self.client.post(reverse('upload_ticket'), data)
+
+    def test_latest_upload_fallback_does_not_reuse_or_store_analyses(self):
+        _, other = self.upload()
+        other.analysis_data = {'llm': {"Magasin": "AUTRE"}, 'ocr_hashes': {'llm': views.ocr_texts_hash(OCR_RESULTS)}}
+        other.save()
+        with mock.patch.object(views, 'analyze_three_texts_with_llm', return_value=dict(ANALYSIS)) as analyze:
+            response = self.post_ocr_texts()
+        self.assertEqual(response.status_code, 200)
+        analyze.assert_called_once()
+        self.assertEqual(response.context['llm_analysis']['Magasin'], "AZIZA")
+        other.refresh_from_db()
+        self.assertEqual(other.analysis_data['llm'], {"Magasin": "AUTRE"})
+
+    def test_session_upload_analysis_is_reused(self):
+        _, extraction = self.upload()
+        session = self.client.session
+        session['current_image_id'] = extraction.pk
+        session.save()
+        with mock.patch.object(views, 'analyze_three_texts_with_llm', return_value=dict(ANALYSIS)) as analyze:
+            self.post_ocr_texts()
+            self.post_ocr_texts()
+        analyze.assert_called_once()
+        extraction.refresh_from_db()
+        self.assertEqual(extraction.analysis_data['llm']['Magasin'], "AZIZA")
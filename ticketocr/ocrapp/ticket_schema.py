@@ -0,0 +1,156 @@
+"""
+Schéma JSON du ticket et sorties structurées des backends LLM.
+
+Le même schéma (Magasin, NumeroTicket, Date, Articles[nom, prix], Total) est
+passé à l'option native de chaque backend : `format` d'Ollama, `response_format`
+des API compatibles OpenAI (routeur HuggingFace) et `response_schema` de
+Gemini. Le modèle ne peut alors produire qu'un objet conforme :
+parse_ticket_strict() le valide en un seul json.loads, et le nettoyage
+heuristique (clean_json_response) n'est plus qu'un repli pour les réponses
+non conformes (backend sans sortie structurée, LLM_STRUCTURED_OUTPUT=False).
+Comme le demandent les prompts, un champ texte introuvable vaut null (schéma et
+validate_ticket l'acceptent) ; Articles est toujours une liste, vide au besoin.
+"""
+import json
+
+from django.conf import settings
+
+TICKET_FIELDS = ('Magasin', 'NumeroTicket', 'Date', 'Articles', 'Total')
+
+TICKET_JSON_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'Magasin': {'type': ['string', 'null']},
+        'NumeroTicket': {'type': ['string', 'null']},
+        'Date': {'type': ['string', 'null']},
+        'Articles': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'properties': {
+                    'nom': {'type': 'string'},
+                    'prix': {'type': 'string'},
+                },
+                'required': ['nom', 'prix'],
+                'additionalProperties': False,
+            },
+        },
+        'Total': {'type': ['string', 'null']},
+    },
+    'required': list(TICKET_FIELDS),
+    'additionalProperties': False,
+}
+
+
+# Analyse groupée (llm_batch.py) : {"tickets": [ticket + id, ...]} ; l'objet englobant permet
+# l'arrêt anticipé du streaming à la fermeture de l'objet de premier niveau
+BATCH_JSON_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'tickets': {
+            'type': 'array',
+            'items': dict(
+                TICKET_JSON_SCHEMA,
+                properties=dict({'id': {'type': 'string'}}, **TICKET_JSON_SCHEMA['properties']),
+                required=['id'] + list(TICKET_FIELDS),
+            ),
+        },
+    },
+    'required': ['tickets'],
+    'additionalProperties': False,
+}
+
+
+def structured_output_enabled():
+    return getattr(settings, 'LLM_STRUCTURED_OUTPUT', True)
+
+
+def ollama_schema_options(schema=TICKET_JSON_SCHEMA):
+    """
+    Paramètres /api/generate : `format` accepte un schéma JSON depuis Ollama 0.5
+    (ollama_generate se replie sur format='json' pour les versions antérieures)
+    """
+    if not structured_output_enabled():
+        return {}
+    return {'format': schema}
+
+
+def openai_schema_options(schema=TICKET_JSON_SCHEMA, name='ticket'):
+    """
+    Paramètres chat.completions.create pour une API compatible OpenAI
+    """
+    if not structured_output_enabled():
+        return {}
+    return {
+        'response_format': {
+            'type': 'json_schema',
+            'json_schema': {'name': name, 'schema': schema, 'strict': True},
+        }
+    }
+
+
+def _gemini_schema(schema):
+    # Gemini accepte un sous-ensemble OpenAPI : pas d'additionalProperties, null via 'nullable'
+    converted = {}
+    for key, value in schema.items():
+        if key == 'additionalProperties':
+            continue
+        if key == 'type' and isinstance(value, list):
+            converted['type'] = next(t for t in value if t != 'null')
+            converted['nullable'] = 'null' in value
+        elif key == 'properties':
+            converted[key] = {name: _gemini_schema(sub) for name, sub in value.items()}
+        elif key == 'items':
+            converted[key] = _gemini_schema(value)
+        else:
+            converted[key] = value
+    return converted
+
+
+def gemini_schema_options():
+    """
+    Paramètres generate_content de Gemini
+    """
+    if not structured_output_enabled():
+        return {}
+    return {
+        'generation_config': {
+            'response_mime_type': 'application/json',
+            'response_schema': _gemini_schema(TICKET_JSON_SCHEMA),
+        }
+    }
+
+
+def _is_text(value, nullable=False):
+    return isinstance(value, str) or (nullable and value is None)
+
+
+def validate_ticket(data):
+    """
+    Vrai si data respecte le schéma du ticket (types compris)
+    """
+    if not isinstance(data, dict) or any(field not in data for field in TICKET_FIELDS):
+        return False
+    if not (_is_text(data['Magasin'], True) and _is_text(data['NumeroTicket'], True)
+            and _is_text(data['Date'], True) and _is_text(data['Total'], True)):
+        return False
+    articles = data['Articles']
+    if not isinstance(articles, list):
+        return False
+    return all(
+        isinstance(article, dict) and _is_text(article.get('nom')) and _is_text(article.get('prix'))
+        for article in articles
+    )
+
+
+def parse_ticket_strict(text):
+    """
+    Parse une réponse déjà conforme au schéma ; None sinon (l'appelant passe alors au nettoyage heuristique)
+    """
+    if not text or not isinstance(text, str):
+        return None
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return None
+    return data if validate_ticket(data) else None
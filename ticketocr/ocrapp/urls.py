@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import upload_ticket, download_accounting_excel, download_cumulative_excel, view_history, filter_accounting_data, manage_budget, get_ticket_details, update_ticket, save_ticket_analysis
+from .views import upload_ticket, download_accounting_excel, download_cumulative_excel, view_history, filter_accounting_data, manage_budget, get_ticket_details, update_ticket, save_ticket_analysis, system_status, llm_usage_report
 
 urlpatterns = [
     path('', upload_ticket, name='upload_ticket'),
@@ -11,4 +11,6 @@ urlpatterns = [
     path('ticket/<int:ticket_id>/', get_ticket_details, name='get_ticket_details'),
     path('ticket/<int:ticket_id>/update/', update_ticket, name='update_ticket'),
     path('save-ticket-analysis/', save_ticket_analysis, name='save_ticket_analysis'),
+    path('system-status/', system_status, name='system_status'),
+    path('llm-usage/', llm_usage_report, name='llm_usage_report'),
 ]
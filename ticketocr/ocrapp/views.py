@@ -1,4 +1,5 @@
 import requests
+import hashlib
 import json
 import re
 from datetime import datetime
@@ -12,9 +13,23 @@ from pathlib import Path
 from django.shortcuts import render
 from .forms import TicketUploadForm
 from .models import ExtractionHistory, TicketHistory, AccountingEntry
-from doctr.models import ocr_predictor
-from doctr.io import DocumentFile
-from docling.document_converter import DocumentConverter
+from .ocr_engines import extract_text_doctr, extract_text_docling, extract_text_tesseract
+from .llm_cache import get_cached_completion, llm_cache_bypass, llm_cache_stats, normalize_ocr_text, store_completion
+from .llm_clients import (
+    gemini_generate, get_gemini_model, get_hf_client, get_llm_timeout, hf_chat, llm_connection_stats, ollama_generate,
+)
+from .json_extract import extract_ticket_json
+from .llm_accounting import collect_llm_calls, save_llm_calls
+from .llm_batch import analyze_tickets_batch
+from .llm_hedge import is_valid_ticket_result, run_hedged
+from .amounts import MILLIME, TIMBRES_FISCAUX, ZERO, format_amount, is_timbre_article, parse_amount, parse_timbre
+from .merchant_templates import analyze_with_template
+from .health import health_status, system_issues
+from .ocr_cache import ERROR_PREFIXES, ocr_cache_stats
+from .ocr_consensus import ocr_prompt_text
+from .ocr_pipeline import OCR_ENGINES, run_ocr_adaptive, run_ocr_engines
+from .receipt_tokenizer import regex_elements
+from .ticket_schema import gemini_schema_options, ollama_schema_options, openai_schema_options, parse_ticket_strict
 import os
 import logging
 from django.conf import settings
@@ -42,187 +57,44 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 def diagnose_system():
-    """Diagnostic function to check system health"""
-    issues = []
-    
-    # Check Ollama connection
-    try:
-        response = requests.get("http://localhost:11434/api/tags", timeout=5)
-        if response.status_code != 200:
-            issues.append("Ollama server not responding properly")
-        else:
-            logger.info("âœ“ Ollama server is running")
-    except requests.exceptions.ConnectionError:
-        issues.append("Cannot connect to Ollama server - is it running?")
-    except requests.exceptions.Timeout:
-        issues.append("Ollama server timeout - server may be overloaded")
-    except Exception as e:
-        issues.append(f"Ollama connection error: {str(e)}")
-    
-    # Check media directory
-    try:
-        media_root = getattr(settings, 'MEDIA_ROOT', None)
-        if not media_root:
-            issues.append("MEDIA_ROOT not configured in settings")
-        elif not os.path.exists(media_root):
-            issues.append(f"Media directory doesn't exist: {media_root}")
-        else:
-            logger.info(f"âœ“ Media directory exists: {media_root}")
-    except Exception as e:
-        issues.append(f"Media directory check failed: {str(e)}")
-    
-    # Check required Python packages
-    required_packages = ['doctr', 'pytesseract', 'docling', 'PIL', 'pdf2image']
-    for package in required_packages:
-        try:
-            __import__(package)
-            logger.info(f"âœ“ {package} is available")
-        except ImportError:
-            issues.append(f"Missing required package: {package}")
+    """Diagnostic function to check system health
+
+    Lit l'état mis en cache par le registre de santé (health.py, sondes en arrière-plan)
+    au lieu d'appeler Ollama et de réimporter les moteurs OCR à chaque requête.
+    """
+    issues = system_issues()
     
     if issues:
         logger.error("System issues found:")
         for issue in issues:
             logger.error(f"  - {issue}")
-    else:
-        logger.info("âœ“ All system checks passed")
     
     return issues
 
 def clean_json_response(text):
     """
-    Nettoie une rÃ©ponse JSON malformÃ©e de maniÃ¨re plus robuste
+    Extrait le JSON du ticket d'une réponse malformée (réflexion, texte autour, guillemets simples...)
+    en un seul passage sur le texte (see ocrapp/json_extract.py)
     """
-    if not text or not isinstance(text, str):
-        return None
-    
-    print(f"Texte original reÃ§u: {text[:200]}...")
-    
-    # Supprimer les balises <think> et leur contenu
-    text = re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL)
-    text = re.sub(r'<.*?>', '', text)  # Supprimer toutes les balises HTML/XML
-    
-    # Nettoyer les espaces et sauts de ligne excessifs
-    text = re.sub(r'\n+', '\n', text)
-    text = re.sub(r'\s+', ' ', text)
-    text = text.strip()
-    
-    # Chercher le JSON le plus externe
-    start_positions = [i for i, char in enumerate(text) if char == '{']
-    end_positions = [i for i, char in enumerate(text) if char == '}']
-    
-    if start_positions and end_positions:
-        # Essayer le JSON le plus externe d'abord
-        outer_start = start_positions[0]
-        outer_end = end_positions[-1]
-        if outer_end > outer_start:
-            json_candidate = text[outer_start:outer_end+1]
-            try:
-                # Nettoyer le JSON
-                cleaned_json = json_candidate.strip()
-                # Remplacer les guillemets simples par des guillemets doubles
-                cleaned_json = re.sub(r"'([^']*)'", r'"\1"', cleaned_json)
-                # Supprimer les virgules trailing
-                cleaned_json = re.sub(r',(\s*[}\]])', r'\1', cleaned_json)
-                
-                result = json.loads(cleaned_json)
-                # VÃ©rifier que c'est un objet avec les clÃ©s principales
-                main_keys = ['Magasin', 'Date', 'NumeroTicket', 'Articles', 'Total']
-                if isinstance(result, dict) and sum(1 for k in main_keys if k in result) >= 2:
-                    print(f"âœ… JSON externe valide trouvÃ©")
-                    return result
-            except Exception as e:
-                print(f"âŒ Erreur parsing JSON externe: {e}")
-    
-    # Essayer tous les JSON possibles
-    best_json = None
-    best_score = 0
-    
-    for start in start_positions:
-        for end in end_positions:
-            if end > start:
-                json_candidate = text[start:end+1]
-                try:
-                    cleaned_json = json_candidate.strip()
-                    cleaned_json = re.sub(r"'([^']*)'", r'"\1"', cleaned_json)
-                    cleaned_json = re.sub(r',(\s*[}\]])', r'\1', cleaned_json)
-                    
-                    result = json.loads(cleaned_json)
-                    main_keys = ['Magasin', 'Date', 'NumeroTicket', 'Articles', 'Total']
-                    
-                    if isinstance(result, dict):
-                        score = sum(1 for k in main_keys if k in result)
-                        if score >= 2 and score > best_score:
-                            best_json = result
-                            best_score = score
-                            print(f"âœ… JSON trouvÃ© avec score {score}")
-                except Exception as e:
-                    print(f"âŒ Erreur parsing JSON candidat: {e}")
-                    continue
-    
-    if best_json:
-        return best_json
-    
-    # Dernier essai : chercher le JSON avec une regex plus permissive
-    # Chercher le dernier JSON valide dans le texte
-    json_pattern = r'\{(?:[^{}]|(?:\{[^{}]*\}))*\}'
-    json_matches = re.findall(json_pattern, text, re.DOTALL)
-    
-    # Essayer le dernier JSON trouvÃ© (le plus probable d'Ãªtre complet)
-    for json_match in reversed(json_matches):
-        try:
-            cleaned_json = json_match.strip()
-            cleaned_json = re.sub(r"'([^']*)'", r'"\1"', cleaned_json)
-            cleaned_json = re.sub(r',(\s*[}\]])', r'\1', cleaned_json)
-            
-            result = json.loads(cleaned_json)
-            main_keys = ['Magasin', 'Date', 'NumeroTicket', 'Articles', 'Total']
-            
-            if isinstance(result, dict) and sum(1 for k in main_keys if k in result) >= 2:
-                print(f"âœ… JSON trouvÃ© via regex (dernier)")
-                return result
-        except Exception as e:
-            print(f"âŒ Erreur parsing JSON regex: {e}")
-            continue
-    
-    # Si rien trouvÃ©, essayer de chercher juste aprÃ¨s "}" pour voir s'il y a du JSON valide
-    if '}' in text:
-        last_brace_pos = text.rfind('}')
-        if last_brace_pos > 0:
-            # Chercher le dÃ©but du JSON en remontant
-            brace_count = 0
-            start_pos = last_brace_pos
-            for i in range(last_brace_pos, -1, -1):
-                if text[i] == '}':
-                    brace_count += 1
-                elif text[i] == '{':
-                    brace_count -= 1
-                    if brace_count == 0:
-                        start_pos = i
-                        break
-            
-            if start_pos < last_brace_pos:
-                json_candidate = text[start_pos:last_brace_pos + 1]
-                try:
-                    cleaned_json = json_candidate.strip()
-                    cleaned_json = re.sub(r"'([^']*)'", r'"\1"', cleaned_json)
-                    cleaned_json = re.sub(r',(\s*[}\]])', r'\1', cleaned_json)
-                    
-                    result = json.loads(cleaned_json)
-                    main_keys = ['Magasin', 'Date', 'NumeroTicket', 'Articles', 'Total']
-                    
-                    if isinstance(result, dict) and sum(1 for k in main_keys if k in result) >= 2:
-                        print(f"âœ… JSON trouvÃ© via recherche de braces")
-                        return result
-                except Exception as e:
-                    print(f"âŒ Erreur parsing JSON via braces: {e}")
-    
-    print("âŒ Aucun JSON valide trouvÃ©")
-    return None
+    result = extract_ticket_json(text)
+    if result is None and text and isinstance(text, str):
+        print(f"Aucun JSON valide trouvé dans: {text[:200]}...")
+    return result
+
 
+def parse_ticket_json(text):
+    """
+    Réponse conforme au schéma du ticket (sortie structurée) : validation stricte sans nettoyage ;
+    sinon nettoyage heuristique avec clean_json_response
+    """
+    parsed = parse_ticket_strict(text)
+    if parsed is not None:
+        return parsed
+    return clean_json_response(text)
 
 
-def analyze_three_texts_with_llm_fast(ocr_results):
+
+def analyze_three_texts_with_llm_fast(ocr_results, cancel_event=None, allow_fallback=True):
     """
     Version rapide avec un modÃ¨le plus lÃ©ger
     """
@@ -230,9 +102,8 @@ def analyze_three_texts_with_llm_fast(ocr_results):
     tesseract_text = ocr_results.get("tesseract", "")
     doctr_text = ocr_results.get("doctr", "")
     
-    prompt = f"""Tu es un assistant expert en analyse de tickets de caisse.
-
-Voici trois extraits OCR du mÃªme ticket :
+    # Textes bruts des trois moteurs, ou texte consolidé (LLM_PROMPT_OCR_MODE='consensus')
+    ocr_block = ocr_prompt_text(ocr_results, f"""Voici trois extraits OCR du mÃªme ticket :
 
 --- OCR DocLing ---
 {docling_text}
@@ -241,7 +112,11 @@ Voici trois extraits OCR du mÃªme ticket :
 {tesseract_text}
 
 --- OCR Doctr ---
-{doctr_text}
+{doctr_text}""", 'mistral')
+
+    prompt = f"""Tu es un assistant expert en analyse de tickets de caisse.
+
+{ocr_block}
 
 Extrais les Ã©lÃ©ments suivants et retourne UNIQUEMENT un objet JSON valide :
 
@@ -264,17 +139,15 @@ RÃˆGLES IMPORTANTES :
 """
     try:
         print("Tentative avec modÃ¨le rapide (mistral)...")
-        response = requests.post(
-            "http://localhost:11434/api/generate",
-            json={"model": "mistral", "prompt": prompt, "stream": False},
-            timeout=30
-        )
-        print("RÃ©ponse reÃ§ue de l'API Ollama (modÃ¨le rapide)")
-        result_text = response.json().get("response", "")
+        result_text = get_cached_completion('ollama/mistral', ocr_results)
+        if result_text is None:
+            result_text = ollama_generate("mistral", prompt, cancel_event=cancel_event, **ollama_schema_options())
+            print("RÃ©ponse reÃ§ue de l'API Ollama (modÃ¨le rapide)")
         
         # Parser le JSON de la rÃ©ponse LLM
-        parsed_data = clean_json_response(result_text)
+        parsed_data = parse_ticket_json(result_text)
         if parsed_data:
+            store_completion('ollama/mistral', ocr_results, result_text)
             result_data = {
                 "Date": parsed_data.get("Date", ""),
                 "Magasin": parsed_data.get("Magasin", ""),
@@ -282,7 +155,8 @@ RÃˆGLES IMPORTANTES :
                 "Total": parsed_data.get("Total", ""),
                 "Articles": parsed_data.get("Articles", []),
                 "Commentaire": "DonnÃ©es extraites par modÃ¨le rapide",
-                "texte_fusionne": result_text.strip()
+                "texte_fusionne": result_text.strip(),
+                "backend_used": "mistral"
             }
             
             # Post-traitement pour s'assurer que le timbre fiscal est bien dÃ©tectÃ©
@@ -302,16 +176,19 @@ RÃˆGLES IMPORTANTES :
             "Total": "",
             "Articles": [],
             "Commentaire": "Texte fusionnÃ© et corrigÃ© (modÃ¨le rapide)",
-            "texte_fusionne": result_text.strip()
+            "texte_fusionne": result_text.strip(),
+            "backend_used": "mistral"
         }
     except requests.exceptions.Timeout:
+        if not allow_fallback:
+            return {"error": "Timeout API (modèle rapide)"}
         print("Timeout avec mistral, essai avec modÃ¨le ultra-rapide...")
         return analyze_three_texts_with_llm_ultra_fast(ocr_results)
     except Exception as e:
         print("Erreur avec modÃ¨le rapide:", str(e))
         return {"error": f"Erreur API (modÃ¨le rapide) : {str(e)}"}
 
-def analyze_three_texts_with_llm_ultra_fast(ocr_results):
+def analyze_three_texts_with_llm_ultra_fast(ocr_results, cancel_event=None):
     """
     Version ultra-rapide avec un modÃ¨le trÃ¨s lÃ©ger
     """
@@ -319,9 +196,8 @@ def analyze_three_texts_with_llm_ultra_fast(ocr_results):
     tesseract_text = ocr_results.get("tesseract", "")
     doctr_text = ocr_results.get("doctr", "")
     
-    prompt = f"""Tu es un assistant expert en analyse de tickets de caisse.
-
-Voici trois extraits OCR du mÃªme ticket :
+    # Textes bruts des trois moteurs, ou texte consolidé (LLM_PROMPT_OCR_MODE='consensus')
+    ocr_block = ocr_prompt_text(ocr_results, f"""Voici trois extraits OCR du mÃªme ticket :
 
 --- OCR DocLing ---
 {docling_text}
@@ -330,7 +206,11 @@ Voici trois extraits OCR du mÃªme ticket :
 {tesseract_text}
 
 --- OCR Doctr ---
-{doctr_text}
+{doctr_text}""", 'llama2')
+
+    prompt = f"""Tu es un assistant expert en analyse de tickets de caisse.
+
+{ocr_block}
 
 Extrais les Ã©lÃ©ments suivants et retourne UNIQUEMENT un objet JSON valide :
 
@@ -353,17 +233,15 @@ RÃˆGLES IMPORTANTES :
 """
     try:
         print("Tentative avec modÃ¨le ultra-rapide (llama2)...")
-        response = requests.post(
-            "http://localhost:11434/api/generate",
-            json={"model": "llama2", "prompt": prompt, "stream": False},
-            timeout=15
-        )
-        print("RÃ©ponse reÃ§ue de l'API Ollama (modÃ¨le ultra-rapide)")
-        result_text = response.json().get("response", "")
+        result_text = get_cached_completion('ollama/llama2', ocr_results)
+        if result_text is None:
+            result_text = ollama_generate("llama2", prompt, cancel_event=cancel_event, **ollama_schema_options())
+            print("RÃ©ponse reÃ§ue de l'API Ollama (modÃ¨le ultra-rapide)")
         
         # Parser le JSON de la rÃ©ponse LLM
-        parsed_data = clean_json_response(result_text)
+        parsed_data = parse_ticket_json(result_text)
         if parsed_data:
+            store_completion('ollama/llama2', ocr_results, result_text)
             result_data = {
                 "Date": parsed_data.get("Date", ""),
                 "Magasin": parsed_data.get("Magasin", ""),
@@ -371,7 +249,8 @@ RÃˆGLES IMPORTANTES :
                 "Total": parsed_data.get("Total", ""),
                 "Articles": parsed_data.get("Articles", []),
                 "Commentaire": "DonnÃ©es extraites par modÃ¨le ultra-rapide",
-                "texte_fusionne": result_text.strip()
+                "texte_fusionne": result_text.strip(),
+                "backend_used": "llama2"
             }
             
             # Post-traitement pour s'assurer que le timbre fiscal est bien dÃ©tectÃ©
@@ -391,7 +270,8 @@ RÃˆGLES IMPORTANTES :
             "Total": "",
             "Articles": [],
             "Commentaire": "Texte fusionnÃ© et corrigÃ© (modÃ¨le ultra-rapide)",
-            "texte_fusionne": result_text.strip()
+            "texte_fusionne": result_text.strip(),
+            "backend_used": "llama2"
         }
     except Exception as e:
         print("Erreur avec modÃ¨le ultra-rapide:", str(e))
@@ -400,7 +280,6 @@ RÃˆGLES IMPORTANTES :
 import os
 import json
 import re
-from openai import OpenAI
 try:
     import google.generativeai as genai
 except Exception:
@@ -409,37 +288,15 @@ except Exception:
 from dotenv import load_dotenv
 load_dotenv()
 
-# Initialiser le client OpenAI avec l'URL HuggingFace
-try:
-    hf_token = os.environ.get("HF_TOKEN", "")
-    if not hf_token:
-        print("âš ï¸ Token HuggingFace manquant dans .env")
-        client = None
-    else:
-        client = OpenAI(
-            base_url="https://router.huggingface.co/v1",
-            api_key=hf_token,
-        )
-        print("âœ… Client HuggingFace initialisÃ©")
-except Exception as e:
-    print(f"âŒ Erreur initialisation client HuggingFace: {e}")
-    client = None
-
-def analyze_three_texts_with_llm(ocr_results):
+def analyze_three_texts_with_qwen(ocr_results, cancel_event=None):
+    """
+    Analyse via HuggingFace Qwen. Lève une exception si l'API est indisponible
+    (l'appelant choisit le repli) ; retourne un dict d'erreur si la réponse n'est pas du JSON.
+    """
     docling_text = ocr_results.get("docling", "")
     tesseract_text = ocr_results.get("tesseract", "")
     doctr_text = ocr_results.get("doctr", "")
 
-    if not docling_text.strip() and not tesseract_text.strip() and not doctr_text.strip():
-        return {
-            "Date": "",
-            "Magasin": "",
-            "NumeroTicket": "",
-            "Total": "",
-            "Articles": [],
-            "Commentaire": "Aucun texte OCR extrait - les textes sont vides"
-        }
-
     prompt = f"""Tu es un assistant expert en analyse de tickets de caisse.
 
 Voici un extrait OCR du ticket de caisse :
@@ -471,67 +328,163 @@ NE RENVOIE QUE UN OBJET JSON. PAS DE COMMENTAIRES, PAS DE TEXTE, PAS DE PENSÃ
 Commence DIRECTEMENT par '{' et termine par '}'.
 """
 
-    try:
-        # VÃ©rifier si le client est disponible
-        if client is None:
-            print("âŒ Client HuggingFace non disponible, utilisation du fallback Ollama")
-            raise Exception("Client HuggingFace non initialisÃ©")
-            
-        print("ðŸ”„ Appel Ã  l'API HuggingFace avec Qwen...")
+    # VÃ©rifier si le client est disponible (client partagé, connexions réutilisées)
+    if get_hf_client() is None:
+        print("âŒ Client HuggingFace non disponible, utilisation du fallback Ollama")
+        raise Exception("Client HuggingFace non initialisÃ©")
 
-        completion = client.chat.completions.create(
-            model="Qwen/Qwen3-30B-A3B:novita",
-            messages=[
-                {"role": "user", "content": prompt}
-            ],
+    print("ðŸ”„ Appel Ã  l'API HuggingFace avec Qwen...")
+
+    result_text = get_cached_completion("Qwen/Qwen3-30B-A3B:novita", ocr_results)
+    if result_text is None:
+        result_text = hf_chat(
+            "Qwen/Qwen3-30B-A3B:novita",
+            prompt,
+            timeout=get_llm_timeout('qwen'),
+            cancel_event=cancel_event,
             temperature=0,
-            timeout=30  # Timeout de 30 secondes
+            **openai_schema_options()
         )
 
-        result_text = completion.choices[0].message.content.strip()
-
-        # Clean and extract JSON with error handling
-        try:
-            # Utiliser la fonction de nettoyage amÃ©liorÃ©e
-            parsed_data = clean_json_response(result_text)
-            
-            if not parsed_data:
-                print("âŒ Aucun JSON valide trouvÃ© dans la rÃ©ponse LLM")
-                return {
-                    "error": "Invalid JSON response from LLM: No valid JSON found",
-                    "raw_response": result_text,
-                    "Commentaire": "La rÃ©ponse LLM ne contient pas de JSON valide"
-                }
-                
-            print(f"âœ… JSON parsÃ© avec succÃ¨s")
-            
-            result_data = {
-                "Date": parsed_data.get("Date", ""),
-                "Magasin": parsed_data.get("Magasin", ""),
-                "NumeroTicket": parsed_data.get("NumeroTicket", ""),
-                "Total": parsed_data.get("Total", ""),
-                "Articles": parsed_data.get("Articles", []),
-                "Commentaire": "DonnÃ©es extraites via HuggingFace Qwen",
-                "texte_fusionne": result_text
-            }
-
-            # Post-traitement personnalisÃ©
-            result_data = post_process_timbre_fiscal(result_data)
-            texte_ocr_combined = f"{docling_text}\n{tesseract_text}\n{doctr_text}"
-            result_data = valider_et_corriger_avec_regex(result_data, texte_ocr_combined)
-
-            return result_data
-            
-        except Exception as e:
-            logger.error(f"Erreur lors du parsing JSON: {str(e)}")
+    # Clean and extract JSON with error handling
+    try:
+        # Utiliser la fonction de nettoyage amÃ©liorÃ©e
+        parsed_data = parse_ticket_json(result_text)
+        
+        if not parsed_data:
+            print("âŒ Aucun JSON valide trouvÃ© dans la rÃ©ponse LLM")
             return {
-                "error": f"Invalid JSON response from LLM: {str(e)}",
+                "error": "Invalid JSON response from LLM: No valid JSON found",
                 "raw_response": result_text,
-                "Commentaire": f"Erreur lors du parsing JSON: {str(e)}"
+                "Commentaire": "La rÃ©ponse LLM ne contient pas de JSON valide"
             }
+            
+        print(f"âœ… JSON parsÃ© avec succÃ¨s")
+        store_completion("Qwen/Qwen3-30B-A3B:novita", ocr_results, result_text)
+        
+        result_data = {
+            "Date": parsed_data.get("Date", ""),
+            "Magasin": parsed_data.get("Magasin", ""),
+            "NumeroTicket": parsed_data.get("NumeroTicket", ""),
+            "Total": parsed_data.get("Total", ""),
+            "Articles": parsed_data.get("Articles", []),
+            "Commentaire": "DonnÃ©es extraites via HuggingFace Qwen",
+            "texte_fusionne": result_text,
+            "backend_used": "qwen"
+        }
+
+        # Post-traitement personnalisÃ©
+        result_data = post_process_timbre_fiscal(result_data)
+        texte_ocr_combined = f"{docling_text}\n{tesseract_text}\n{doctr_text}"
+        result_data = valider_et_corriger_avec_regex(result_data, texte_ocr_combined)
+
+        return result_data
+        
+    except Exception as e:
+        logger.error(f"Erreur lors du parsing JSON: {str(e)}")
+        return {
+            "error": f"Invalid JSON response from LLM: {str(e)}",
+            "raw_response": result_text,
+            "Commentaire": f"Erreur lors du parsing JSON: {str(e)}"
+        }
+
+def analyze_three_texts_with_regex(ocr_results, erreur):
+    """
+    Dernier recours : analyse simple avec regex
+    """
+    texte_ocr_combined = "\n".join(ocr_results.get(engine, "") for engine in ("docling", "tesseract", "doctr"))
+    regex_result = extraire_elements_avec_regex(texte_ocr_combined)
+    
+    return {
+        "Date": regex_result.get("dates_valides", [""])[0] if regex_result.get("dates_valides") else "",
+        "Magasin": "",
+        "NumeroTicket": "",
+        "Total": regex_result.get("total", ""),
+        "Articles": regex_result.get("articles", []),
+        "Commentaire": f"Analyse par regex (fallback) - Erreur API: {erreur}",
+        "texte_fusionne": texte_ocr_combined,
+        "backend_used": "regex",
+        "ValidationRegex": {
+            "total_coherent": regex_result.get("total_coherent", False),
+            "somme_articles": regex_result.get("somme_articles", ""),
+            "total_detecte": regex_result.get("total", "")
+        }
+    }
+
+def analyze_three_texts_with_llm_hedged(ocr_results):
+    """
+    Mode couvert (LLM_HEDGING_ENABLED) : Qwen, mistral puis llama2 sont lancés en décalé
+    (LLM_HEDGE_DELAY_S) au lieu d'attendre l'échec du précédent ; la première réponse
+    JSON valide l'emporte et les autres appels sont annulés.
+    """
+    backends = {
+        "qwen": analyze_three_texts_with_qwen,
+        "mistral": lambda results, cancel_event: analyze_three_texts_with_llm_fast(
+            results, cancel_event=cancel_event, allow_fallback=False),
+        "llama2": analyze_three_texts_with_llm_ultra_fast,
+    }
+    order = [name for name in getattr(settings, 'LLM_HEDGE_ORDER', ['qwen', 'mistral', 'llama2']) if name in backends]
+    attempts = [(name, lambda cancel_event, analyze=backends[name]: analyze(ocr_results, cancel_event)) for name in order]
+
+    winner, result = run_hedged(
+        attempts,
+        delay=getattr(settings, 'LLM_HEDGE_DELAY_S', 3.0),
+        timeout=getattr(settings, 'LLM_HEDGE_TIMEOUT_S', 45.0),
+    )
+    if winner is not None:
+        return result
+
+    erreurs = "; ".join(f"{name}: {outcome.get('error', 'JSON invalide') if isinstance(outcome, dict) else outcome}"
+                        for name, outcome in result.items()) or "aucune réponse dans le délai"
+    print(f"Aucun backend LLM valide ({erreurs}), analyse par regex")
+    return analyze_three_texts_with_regex(ocr_results, erreurs)
+
+def analyze_with_merchant_template(ocr_results):
+    """
+    Analyse sans LLM par le gabarit de l'enseigne (voir merchant_templates.py) ; None si aucun ne s'applique
+    """
+    if not getattr(settings, 'MERCHANT_TEMPLATES_ENABLED', True):
+        return None
+    try:
+        result_data = analyze_with_template(ocr_results)
+    except Exception as e:
+        logger.warning(f"Gabarits d'enseigne indisponibles: {e}")
+        return None
+    if result_data is None:
+        return None
+    print(f"Ticket extrait sans LLM ({result_data['backend_used']})")
+    result_data = post_process_timbre_fiscal(result_data)
+    texte_ocr_combined = "\n".join(ocr_results.get(engine, "") for engine in ("docling", "tesseract", "doctr"))
+    return valider_et_corriger_avec_regex(result_data, texte_ocr_combined)
+
+def analyze_three_texts_with_llm(ocr_results):
+    docling_text = ocr_results.get("docling", "")
+    tesseract_text = ocr_results.get("tesseract", "")
+    doctr_text = ocr_results.get("doctr", "")
+
+    if not docling_text.strip() and not tesseract_text.strip() and not doctr_text.strip():
+        return {
+            "Date": "",
+            "Magasin": "",
+            "NumeroTicket": "",
+            "Total": "",
+            "Articles": [],
+            "Commentaire": "Aucun texte OCR extrait - les textes sont vides"
+        }
+
+    # Enseigne connue : extraction par gabarit, le LLM n'est appelé que si aucun gabarit ne valide
+    template_result = analyze_with_merchant_template(ocr_results)
+    if template_result is not None:
+        return template_result
+
+    if getattr(settings, 'LLM_HEDGING_ENABLED', False):
+        return analyze_three_texts_with_llm_hedged(ocr_results)
+
+    try:
+        return analyze_three_texts_with_qwen(ocr_results)
 
     except Exception as e:
-        print("Erreur lors de l'appel Ã  l'API HuggingFace:", str(e))
+        print("Erreur lors de l'appel Ã  l'API HuggingFace:", str(e))
         # Fallback vers les modÃ¨les Ollama locaux
         try:
             print("Tentative de fallback vers Ollama...")
@@ -540,23 +493,7 @@ Commence DIRECTEMENT par '{' et termine par '}'.
             print(f"Erreur avec fallback Ollama: {str(fallback_error)}")
             # Dernier recours : analyse simple avec regex
             try:
-                texte_ocr_combined = f"{docling_text}\n{tesseract_text}\n{doctr_text}"
-                regex_result = extraire_elements_avec_regex(texte_ocr_combined)
-                
-                return {
-                    "Date": regex_result.get("dates_valides", [""])[0] if regex_result.get("dates_valides") else "",
-                    "Magasin": "",
-                    "NumeroTicket": "",
-                    "Total": regex_result.get("total", ""),
-                    "Articles": regex_result.get("articles", []),
-                    "Commentaire": f"Analyse par regex (fallback) - Erreur API: {str(e)}",
-                    "texte_fusionne": texte_ocr_combined,
-                    "ValidationRegex": {
-                        "total_coherent": regex_result.get("total_coherent", False),
-                        "somme_articles": regex_result.get("somme_articles", ""),
-                        "total_detecte": regex_result.get("total", "")
-                    }
-                }
+                return analyze_three_texts_with_regex(ocr_results, str(e))
             except Exception as regex_error:
                 return {
                     "Date": "",
@@ -568,6 +505,32 @@ Commence DIRECTEMENT par '{' et termine par '}'.
                     "texte_fusionne": "Erreur de traitement"
                 }
 
+def analyze_tickets_batch_with_llm(tickets):
+    """
+    Analyse groupée de plusieurs tickets {clé: ocr_results} pour les imports en masse (voir llm_batch.py) ;
+    les tickets absents ou invalides dans la réponse groupée sont réanalysés un par un
+    """
+    def finalize(result_data, ocr_results):
+        result_data = post_process_timbre_fiscal(result_data)
+        texte_ocr_combined = "\n".join(ocr_results.get(engine, "") for engine in ("docling", "tesseract", "doctr"))
+        return valider_et_corriger_avec_regex(result_data, texte_ocr_combined)
+
+    # Les tickets d'enseignes connues sont extraits par gabarit et ne partent pas dans les lots
+    results = {}
+    for key, ocr_results in tickets.items():
+        template_result = analyze_with_merchant_template(ocr_results)
+        if template_result is not None:
+            results[key] = template_result
+    remaining = {key: ocr_results for key, ocr_results in tickets.items() if key not in results}
+    if remaining:
+        results.update(analyze_tickets_batch(
+            remaining,
+            analyze_one=analyze_three_texts_with_llm,
+            finalize=finalize,
+            validate=is_valid_ticket_result,
+        ))
+    return {key: results[key] for key in tickets if key in results}
+
 def analyze_three_texts_with_gemini(ocr_results):
     """
     Analyse les 3 textes OCR avec Google Generative AI (Gemini)
@@ -633,8 +596,13 @@ def analyze_three_texts_with_gemini(ocr_results):
                 "demo_mode": True,
             }
 
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.5-flash')
+        # Modèle partagé : genai.configure n'est appelé qu'une fois par processus
+        model = get_gemini_model('gemini-2.5-flash')
+        if model is None:
+            return {
+                "error": "Clé API Google Generative AI manquante ou client indisponible. Mode démo activé.",
+                "demo_mode": True,
+            }
         
         # Fusionner les 3 textes OCR
         texte_fusionne = f"""
@@ -668,26 +636,29 @@ def analyze_three_texts_with_gemini(ocr_results):
         RÃˆGLES IMPORTANTES :
         - Utilise les 3 textes pour obtenir la meilleure prÃ©cision
         - Corrige les erreurs OCR courantes : Oâ†’0, Iâ†’1, etc.
-        - Si une information n'est pas trouvÃ©e, utilise null
+        - Si une information n'est pas trouvée, utilise null (liste vide [] pour Articles)
         - RÃ©ponds UNIQUEMENT avec le JSON, sans texte supplÃ©mentaire
         
         TEXTES OCR Ã€ ANALYSER :
-        {texte_fusionne}
+        {ocr_prompt_text(ocr_results, texte_fusionne, 'gemini')}
         """
         
         logger.info("Envoi de la requÃªte Ã  Google Generative AI...")
         
-        # GÃ©nÃ©rer la rÃ©ponse
-        response = model.generate_content(prompt)
-        raw_response = response.text
+        # GÃ©nÃ©rer la rÃ©ponse (ou la reprendre du cache LLM)
+        raw_response = get_cached_completion('gemini-2.5-flash', ocr_results)
+        if raw_response is None:
+            response = gemini_generate(model, prompt, **gemini_schema_options())
+            raw_response = response.text
         
         logger.info(f"RÃ©ponse brute reÃ§ue de Gemini: {raw_response[:200]}...")
         
         # Nettoyer et parser la rÃ©ponse JSON
-        result_data = clean_json_response(raw_response)
+        result_data = parse_ticket_json(raw_response)
         
         if result_data and isinstance(result_data, dict):
             logger.info("Analyse Gemini rÃ©ussie")
+            store_completion('gemini-2.5-flash', ocr_results, raw_response)
             
             # Ajouter des mÃ©tadonnÃ©es
             result_data['texte_fusionne'] = texte_fusionne
@@ -718,87 +689,16 @@ def extraire_elements_avec_regex(texte):
     """
     Extraction prÃ©cise d'Ã©lÃ©ments avec regex pour validation/correction des rÃ©sultats LLM
     """
-    if not texte or not isinstance(texte, str):
-        return {}
-    
-    # Regex pour dates (JJ/MM/AAAA ou JJ-MM-AAAA)
-    dates = re.findall(r'\b([0-3]?\d)[/-]([0-1]?\d)[/-](\d{4})\b', texte)
-    dates_valides = []
-    for d, m, y in dates:
-        try:
-            date_obj = datetime.strptime(f"{d}/{m}/{y}", "%d/%m/%Y")
-            dates_valides.append(date_obj.strftime("%d/%m/%Y"))
-        except:
-            pass
-    
-    # Regex pour prix au format comme 0.100 DT, 12.50 DT
-    prix_pattern = r'\b\d+\.\d{2,3}\s?DT\b'
-    prix_trouves = re.findall(prix_pattern, texte)
-    
-    # Convertir les prix en float pour calcul (supprimer " DT" et convertir)
-    def prix_to_float(p):
-        try:
-            return float(p.replace("DT", "").strip())
-        except Exception:
-            return 0.0
-    
-    prix_floats = [prix_to_float(p) for p in prix_trouves]
+    # Dates, prix, total et articles relevés en un seul passage (see ocrapp/receipt_tokenizer.py)
+    resultat = regex_elements(texte)
 
-    # Regex pour dÃ©tecter timbre fiscal (ex: 0.100 DT, 0.200 DT etc.)
-    timbres = [p for p in prix_trouves if p in ["0.100 DT", "0.200 DT", "0.300 DT", "0.400 DT", "0.500 DT"]]
-    timbres_float = [prix_to_float(t) for t in timbres]
-    
-    # Supposons que le total est indiquÃ© par une ligne avec "Total" + montant
-    total_match = re.search(r'(Total|TOTAL|total)\s*[:\-]?\s*(\d+\.\d{2,3})\s?DT', texte)
-    total = None
-    if total_match:
-        try:
-            total = float(total_match.group(2))
-        except Exception:
-            total = None
-    
-    # Extraire les articles, en filtrant les mots interdits (espÃ¨ce, rendu, reÃ§u, total, etc.)
-    # On suppose que chaque ligne contient nom article + prix (ex: Pain 1.200 DT)
-    mots_interdits = ['espece', 'rendu', 'recu', 'total', 'remise', 'timbre', 'fiscal', 'taxe', 'stamp','pece']
-    
-    articles = []
-    # Exemple simple : chercher toutes les lignes avec un prix, puis extraire le nom avant
-    lignes = texte.split('\n')
-    for ligne in lignes:
-        prix_match = re.search(prix_pattern, ligne)
-        if prix_match:
-            prix = prix_match.group()
-            # Extraire nom avant prix
-            nom = ligne[:prix_match.start()].strip().lower()
-            
-            # VÃ©rifier si un mot interdit est dans le nom
-            if any(mot in nom for mot in mots_interdits):
-                continue  # Ignore cette ligne, ce n'est pas un article
-            
-            # On suppose que le nom est le texte avant le prix
-            nom_article = ligne[:prix_match.start()].strip()
-            articles.append({"nom": nom_article, "prix": prix})
-
-    # VÃ©rification heuristique : somme des articles == total
-    somme_articles = sum([prix_to_float(a["prix"]) for a in articles])
-    total_correct = (total is not None and abs(somme_articles - total) < 0.01)  # marge d'erreur 1 centime
-    
-    resultat = {
-        "dates_valides": dates_valides,
-        "timbres_fiscaux": timbres,
-        "total": f"{total:.3f} DT" if total is not None else "",
-        "articles": articles,
-        "somme_articles": f"{somme_articles:.3f} DT",
-        "total_coherent": total_correct
-    }
-    
-    if not total_correct:
+    if resultat and not resultat["total_coherent"]:
         # Previously we exposed a user-facing alert when the sum of detected articles
         # didn't match the detected total. That banner has been removed from the UI
         # per request; keep the info only in logs for debugging if needed.
-        total_str = f"{total:.3f}" if total is not None else "0.000"
+        total_str = resultat["total"].replace(" DT", "") or "0.000"
         # logger.debug could be used; use print for parity with existing debug style
-        print(f"Validation mismatch: somme_articles={somme_articles:.3f} DT, total={total_str} DT")
+        print(f"Validation mismatch: somme_articles={resultat['somme_articles']}, total={total_str} DT")
     
     return resultat
 
@@ -816,9 +716,10 @@ def post_process_timbre_fiscal(result_data):
         if isinstance(article, dict):
             nom = article.get("nom", "").lower()
             prix = article.get("prix", "")
+            montant = parse_amount(prix)
             
             # DÃ©tecter le timbre fiscal par le montant (0.100 DT, 0.200 DT, etc.)
-            if prix in ["0.100 DT", "0.200 DT", "0.300 DT", "0.400 DT", "0.500 DT"]:
+            if montant in TIMBRES_FISCAUX:
                 # S'assurer que le nom est "TIMBRE FISCAL"
                 if "timbre" not in nom and "fiscal" not in nom:
                     article["nom"] = "TIMBRE FISCAL"
@@ -826,17 +727,15 @@ def post_process_timbre_fiscal(result_data):
                 break
             
             # DÃ©tecter par le nom aussi
-            if any(keyword in nom for keyword in ["timbre", "fiscal", "taxe", "stamp"]):
+            if is_timbre_article(article):
                 # S'assurer que le nom est "TIMBRE FISCAL"
                 article["nom"] = "TIMBRE FISCAL"
                 print(f"Nom de l'article timbre fiscal corrigÃ©: {article['nom']}")
-                break
-            
-            # Conversion des montants : 100 DT â†’ 0.100 DT pour les timbres fiscaux
-            if prix == "100 DT" and any(keyword in nom for keyword in ["timbre", "fiscal", "taxe", "stamp"]):
-                article["prix"] = "0.100 DT"
-                article["nom"] = "TIMBRE FISCAL"
-                print(f"Montant timbre fiscal converti: 100 DT â†’ 0.100 DT")
+                # Conversion des montants : 100 DT → 0.100 DT pour les timbres fiscaux
+                timbre = parse_timbre(prix)
+                if timbre is not None and timbre != montant:
+                    article["prix"] = format_amount(timbre)
+                    print(f"Montant timbre fiscal converti: {prix} → {article['prix']}")
                 break
     
     return result_data
@@ -889,143 +788,6 @@ def valider_et_corriger_avec_regex(result_data, texte_ocr):
     
     return result_data
 
-def extract_text_doctr(file_path):
-    try:
-        print(f"Doctr: Processing {file_path}")
-
-        # Vérifier que le fichier existe
-        if not file_path or not os.path.exists(file_path):
-            error_msg = f"Erreur Doctr: fichier introuvable: {file_path}"
-            print(error_msg)
-            return error_msg
-
-        ext = os.path.splitext(file_path)[1].lower()
-
-        images = []
-        # Si c'est un PDF, convertir en images (pages)
-        if ext == '.pdf':
-            try:
-                from pdf2image import convert_from_path
-            except Exception as e:
-                error_msg = f"Erreur Doctr: pdf2image non disponible pour convertir le PDF: {e}"
-                print(error_msg)
-                return error_msg
-
-            try:
-                images = convert_from_path(file_path)
-                if not images:
-                    raise ValueError('Aucune page convertie depuis le PDF')
-            except Exception as e:
-                error_msg = f"Erreur Doctr: impossible de convertir le PDF en images: {e}"
-                print(error_msg)
-                return error_msg
-
-        else:
-            # Traiter comme image (JPG, PNG, etc.)
-            try:
-                from PIL import Image
-            except Exception as e:
-                error_msg = f"Erreur Doctr: PIL non disponible pour ouvrir l'image: {e}"
-                print(error_msg)
-                return error_msg
-
-            try:
-                img = Image.open(file_path).convert('RGB')
-                images = [img]
-            except Exception as e:
-                error_msg = f"Erreur Doctr: impossible d'ouvrir l'image: {e}"
-                print(error_msg)
-                return error_msg
-
-        # Construire un DocumentFile à partir des images PIL
-        try:
-            doc = DocumentFile.from_images(images)
-        except Exception as e:
-            # Fallback: essayer de passer les chemins si la conversion échoue
-            try:
-                doc = DocumentFile.from_images([file_path])
-            except Exception as e2:
-                error_msg = f"Erreur Doctr: unable to build DocumentFile: {e}; fallback error: {e2}"
-                print(error_msg)
-                return error_msg
-
-        # Charger le modèle Doctr
-        model = ocr_predictor(pretrained=True)
-
-        # Faire la prédiction
-        result = model(doc)
-
-        # Extraire le texte brut
-        extracted_text = result.render()
-        print(f"Doctr: Extracted {len(extracted_text)} characters")
-        return extracted_text
-
-    except Exception as e:
-        error_msg = f"Erreur Doctr inattendue: {str(e)}"
-        print(error_msg)
-        return error_msg
-
-def extract_text_docling(file_path):
-    try:
-        print(f"Docling: Processing {file_path}")
-        converter = DocumentConverter()
-        path_obj = Path(file_path)
-        result = converter.convert(path_obj)
-        document = result.document
-
-        text_lines = {}
-        if hasattr(document, 'texts'):
-            for text_item in document.texts:
-                if hasattr(text_item, 'prov') and text_item.prov:
-                    y_pos = sum([prov.bbox.t for prov in text_item.prov]) / len(text_item.prov)
-                    text_lines[y_pos] = text_lines.get(y_pos, "") + " " + text_item.text
-
-        sorted_lines = sorted(text_lines.items(), key=lambda x: -x[0])
-        extracted_text = "\n".join([line[1].strip() for line in sorted_lines])
-        print(f"Docling: Extracted {len(extracted_text)} characters")
-        return extracted_text
-
-    except Exception as e:
-        error_msg = f"Erreur Docling: {str(e)}"
-        print(error_msg)
-        return error_msg
-
-def extract_text_tesseract(file_path):
-    try:
-        print(f"Tesseract: Processing {file_path}")
-        
-        # VÃ©rifier si Tesseract est disponible
-        try:
-            import pytesseract
-            # Test rapide pour vÃ©rifier si Tesseract est installÃ©
-            pytesseract.get_tesseract_version()
-        except Exception as tesseract_error:
-            error_msg = f"Tesseract non disponible: {str(tesseract_error)}\n\nPour installer Tesseract:\n1. TÃ©lÃ©chargez: https://github.com/UB-Mannheim/tesseract/wiki\n2. Installez dans C:\\Program Files\\Tesseract-OCR\\\n3. Ajoutez au PATH systÃ¨me"
-            print(error_msg)
-            return error_msg
-        
-        ext = os.path.splitext(file_path)[1].lower()
-        images = []
-        if ext == '.pdf':
-            try:
-                from pdf2image import convert_from_path
-                images = convert_from_path(file_path)
-            except ImportError:
-                return "Erreur: pdf2image non installÃ© pour traiter les PDF"
-        else:
-            images = [Image.open(file_path)]
-        
-        text = ""
-        for img in images:
-            text += pytesseract.image_to_string(img, lang='fra+eng') + "\n"
-        extracted_text = text.strip()
-        print(f"Tesseract: Extracted {len(extracted_text)} characters")
-        return extracted_text
-    except Exception as e:
-        error_msg = f"Erreur Tesseract: {str(e)}"
-        print(error_msg)
-        return error_msg
-
 def save_ticket_to_history(llm_analysis):
     """
     Sauvegarde un ticket analysÃ© dans l'historique
@@ -1042,11 +804,7 @@ def save_ticket_to_history(llm_analysis):
         articles = llm_analysis.get("Articles", [])
         
         # Nettoyer le total
-        try:
-            total_clean = total_str.replace(" DT", "").replace(",", ".")
-            total_decimal = Decimal(total_clean)
-        except:
-            total_decimal = Decimal('0.000')
+        total_decimal = parse_amount(total_str, ZERO)
         
         # Parser la date
         try:
@@ -1096,12 +854,8 @@ def generate_accounting_report(llm_analysis, compte="606100", description="Achat
     magasin = llm_analysis.get("Magasin", "Magasin inconnu")
     total = llm_analysis.get("Total", "0.000 DT")
     
-    # Nettoyer le total (enlever "DT" et convertir en float)
-    try:
-        total_clean = total.replace(" DT", "").replace(",", ".")
-        total_float = float(total_clean)
-    except:
-        total_float = 0.0
+    # Total en Decimal (12.500 DT, 12,500...)
+    total_amount = parse_amount(total, ZERO)
     
     # CrÃ©er le libellÃ© d'Ã©criture
     libelle_ecriture = f"Achat-{magasin}"
@@ -1112,7 +866,7 @@ def generate_accounting_report(llm_analysis, compte="606100", description="Achat
         "compte": compte,
         "description": description,
         "libelle_ecriture": libelle_ecriture,
-        "debit": f"{total_float:.3f}",
+        "debit": f"{total_amount:.3f}",
         "credit": "",
         "magasin": magasin,
         "total_original": total
@@ -1144,7 +898,7 @@ def generate_accounting_report(llm_analysis, compte="606100", description="Achat
                         compte=compte,
                         description=description,
                         libelle_ecriture=libelle_ecriture,
-                        debit=Decimal(f"{total_float:.3f}"),
+                        debit=total_amount.quantize(MILLIME),
                         credit=None
                     )
                     print(f"EntrÃ©e comptable crÃ©Ã©e: {accounting_entry}")
@@ -2008,10 +1762,7 @@ def download_accounting_excel(request):
                 try:
                     existing_ticket = TicketHistory.objects.get(id=int(ticket_id))
                     # Avoid duplicate accounting entries: check if a similar entry already exists
-                    try:
-                        debit_decimal = Decimal(str(report_data.get('debit') or 0))
-                    except Exception:
-                        debit_decimal = None
+                    debit_decimal = parse_amount(report_data.get('debit') or 0)
 
                     duplicate_qs = AccountingEntry.objects.filter(
                         ticket=existing_ticket,
@@ -2067,12 +1818,90 @@ def download_accounting_excel(request):
     
     return HttpResponse("MÃ©thode non autorisÃ©e", status=405)
 
+def ocr_text_is_complete(texte):
+    """
+    Validation de l'OCR adaptatif : une date, un total et une somme des articles cohérente
+    """
+    resultat = extraire_elements_avec_regex(texte)
+    return bool(resultat.get('dates_valides')) and bool(resultat.get('total')) and resultat.get('total_coherent') is True
+
+
+def get_or_run_ocr(extraction):
+    """
+    Retourne les textes OCR d'un upload : ceux déjà stockés sur l'ExtractionHistory,
+    complétés en lançant uniquement les moteurs nécessaires (puis stockés à leur tour).
+    En mode OCR_MODE='adaptive', l'escalade s'arrête au premier texte validé par regex.
+    """
+    stored = extraction.get_ocr_results()
+
+    if getattr(settings, 'OCR_MODE', 'all') == 'adaptive':
+        results, engines_used = run_ocr_adaptive(extraction.image.path, ocr_text_is_complete, known=stored)
+    else:
+        missing = [engine for engine in OCR_ENGINES if not stored.get(engine)]
+        if not missing:
+            print(f"OCR déjà disponible pour l'entrée {extraction.id}, moteurs non relancés")
+            return {engine: stored[engine] for engine in OCR_ENGINES}
+        results = run_ocr_engines(extraction.image.path, engines=missing)
+        engines_used = list(OCR_ENGINES)
+
+    print(f"Moteurs OCR utilisés pour l'entrée {extraction.id}: {engines_used}")
+    successes = {
+        engine: text for engine, text in results.items()
+        if isinstance(text, str) and text and not text.startswith(ERROR_PREFIXES)
+    }
+    stored.update(successes)
+    extraction.extracted_text = json.dumps(stored, ensure_ascii=False)
+    extraction.ocr_engines_used = engines_used
+    extraction.save(update_fields=['extracted_text', 'ocr_engines_used'])
+    return {engine: stored.get(engine) or results.get(engine, '') for engine in OCR_ENGINES}
+
+
+def ocr_texts_hash(ocr_results):
+    """
+    Empreinte des textes OCR analysés (normalisés comme pour le cache LLM)
+    """
+    payload = {engine: normalize_ocr_text(text) for engine, text in sorted((ocr_results or {}).items())}
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def get_or_run_analysis(extraction, key, analyze, ocr_results, use_cache=True):
+    """
+    Réutilise l'analyse déjà stockée pour cet upload ('llm', 'gemini') si elle a été calculée sur
+    ces mêmes textes OCR, sinon la calcule et la stocke avec l'empreinte des textes.
+    use_cache=False force un nouvel appel au modèle (ni analyse stockée, ni cache LLM).
+    """
+    ocr_hash = ocr_texts_hash(ocr_results)
+    analysis_data = (extraction.analysis_data or {}) if extraction is not None else {}
+    stored = analysis_data.get(key)
+    same_texts = (analysis_data.get('ocr_hashes') or {}).get(key) == ocr_hash
+    if use_cache and same_texts and isinstance(stored, dict) and stored and not stored.get('error'):
+        print(f"Analyse {key} réutilisée pour l'entrée {extraction.id}")
+        return stored
+
+    with llm_cache_bypass(not use_cache), collect_llm_calls(key) as calls:
+        result = analyze(ocr_results)
+    if extraction is not None:
+        save_llm_calls(extraction, calls, result)
+    if extraction is not None and isinstance(result, dict) and result and not result.get('error'):
+        analysis_data = dict(extraction.analysis_data or {})
+        # Passage par JSON pour ne stocker que des valeurs sérialisables
+        analysis_data[key] = json.loads(json.dumps(result, ensure_ascii=False, default=str))
+        analysis_data['ocr_hashes'] = {**(analysis_data.get('ocr_hashes') or {}), key: ocr_hash}
+        extraction.analysis_data = analysis_data
+        extraction.save(update_fields=['analysis_data'])
+    return result
+
+
 def upload_ticket(request):
     ocr_results = None
     llm_analysis = None
     gemini_analysis = None
     regex_analysis = None
     error = None
+    instance = None
+    # Upload auquel rattacher les analyses (stockage, réutilisation, coûts LLM)
+    analysis_instance = None
+    duplicate_detected = False
     form = TicketUploadForm()
     
     # Run system diagnostics on first load
@@ -2085,11 +1914,13 @@ def upload_ticket(request):
         # Debug: afficher les donnÃ©es POST
         print("POST data:", request.POST)
         logger.info("Processing OCR request")
+        # no_cache=1 : forcer une nouvelle analyse LLM au lieu des réponses déjà en cache
+        no_cache = request.POST.get('no_cache') == '1'
         
         # VÃ©rifier si on a des textes OCR dans les champs cachÃ©s
-        ocr_doctr = request.POST.get('ocr_doctr')
-        ocr_tesseract = request.POST.get('ocr_tesseract')
-        ocr_docling = request.POST.get('ocr_docling')
+        ocr_doctr = request.POST.get('ocr_doctr', '')
+        ocr_tesseract = request.POST.get('ocr_tesseract', '')
+        ocr_docling = request.POST.get('ocr_docling', '')
         
         print("OCR fields:", {
             'doctr': bool(ocr_doctr),
@@ -2097,7 +1928,8 @@ def upload_ticket(request):
             'docling': bool(ocr_docling)
         })
         
-        if ocr_doctr and ocr_tesseract and ocr_docling:
+        # En mode adaptatif, les moteurs non nécessaires ont un texte vide
+        if ocr_doctr or ocr_tesseract or ocr_docling:
             print("Using existing OCR texts")
             print(f"OCR data lengths: doctr={len(ocr_doctr)}, tesseract={len(ocr_tesseract)}, docling={len(ocr_docling)}")
             # Cas oÃ¹ on a dÃ©jÃ  les textes OCR et on veut analyser avec LLM
@@ -2114,10 +1946,13 @@ def upload_ticket(request):
                 if image_id:
                     from .models import ExtractionHistory
                     instance = ExtractionHistory.objects.get(id=image_id)
+                    analysis_instance = instance
                     form = TicketUploadForm(instance=instance)
                     print(f"Image rÃ©cupÃ©rÃ©e depuis la session: {instance.image.url}")
                 else:
                     # Fallback: rÃ©cupÃ©rer la derniÃ¨re image uploadÃ©e
+                    # (affichage seulement : elle peut venir d'un autre utilisateur, ses analyses
+                    # ne sont ni réutilisées ni modifiées)
                     from .models import ExtractionHistory
                     instance = ExtractionHistory.objects.latest('uploaded_at')
                     form = TicketUploadForm(instance=instance)
@@ -2132,12 +1967,12 @@ def upload_ticket(request):
             
             if analyze_with_gemini:
                 print("Starting Gemini analysis...")
-                gemini_analysis = analyze_three_texts_with_gemini(ocr_results)
+                gemini_analysis = get_or_run_analysis(analysis_instance, 'gemini', analyze_three_texts_with_gemini, ocr_results, use_cache=not no_cache)
                 print(f"Gemini analysis result: {type(gemini_analysis)}")
             else:
                 # Analyser avec le LLM par dÃ©faut
                 print("Starting LLM analysis...")
-                llm_analysis = analyze_three_texts_with_llm(ocr_results)
+                llm_analysis = get_or_run_analysis(analysis_instance, 'llm', analyze_three_texts_with_llm, ocr_results, use_cache=not no_cache)
                 print(f"LLM analysis result: {type(llm_analysis)}")
             
         else:
@@ -2146,7 +1981,9 @@ def upload_ticket(request):
             form = TicketUploadForm(request.POST, request.FILES)
             if form.is_valid():
                 instance = form.save()
-                image_path = instance.image.path
+                duplicate_detected = form.is_duplicate
+                if duplicate_detected:
+                    print(f"Doublon détecté: upload identique à l'entrée {instance.id}, résultats existants réutilisés")
                 
                 # Sauvegarder l'ID de l'image en session pour les analyses ultÃ©rieures
                 request.session['current_image_id'] = instance.id
@@ -2171,19 +2008,15 @@ def upload_ticket(request):
                 if analyze_all and analyze_all_models:
                     print("Complete analysis: OCR + Gemini + LLM (combined)")
                     # Lancer les 3 OCR
-                    ocr_results = {
-                        'tesseract': extract_text_tesseract(image_path),
-                        'doctr': extract_text_doctr(image_path),
-                        'docling': extract_text_docling(image_path),
-                    }
+                    ocr_results = get_or_run_ocr(instance)
                     # Puis analyser avec Gemini et LLM
                     if ocr_results:
-                        gemini_analysis = analyze_three_texts_with_gemini(ocr_results)
+                        gemini_analysis = get_or_run_analysis(instance, 'gemini', analyze_three_texts_with_gemini, ocr_results, use_cache=not no_cache)
                         try:
                             print(f"Gemini analysis produced: type={type(gemini_analysis)}, keys={list(gemini_analysis.keys()) if isinstance(gemini_analysis, dict) else 'N/A'}")
                         except Exception:
                             pass
-                        llm_analysis = analyze_three_texts_with_llm(ocr_results)
+                        llm_analysis = get_or_run_analysis(instance, 'llm', analyze_three_texts_with_llm, ocr_results, use_cache=not no_cache)
                         try:
                             print(f"LLM analysis produced: type={type(llm_analysis)}, keys={list(llm_analysis.keys()) if isinstance(llm_analysis, dict) else 'N/A'}")
                         except Exception:
@@ -2197,26 +2030,18 @@ def upload_ticket(request):
                 elif analyze_all and not analyze_with_llm and not analyze_with_gemini:
                     print("Extracting OCR texts only")
                     # Lancer les 3 OCR
-                    ocr_results = {
-                        'tesseract': extract_text_tesseract(image_path),
-                        'doctr': extract_text_doctr(image_path),
-                        'docling': extract_text_docling(image_path),
-                    }
+                    ocr_results = get_or_run_ocr(instance)
                 
                 # Si on clique sur "OCR + Analyse Qwen3-30B" (bouton vert)
                 # Ne lancer Qwen que si Gemini n'a pas été demandé (Gemini prend la priorité)
                 elif analyze_with_llm and analyze_all and not analyze_with_gemini and not analyze_all_models:
                     print("Extracting OCR and analyzing with LLM")
                     # Extraire les OCR puis analyser avec le LLM
-                    ocr_results = {
-                        'tesseract': extract_text_tesseract(image_path),
-                        'doctr': extract_text_doctr(image_path),
-                        'docling': extract_text_docling(image_path),
-                    }
+                    ocr_results = get_or_run_ocr(instance)
                     
                     # Puis analyser avec le LLM
                     if ocr_results:
-                        llm_analysis = analyze_three_texts_with_llm(ocr_results)
+                        llm_analysis = get_or_run_analysis(instance, 'llm', analyze_three_texts_with_llm, ocr_results, use_cache=not no_cache)
                         # Debug: log LLM analysis result shape for troubleshooting
                         try:
                             print(f"LLM analysis produced: type={type(llm_analysis)}, keys={list(llm_analysis.keys()) if isinstance(llm_analysis, dict) else 'N/A'}")
@@ -2229,15 +2054,11 @@ def upload_ticket(request):
                 elif analyze_with_gemini and analyze_all and not analyze_all_models:
                     print("Extracting OCR and analyzing with Gemini")
                     # Extraire les OCR puis analyser avec Gemini
-                    ocr_results = {
-                        'tesseract': extract_text_tesseract(image_path),
-                        'doctr': extract_text_doctr(image_path),
-                        'docling': extract_text_docling(image_path),
-                    }
+                    ocr_results = get_or_run_ocr(instance)
                     
                     # Puis analyser avec Gemini
                     if ocr_results:
-                        gemini_analysis = analyze_three_texts_with_gemini(ocr_results)
+                        gemini_analysis = get_or_run_analysis(instance, 'gemini', analyze_three_texts_with_gemini, ocr_results, use_cache=not no_cache)
                         # Debug: log Gemini analysis result shape for troubleshooting
                         try:
                             print(f"Gemini analysis produced: type={type(gemini_analysis)}, keys={list(gemini_analysis.keys()) if isinstance(gemini_analysis, dict) else 'N/A'}")
@@ -2252,11 +2073,7 @@ def upload_ticket(request):
                 elif analyze_with_regex and not analyze_all:
                     print("Extracting OCR and analyzing with Regex")
                     # Extraire les OCR puis analyser avec regex
-                    ocr_results = {
-                        'tesseract': extract_text_tesseract(image_path),
-                        'doctr': extract_text_doctr(image_path),
-                        'docling': extract_text_docling(image_path),
-                    }
+                    ocr_results = get_or_run_ocr(instance)
                     
                     # Puis analyser avec regex
                     if ocr_results:
@@ -2267,40 +2084,6 @@ def upload_ticket(request):
                 # Si on clique sur "Analyse ComplÃ¨te" (bouton info) - Qwen uniquement si Gemini non demandÃ©
                 elif analyze_all and analyze_with_llm and not analyze_with_gemini and not analyze_all_models:
                     print("Complete analysis: OCR + LLM")
-                # Si on clique sur "Analyser le ticket (OCR + Gemini + Qwen)"
-                elif analyze_all and analyze_all_models:
-                    print("Complete analysis: OCR + Gemini + LLM (combined)")
-                    # Lancer les 3 OCR
-                    ocr_results = {
-                        'tesseract': extract_text_tesseract(image_path),
-                        'doctr': extract_text_doctr(image_path),
-                        'docling': extract_text_docling(image_path),
-                    }
-                    # Puis analyser avec Gemini et LLM
-                    if ocr_results:
-                        gemini_analysis = analyze_three_texts_with_gemini(ocr_results)
-                        try:
-                            print(f"Gemini analysis produced: type={type(gemini_analysis)}, keys={list(gemini_analysis.keys()) if isinstance(gemini_analysis, dict) else 'N/A'}")
-                        except Exception:
-                            pass
-                        llm_analysis = analyze_three_texts_with_llm(ocr_results)
-                        try:
-                            print(f"LLM analysis produced: type={type(llm_analysis)}, keys={list(llm_analysis.keys()) if isinstance(llm_analysis, dict) else 'N/A'}")
-                        except Exception:
-                            pass
-                        # Ajouter aussi l'analyse regex pour comparaison
-                        texte_combine = f"{ocr_results['doctr']}\n{ocr_results['tesseract']}\n{ocr_results['docling']}"
-                        regex_analysis = extraire_elements_avec_regex(texte_combine)
-                    # Lancer les 3 OCR
-                    ocr_results = {
-                        'tesseract': extract_text_tesseract(image_path),
-                        'doctr': extract_text_doctr(image_path),
-                        'docling': extract_text_docling(image_path),
-                    }
-                    
-                    # Puis analyser avec le LLM
-                    if ocr_results:
-                        llm_analysis = analyze_three_texts_with_llm(ocr_results)
 
     # Convertir les donnÃ©es LLM en JSON pour le formulaire
     llm_analysis_json = None
@@ -2392,6 +2175,8 @@ def upload_ticket(request):
         'regex_analysis': regex_analysis,
         'llm_analysis_json': llm_analysis_json,
         'error': error,
+        'duplicate_detected': duplicate_detected,
+        'duplicate_of': instance if duplicate_detected else None,
         'accounting_analysis_choice': accounting_analysis_choice,
         'accounting_llm_data': accounting_llm_data,
     })
@@ -2508,7 +2293,6 @@ def filter_accounting_data(request):
 
 try:
     import google.generativeai as genai
-    genai.configure(api_key=os.environ.get("GOOGLE_API_KEY"))
 except Exception as _genai_import_err:
     genai = None
     logger.warning("Google Generative AI client not available - Gemini integration disabled: %s", _genai_import_err)
@@ -2557,8 +2341,14 @@ IMPORTANT : ne donne que ce JSON.
         }
 
     try:
-        model = genai.GenerativeModel("gemini-2.5-flash")  # Ou "gemini-2.5-flash" si dispo
-        response = model.generate_content(prompt)
+        model = get_gemini_model("gemini-2.5-flash")
+        if model is None:
+            return {
+                "verdict": "disabled",
+                "problemes_detectes": ["Gemini API key missing on server"],
+                "suggestions": []
+            }
+        response = gemini_generate(model, prompt)
         return clean_json_response(response.text)
     except Exception as e:
         logger.exception("Erreur avec Gemini: %s", e)
@@ -2624,7 +2414,9 @@ def update_ticket(request, ticket_id):
             if date_ticket:
                 ticket.date_ticket = datetime.strptime(date_ticket, '%Y-%m-%d').date()
             if total:
-                ticket.total = Decimal(total)
+                ticket.total = parse_amount(total)
+                if ticket.total is None:
+                    raise ValueError(f"Montant invalide: {total}")
             if articles_data:
                 import json
                 ticket.articles_data = json.loads(articles_data)
@@ -2680,46 +2472,20 @@ def save_ticket_analysis(request):
                     'error': 'Les champs magasin, date et total sont obligatoires'
                 })
 
-            # Fonction pour nettoyer les valeurs numÃšriques
-            def clean_numeric_value(value):
-                """Extrait la valeur numÃšrique d'une chaÃ¯ne en supprimant les unitÃšs et caractÃ¨res non numÃšriques"""
-                if not value or value == 'None':
-                    return '0'
-
-                import re
-                # Convertir en chaÃ¯ne et nettoyer
-                value_str = str(value).strip()
-
-                # Remplacer les virgules par des points
-                value_str = value_str.replace(',', '.')
-
-                # Extraire uniquement les chiffres, points et signes moins
-                numeric_match = re.search(r'[-]?\d*\.?\d+', value_str)
-                if numeric_match:
-                    return numeric_match.group(0)
-                else:
-                    return '0'
-
             # Nettoyage et validation des donnÃšes
             try:
-                # Nettoyage des chaÃ¯nes numÃšriques
-                total_str = clean_numeric_value(total_str)
-                tva_rate_str = clean_numeric_value(tva_rate_str)
-                tva_amount_str = clean_numeric_value(tva_amount_str)
-
                 # Validation et conversion de la date
                 date_ticket = datetime.strptime(date_str, '%Y-%m-%d').date()
 
-                # Validation et conversion des montants
-                if not total_str or total_str == 'None':
+                # Validation et conversion des montants (12,500 / 12.500 DT / 1 234,500 / 19 %)
+                total = parse_amount(total_str)
+                if total is None:
                     return JsonResponse({
                         'success': False,
                         'error': 'Le montant total est obligatoire'
                     })
-                
-                total = Decimal(total_str)
-                tva_rate = Decimal(tva_rate_str) if tva_rate_str and tva_rate_str != '0' else Decimal('0')
-                tva_amount = Decimal(tva_amount_str) if tva_amount_str and tva_amount_str != '0' else Decimal('0')
+                tva_rate = parse_amount(tva_rate_str, Decimal('0'))
+                tva_amount = parse_amount(tva_amount_str, Decimal('0'))
                 
                 # VÃ©rification des valeurs nÃgatives
                 if total < 0:
@@ -2757,8 +2523,13 @@ def save_ticket_analysis(request):
                 numero_ticket=numero_ticket or ''
             ).first()
             created = False
+            # Upload d'origine (session) : relie le ticket aux appels LLM de son extraction
+            extraction_id = request.session.get('current_image_id')
+            if extraction_id and not ExtractionHistory.objects.filter(id=extraction_id).exists():
+                extraction_id = None
             if not ticket:
                 ticket = TicketHistory.objects.create(
+                    extraction_id=extraction_id,
                     magasin=magasin,
                     date_ticket=date_ticket,
                     numero_ticket=numero_ticket or '',
@@ -2775,6 +2546,8 @@ def save_ticket_analysis(request):
                 ticket.articles_data = articles_data
                 ticket.tva_rate = tva_rate
                 ticket.tva_amount = tva_amount
+                if extraction_id:
+                    ticket.extraction_id = extraction_id
                 # Mettre à jour aussi l'analyse LLM persistée avec les valeurs de compte/description
                 try:
                     existing_llm = ticket.llm_analysis or {}
@@ -2830,3 +2603,87 @@ def save_ticket_analysis(request):
             })
     
     return JsonResponse({'success': False, 'error': 'MÃ©thode non autorisÃ©e'})
+
+def system_status(request):
+    """
+    État des backends (sondes en arrière-plan et disjoncteurs), des caches et des pools de connexions
+    """
+    if request.method != 'GET':
+        return JsonResponse({'success': False, 'error': 'Méthode non autorisée'})
+
+    backends = health_status()
+    return JsonResponse({
+        'success': True,
+        'backends': backends,
+        'issues': system_issues(),
+        'caches': {
+            'ocr': ocr_cache_stats(),
+            'llm': llm_cache_stats(),
+        },
+        'connections': llm_connection_stats(),
+    })
+
+def llm_usage_report(request):
+    """
+    Coût (tokens) et latence des appels LLM, agrégés par backend et modèle (?days=N pour limiter la période)
+    """
+    if request.method != 'GET':
+        return JsonResponse({'success': False, 'error': 'Méthode non autorisée'})
+
+    from django.db.models import Avg, Count, Max, Q, Sum
+    from django.utils import timezone
+    from datetime import timedelta
+    from .models import LLMCallRecord
+
+    calls = LLMCallRecord.objects.all()
+    try:
+        days = int(request.GET.get('days', 0))
+    except ValueError:
+        days = 0
+    if days > 0:
+        calls = calls.filter(created_at__gte=timezone.now() - timedelta(days=days))
+
+    by_model = calls.values('backend', 'model', 'outcome').annotate(
+        calls=Count('id'),
+        prompt_tokens=Sum('prompt_tokens'),
+        completion_tokens=Sum('completion_tokens'),
+        estimated_calls=Count('id', filter=Q(tokens_estimated=True)),
+        avg_duration_ms=Avg('duration_ms'),
+        max_duration_ms=Max('duration_ms'),
+        retries=Sum('retries'),
+    ).order_by('backend', 'model', 'outcome')
+
+    # Chemins de repli : dernier appel de chaque analyse (son fallback_path couvre toute l'analyse)
+    paths = {}
+    last_calls = calls.order_by('extraction_id', 'analysis', '-created_at', '-id').values(
+        'extraction_id', 'analysis', 'fallback_path', 'backend_used'
+    )
+    seen = set()
+    for call in last_calls:
+        analysis = (call['extraction_id'], call['analysis'])
+        if analysis in seen:
+            continue
+        seen.add(analysis)
+        path = ' -> '.join(call['fallback_path'] or [])
+        entry = paths.setdefault(path, {'path': path, 'analyses': 0, 'backend_used': {}})
+        entry['analyses'] += 1
+        backend_used = call['backend_used'] or 'inconnu'
+        entry['backend_used'][backend_used] = entry['backend_used'].get(backend_used, 0) + 1
+
+    recent = calls.order_by('-created_at')[:20].values(
+        'extraction_id', 'analysis', 'backend', 'model', 'prompt_tokens', 'completion_tokens',
+        'duration_ms', 'retries', 'outcome', 'error', 'created_at',
+    )
+    return JsonResponse({
+        'success': True,
+        'days': days or None,
+        'totals': calls.aggregate(
+            calls=Count('id'),
+            prompt_tokens=Sum('prompt_tokens'),
+            completion_tokens=Sum('completion_tokens'),
+            duration_ms=Sum('duration_ms'),
+        ),
+        'by_model': list(by_model),
+        'fallback_paths': sorted(paths.values(), key=lambda entry: -entry['analyses']),
+        'recent': list(recent),
+    })
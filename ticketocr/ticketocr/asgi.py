@@ -14,3 +14,11 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ticketocr.settings")
 
 application = get_asgi_application()
+
+# Précharger les modèles OCR pour que la première requête après déploiement ne soit pas la plus lente
+from ocrapp.health import start_health_monitor  # noqa: E402
+from ocrapp.ocr_pipeline import schedule_warmup  # noqa: E402
+
+schedule_warmup()
+# Sondes de santé des backends en arrière-plan (état lu par les vues et /system-status/)
+start_health_monitor()
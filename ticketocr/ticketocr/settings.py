@@ -134,3 +134,105 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 # Google API Key for Gemini
 GOOGLE_API_KEY = os.environ.get('GOOGLE_API_KEY', '')
+
+# OCR models (loaded once per worker process, see ocrapp/ocr_models.py)
+DOCTR_DET_ARCH = os.environ.get('DOCTR_DET_ARCH', 'db_resnet50')
+DOCTR_RECO_ARCH = os.environ.get('DOCTR_RECO_ARCH', 'crnn_vgg16_bn')
+OCR_WARMUP_ON_STARTUP = os.environ.get('OCR_WARMUP_ON_STARTUP', 'True') == 'True'
+# 'receipt' = OCR + texte uniquement (sans modèle de structure de tableaux), 'default' = pipeline Docling complet
+DOCLING_PIPELINE_PROFILE = os.environ.get('DOCLING_PIPELINE_PROFILE', 'receipt')
+
+# OCR fan-out (see ocrapp/ocr_pipeline.py): 'process', 'thread' or 'serial'
+OCR_EXECUTOR = os.environ.get('OCR_EXECUTOR', 'process')
+OCR_POOL_WORKERS_PER_ENGINE = int(os.environ.get('OCR_POOL_WORKERS_PER_ENGINE', '1'))
+OCR_POOL_START_METHOD = 'spawn'
+# Délais maximum par moteur (secondes) ; au-delà le worker est annulé
+OCR_ENGINE_TIMEOUTS = {
+    'tesseract': 60,
+    'doctr': 120,
+    'docling': 180,
+}
+
+# Rastérisation unique des PDF partagée par les moteurs OCR (see ocrapp/page_source.py)
+OCR_PDF_DPI = int(os.environ.get('OCR_PDF_DPI', '200'))
+# Cache disque des pages rastérisées (None pour désactiver)
+OCR_PAGE_CACHE_DIR = os.environ.get('OCR_PAGE_CACHE_DIR') or None
+
+# Inférence Doctr par lots (see ocrapp/doctr_batcher.py). Les tickets ne sont regroupés qu'au sein d'un
+# processus : bulk_ocr et OCR_EXECUTOR 'thread' ou 'serial' ; sans effet entre uploads avec 'process'
+DOCTR_BATCHING_ENABLED = os.environ.get('DOCTR_BATCHING_ENABLED', 'False') == 'True'
+DOCTR_BATCH_MAX_SIZE = int(os.environ.get('DOCTR_BATCH_MAX_SIZE', '8'))
+DOCTR_BATCH_MAX_WAIT_MS = int(os.environ.get('DOCTR_BATCH_MAX_WAIT_MS', '50'))
+
+# Tesseract en processus via tesserocr si disponible, sinon pytesseract (see ocrapp/ocr_models.py)
+TESSERACT_LANG = os.environ.get('TESSERACT_LANG', 'fra+eng')
+TESSDATA_PREFIX = os.environ.get('TESSDATA_PREFIX') or None
+
+# Prétraitement des images avant OCR, partagé par les trois moteurs (see ocrapp/preprocessing.py)
+OCR_PREPROCESSING_ENABLED = os.environ.get('OCR_PREPROCESSING_ENABLED', 'True') == 'True'
+# Étapes appliquées dans l'ordre : 'exif', 'downscale', 'grayscale', 'crop', 'deskew'
+OCR_PREPROCESSING_STEPS = ['exif', 'downscale', 'grayscale', 'crop', 'deskew']
+OCR_MAX_IMAGE_SIDE = int(os.environ.get('OCR_MAX_IMAGE_SIDE', '2000'))
+
+# Cache des résultats OCR par hash du fichier + moteur + version (see ocrapp/ocr_cache.py)
+OCR_CACHE_ENABLED = os.environ.get('OCR_CACHE_ENABLED', 'True') == 'True'
+OCR_CACHE_PATH = os.environ.get('OCR_CACHE_PATH') or BASE_DIR / 'ocr_cache.sqlite3'
+OCR_CACHE_MAX_ENTRIES = int(os.environ.get('OCR_CACHE_MAX_ENTRIES', '5000'))
+
+# 'all' = les trois moteurs OCR, 'adaptive' = escalade jusqu'au premier texte validé par regex
+OCR_MODE = os.environ.get('OCR_MODE', 'all')
+OCR_ADAPTIVE_ORDER = ['tesseract', 'doctr', 'docling']
+
+# Cache des réponses LLM par textes OCR normalisés + modèle + version du prompt (see ocrapp/llm_cache.py)
+LLM_CACHE_ENABLED = os.environ.get('LLM_CACHE_ENABLED', 'True') == 'True'
+LLM_CACHE_PATH = os.environ.get('LLM_CACHE_PATH') or BASE_DIR / 'llm_cache.sqlite3'
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get('LLM_CACHE_MAX_ENTRIES', '2000'))
+LLM_CACHE_TTL = int(os.environ.get('LLM_CACHE_TTL', str(7 * 24 * 3600)))  # secondes
+
+# Clients LLM partagés avec pool de connexions keep-alive (see ocrapp/llm_clients.py)
+OLLAMA_URL = os.environ.get('OLLAMA_URL', 'http://localhost:11434')
+HF_BASE_URL = os.environ.get('HF_BASE_URL', 'https://router.huggingface.co/v1')
+LLM_POOL_CONNECTIONS = int(os.environ.get('LLM_POOL_CONNECTIONS', '4'))
+LLM_POOL_MAXSIZE = int(os.environ.get('LLM_POOL_MAXSIZE', '10'))
+# Délais par backend (secondes)
+LLM_TIMEOUTS = {
+    'qwen': 30,
+    'mistral': 30,
+    'llama2': 15,
+    'gemini': 60,
+    'ollama_tags': 5,
+}
+
+# Requêtes LLM couvertes : backend suivant lancé après LLM_HEDGE_DELAY_S sans réponse,
+# la première réponse JSON valide l'emporte (see ocrapp/llm_hedge.py)
+LLM_HEDGING_ENABLED = os.environ.get('LLM_HEDGING_ENABLED', 'False') == 'True'
+LLM_HEDGE_DELAY_S = float(os.environ.get('LLM_HEDGE_DELAY_S', '3.0'))
+LLM_HEDGE_TIMEOUT_S = float(os.environ.get('LLM_HEDGE_TIMEOUT_S', '45.0'))
+LLM_HEDGE_ORDER = ['qwen', 'mistral', 'llama2']
+
+# Génération LLM streamée, arrêtée dès que l'objet JSON du ticket est fermé (see ocrapp/json_stream.py)
+LLM_STREAM_JSON = os.environ.get('LLM_STREAM_JSON', 'True') == 'True'
+
+# Sortie structurée : schéma du ticket passé à Ollama (format), HuggingFace (response_format)
+# et Gemini (response_schema) (see ocrapp/ticket_schema.py)
+LLM_STRUCTURED_OUTPUT = os.environ.get('LLM_STRUCTURED_OUTPUT', 'True') == 'True'
+
+# Texte OCR envoyé aux LLM : 'raw' = les trois sorties brutes, 'consensus' = texte fusionné
+# ligne à ligne avec vote entre moteurs (see ocrapp/ocr_consensus.py)
+LLM_PROMPT_OCR_MODE = os.environ.get('LLM_PROMPT_OCR_MODE', 'raw')
+
+# Registre de santé des backends et disjoncteurs (see ocrapp/health.py)
+HEALTH_CHECK_INTERVAL_S = int(os.environ.get('HEALTH_CHECK_INTERVAL_S', '60'))  # 0 = pas de sondes en arrière-plan
+HEALTH_BREAKER_THRESHOLD = int(os.environ.get('HEALTH_BREAKER_THRESHOLD', '3'))
+HEALTH_BREAKER_COOLDOWN_S = float(os.environ.get('HEALTH_BREAKER_COOLDOWN_S', '60'))
+
+# Analyse LLM groupée de plusieurs tickets par requête pour les imports en masse (see ocrapp/llm_batch.py)
+LLM_BATCH_BACKEND = os.environ.get('LLM_BATCH_BACKEND', 'mistral')  # 'mistral', 'llama2' ou 'qwen'
+LLM_BATCH_TOKEN_BUDGET = int(os.environ.get('LLM_BATCH_TOKEN_BUDGET', '6000'))
+LLM_BATCH_MAX_TICKETS = int(os.environ.get('LLM_BATCH_MAX_TICKETS', '10'))
+LLM_BATCH_OUTPUT_TOKENS = int(os.environ.get('LLM_BATCH_OUTPUT_TOKENS', '250'))  # réponse attendue par ticket
+
+# Gabarits par enseigne : tickets des enseignes connues extraits sans LLM (see ocrapp/merchant_templates.py)
+MERCHANT_TEMPLATES_ENABLED = os.environ.get('MERCHANT_TEMPLATES_ENABLED', 'True') == 'True'
+# Gabarits locaux (<nom>.json), prioritaires sur les gabarits fournis de même nom
+MERCHANT_TEMPLATES_DIR = os.environ.get('MERCHANT_TEMPLATES_DIR') or BASE_DIR / 'merchant_templates'